@@ -1,4 +1,19 @@
-from riamumail.app import main
+import sys
+
+from riamumail import profiling
+from riamumail.cli import COMMANDS
 
 if __name__ == "__main__":
+    if profiling.requested():
+        if profiling.PROFILE_FLAG in sys.argv:
+            sys.argv.remove(profiling.PROFILE_FLAG)
+        profiling.start()
+
+    if len(sys.argv) > 1 and sys.argv[1] in COMMANDS:
+        from riamumail.cli import main
+
+        sys.exit(main())
+
+    from riamumail.app import main
+
     main().main_loop()
@@ -0,0 +1,379 @@
+import os
+import json
+import time
+import uuid
+import random
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from riamumail import metrics
+
+log = logging.getLogger("riamumail.api")
+
+API_BASE = "https://riamu.email/api"
+
+TIMEOUT = 10
+RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 8
+
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT = 30
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Background replay of the outbox, backing off while the API is down
+REPLAY_INTERVAL = 60
+REPLAY_MAX = 60 * 60
+# An operation failing this many times is given up on
+MAX_ATTEMPTS = 50
+
+
+class APIError(Exception):
+    """A riamu API call failed."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def permanent(self):
+        """4xx answers (other than 429) won't succeed by trying again."""
+        return (
+            self.status is not None and 400 <= self.status < 500 and self.status != 429
+        )
+
+
+class CircuitOpenError(APIError):
+    """The API failed repeatedly and calls are being rejected without trying."""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures. While open every
+    call fails fast; after `reset_timeout` one trial call is let through
+    and its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(
+        self,
+        failure_threshold=FAILURE_THRESHOLD,
+        reset_timeout=RESET_TIMEOUT,
+        clock=time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self.trial:
+                self.trial = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    log.warning("API circuit opened")
+                self.opened_at = self.clock()
+            self.trial = False
+
+
+class Outbox:
+    """
+    Reserve/release operations persisted to disk. Only the latest intent
+    per domain is kept, so operations for different domains are
+    independent and can be delivered in any order. Undelivered operations
+    survive restarts and are replayed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.ops = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+        except Exception:
+            log.exception("Failed to load API outbox")
+            return []
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.ops, f)
+        os.replace(tmp, self.path)
+
+    def add(self, op, payload):
+        """Queue `op`, replacing what is still pending for the same domain."""
+        with self.lock:
+            domain = payload.get("domain")
+            for entry in self.ops:
+                # Retried callers (e.g. dynamic DNS) must not pile up duplicates
+                if entry["op"] == op and entry["payload"] == payload:
+                    return entry["id"]
+            self.ops = [o for o in self.ops if o["payload"].get("domain") != domain]
+            entry = {
+                "id": uuid.uuid4().hex,
+                "op": op,
+                "payload": payload,
+                "created": time.time(),
+            }
+            self.ops.append(entry)
+            self.save()
+            return entry["id"]
+
+    def pending(self):
+        with self.lock:
+            return list(self.ops)
+
+    def remove(self, op_id):
+        with self.lock:
+            self.ops = [o for o in self.ops if o["id"] != op_id]
+            self.save()
+
+    def failed(self, op_id):
+        """Count a failed delivery of `op_id`; returns its failures so far."""
+        with self.lock:
+            for entry in self.ops:
+                if entry["id"] == op_id:
+                    entry["attempts"] = entry.get("attempts", 0) + 1
+                    self.save()
+                    return entry["attempts"]
+            return 0
+
+
+class RiamuAPI:
+    """
+    Client for API_BASE sharing one keep-alive connection pool. Idempotent
+    calls are retried with jittered exponential backoff, every call goes
+    through a circuit breaker, and domain reserve/release go through the
+    persistent outbox, which `start()` replays in the background.
+    """
+
+    def __init__(
+        self,
+        outbox_file,
+        base=API_BASE,
+        session=None,
+        breaker=None,
+        retries=RETRIES,
+        backoff_base=BACKOFF_BASE,
+        backoff_max=BACKOFF_MAX,
+        sleep=time.sleep,
+        replay_interval=REPLAY_INTERVAL,
+        replay_max=REPLAY_MAX,
+    ):
+        self.base = base.rstrip("/")
+        self.session = session or self.make_session()
+        self.breaker = breaker or CircuitBreaker()
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.outbox = Outbox(outbox_file)
+        self.flush_lock = threading.Lock()
+        self.replay_interval = replay_interval
+        self.replay_max = replay_max
+        self.running = False
+        self.cond = threading.Condition()
+        self.thread = None
+        self.listeners = []
+
+    @staticmethod
+    def make_session():
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    # ---------- transport ----------
+
+    def request(self, method, path, idempotent=False, **kwargs):
+        kwargs.setdefault("timeout", TIMEOUT)
+        attempts = 1 + (self.retries if idempotent else 0)
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"{method} {path}: API unavailable (circuit open)"
+                )
+
+            try:
+                with metrics.API_DURATION.time(method=method, path=path):
+                    r = self.session.request(method, self.base + path, **kwargs)
+                if r.status_code >= 400:
+                    raise APIError(
+                        f"{method} {path}: HTTP {r.status_code}", r.status_code
+                    )
+                self.breaker.record_success()
+                return r.json() if r.content else {}
+
+            except (requests.RequestException, APIError, ValueError) as e:
+                error = (
+                    e if isinstance(e, APIError) else APIError(f"{method} {path}: {e}")
+                )
+                metrics.API_ERRORS.inc(
+                    method=method, path=path, status=error.status or ""
+                )
+                if error.permanent:
+                    # The API answered; it is up
+                    self.breaker.record_success()
+                    raise error
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise error
+                if error.status is not None and error.status not in RETRY_STATUS:
+                    raise error
+
+                delay = random.uniform(
+                    0, min(self.backoff_max, self.backoff_base * 2**attempt)
+                )
+                log.info(f"{error}; retrying in {delay:.1f}s")
+                self.sleep(delay)
+
+    # ---------- endpoints ----------
+
+    def check_domain(self, domain):
+        data = self.request(
+            "GET", "/domain/check", idempotent=True, params={"domain": domain}
+        )
+        return data.get("available")
+
+    def reserve_domain(self, domain, ip):
+        """Queue a reservation and deliver the outbox. True once this one went through."""
+        op_id = self.outbox.add("reserve", {"domain": domain, "ipAddress": ip})
+        return self.flush(until=op_id)
+
+    def release_domain(self, domain):
+        op_id = self.outbox.add("release", {"domain": domain})
+        return self.flush(until=op_id)
+
+    def queued(self, domain):
+        """True if an operation for `domain` is waiting in the outbox."""
+        return any(o["payload"].get("domain") == domain for o in self.outbox.pending())
+
+    def on_result(self, fn):
+        """
+        Call `fn(op, payload, delivered)` when an outbox operation is
+        delivered or dropped by a later flush, e.g. a background replay. The
+        call that queued it learns its first outcome from the return value.
+        """
+        self.listeners.append(fn)
+
+    def notify(self, entry, delivered, until=None):
+        if entry["id"] == until:
+            return
+        for fn in list(self.listeners):
+            try:
+                fn(entry["op"], entry["payload"], delivered)
+            except Exception:
+                log.exception("Outbox listener failed")
+
+    def flush(self, until=None):
+        """
+        Try every pending outbox operation once. One that keeps failing
+        is retried on the next flush without holding up the others, and
+        dropped after MAX_ATTEMPTS. Returns True if `until` (or
+        everything) was delivered.
+        """
+        delivered = set()
+        with self.flush_lock:
+            for entry in self.outbox.pending():
+                name = f"{entry['op']} {entry['payload'].get('domain')}"
+                try:
+                    self.request(
+                        "POST", f"/domain/{entry['op']}", json=entry["payload"]
+                    )
+                except CircuitOpenError as e:
+                    log.warning(f"Outbox {name} not sent, will replay: {e}")
+                    break
+                except APIError as e:
+                    if e.permanent:
+                        log.error(f"Outbox {name} rejected, dropping: {e}")
+                        self.outbox.remove(entry["id"])
+                        self.notify(entry, False, until)
+                    elif self.outbox.failed(entry["id"]) >= MAX_ATTEMPTS:
+                        log.error(
+                            f"Outbox {name} failed {MAX_ATTEMPTS} times, dropping"
+                        )
+                        self.outbox.remove(entry["id"])
+                        self.notify(entry, False, until)
+                    else:
+                        log.warning(f"Outbox {name} failed, will replay: {e}")
+                    continue
+
+                log.info(f"Delivered {name}")
+                self.outbox.remove(entry["id"])
+                delivered.add(entry["id"])
+                self.notify(entry, True, until)
+            if until is not None:
+                return until in delivered
+            return not self.outbox.pending()
+
+    # ---------- background replay ----------
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name="riamumail-outbox", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _run(self):
+        delay = self.replay_interval
+        while self.running:
+            if self.outbox.pending():
+                try:
+                    done = self.flush()
+                except Exception:
+                    log.exception("Outbox replay failed")
+                    done = False
+                delay = (
+                    self.replay_interval if done else min(self.replay_max, delay * 2)
+                )
+            else:
+                delay = self.replay_interval
+            with self.cond:
+                if self.running:
+                    self.cond.wait(delay)
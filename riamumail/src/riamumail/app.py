@@ -5,38 +5,111 @@ import re
 import os
 import sys
 import json
+import time
 import shutil
 import logging
-import tempfile
 import traceback
 import threading
 import socket
 import requests
 import subprocess
 import webbrowser
+import concurrent.futures
 from pathlib import Path
 
-CONFIG_PATH = Path.home() / ".riamumail"
-CONFIG_FILE = CONFIG_PATH / "config.json"
-LOG_FILE = CONFIG_PATH / "app.log"
+from riamumail import logs, config as riamu_config
+from riamumail.config import CONFIG_PATH, LOG_FILE, DOCKER_CONTAINER
+from riamumail.health import HealthMonitor, port_ready
+from riamumail.publicip import PublicIPResolver, parse_ip
+from riamumail.ddns import DynamicDNSUpdater
+from riamumail.api import RiamuAPI
+from riamumail.loadtest import LoadTest, format_report
+from riamumail import tuning
+from riamumail.maildir import ContainerMaildir, DoveadmMailbox
+from riamumail.backup import ChunkStore, backup, restore
+from riamumail.importer import import_mail, percent_read
+from riamumail import maillog
+from riamumail.checklist import Checklist
+from riamumail import tasks
+from riamumail import instances
+from riamumail.stats import StatsCollector
+from riamumail import canary
+from riamumail import journal
+from riamumail.propagation import PropagationTracker
+from riamumail import metrics
+from riamumail import storage
+from riamumail import outbound
+from riamumail import delivery
+from riamumail.logview import LEVELS, LogView, next_command_id
+from riamumail import search
+
+OUTBOX_FILE = CONFIG_PATH / "outbox.json"
+# Host-wide steps (clone, base image, downloads); instance steps live
+# in each instance's steps.json
+JOURNAL_FILE = CONFIG_PATH / "journal.json"
+DOWNLOAD_PATH = CONFIG_PATH / "downloads"
+
+# Speculative, user-independent setup started when the checks pass
+PREPARE_KIND = "prepare"
+
+# Checklist rows about this host rather than the selected instance
+HOST_CHECKS = {
+    "Git",
+    "Docker Desktop",
+    "Thunderbird",
+    "Cloning mail server repository",
+    "Building base image",
+}
+
+# Per instance: at most one docker mutation or Maildir transfer at a time
+TASK_LIMITS = {
+    "docker": 1,
+    "install": 1,
+    "mailbox": 1,
+    PREPARE_KIND: 1,
+    "checks": 1,
+    "domain-check": 1,
+}
 
 MAIL_EXP_REPO = "https://github.com/umrashrf/mailexp.git"
 MAIL_EXP_PATH = CONFIG_PATH / "mailexp"
+BASE_BUILD_PATH = CONFIG_PATH / "base-build"
+BASE_DOCKERFILE = """
+FROM alpine:latest
+
+RUN apk update
+RUN apk add busybox-extras vim
+RUN apk add postfix dovecot mailutils
+RUN apk add unbound ca-certificates
+RUN apk add dovecot-lmtpd
 
-DOCKER_IMAGE = "mailexp:latest"
-DOCKER_CONTAINER = "mailexp"
+RUN awk '{gsub(/smtp\\t+25/, "smtp\\t\\t36245"); print}' /etc/services > /tmp/services
+RUN cp /tmp/services /etc/ && rm /tmp/services
+"""
 
 API_BASE = "https://riamu.email/api"
+# Seconds a stopped mail server gets to start before its mail is backed up
+BACKUP_START_WAIT = 60
+
+
+SUBPROCESS_LOG = logging.getLogger("riamumail.subprocess")
 
 
-def setup_logging():
+def low_priority(cmd):
+    """`cmd` run under nice (and ionice on Linux) where they exist."""
+    path = riamu_config.SUBPROCESS_ENV.get("PATH")
+    prefix = []
+    if shutil.which("nice", path=path):
+        prefix += ["nice", "-n", "19"]
+    if sys.platform.startswith("linux") and shutil.which("ionice", path=path):
+        prefix += ["ionice", "-c", "3"]
+    return prefix + list(cmd)
+
+
+def setup_logging(levels=None):
     try:
         CONFIG_PATH.mkdir(parents=True, exist_ok=True)
-        logging.basicConfig(
-            filename=LOG_FILE,
-            level=logging.INFO,
-            format="%(asctime)s [%(levelname)s] %(message)s",
-        )
+        logs.configure(LOG_FILE, level=logging.INFO, levels=levels)
         logging.info("Application started")
     except Exception:
         # Absolute last-resort fallback
@@ -46,16 +119,17 @@ def setup_logging():
 class SetupApp(toga.App):
 
     def startup(self):
-        setup_logging()
+        self.instance = instances.current()
+        setup_logging(self.load_config().get("log_levels"))
         logging.info("Startup called")
 
         self.check_run_id = 0
+        self.journal = journal.Journal(JOURNAL_FILE)
+        self.journals = {}
+        self.tasks = tasks.TaskExecutor(limits=TASK_LIMITS)
+        metrics.REGISTRY.collector(self.collect_task_metrics)
         self.check_labels = {}
-
-        self.spinner_frames = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
-        self.spinner_index = 0
-        self.spinner_running = False
-        self.spinning_labels = set()
+        self.checklist = Checklist(self.app.loop, self.render_check)
 
         self.main_window = toga.MainWindow(title=self.formal_name, size=(800, 800))
 
@@ -63,13 +137,184 @@ class SetupApp(toga.App):
         self.domain_ok = False
         self.port_ok = False
 
-        if CONFIG_FILE.exists():
+        self.health = None
+        self.canary_history = canary.LatencyHistory()
+        self.canary_handle = None
+        self.canary_task = None
+        self.propagation = None
+        self.diagnostics_window = None
+        self.search_window = None
+        self.search_update_handle = None
+        self.indexed_deliveries = 0
+        self.preparation = None
+
+        CONFIG_PATH.mkdir(parents=True, exist_ok=True)
+        self.api = RiamuAPI(OUTBOX_FILE, base=API_BASE)
+        # Replays reserve/release calls that failed, including last time
+        self.api.start()
+        self.public_ip = PublicIPResolver(self.load_config().get("ip_providers"))
+
+        # One updater per instance; every reserved domain follows the IP
+        self.ddns = {}
+        for instance in instances.list_instances():
+            updater = self.ddns_for(instance)
+            domain = instance.load_config().get("domain")
+            if domain and not updater.domain:
+                # Reserved before ddns.json existed
+                updater.adopt(domain)
+            if updater.domain:
+                updater.start()
+        self.public_ip.on_change(self.on_public_ip_change)
+        self.api.on_result(self.on_outbox_result)
+        for instance in instances.pending_reservations():
+            self.tasks.submit(
+                f"reserve-{instance.slug}", self.reserve_pending_domain, instance
+            )
+
+        self.mail_log = self.make_mail_log()
+        self.stats = self.make_stats()
+        self.metrics_server = self.make_metrics_server()
+
+        if self.instance.exists():
             self.show_setup_screen()
         else:
             self.show_welcome_screen()
 
         self.main_window.show()
 
+    def on_exit(self):
+        logging.info(f"Exiting with tasks: {self.tasks.counts()}")
+        self.tasks.shutdown()
+        self.api.stop()
+        self.mail_log.stop()
+        self.stats.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        return True
+
+    # ------------------ INSTANCES ------------------
+
+    def ddns_for(self, instance):
+        if instance.slug not in self.ddns:
+            self.ddns[instance.slug] = DynamicDNSUpdater(
+                lambda domain, ip: self.update_domain_ip(domain, ip, instance),
+                instance.state_path("ddns.json"),
+                poll=self.public_ip.get,
+            )
+        return self.ddns[instance.slug]
+
+    def on_public_ip_change(self, old, new):
+        # The first lookup after startup is not a change
+        if old is not None and old != new:
+            metrics.PUBLIC_IP_CHANGES.inc()
+        for updater in list(self.ddns.values()):
+            updater.observe(new)
+
+    def on_outbox_result(self, op, payload, delivered):
+        # Updates queued by the DDNS updaters are retried by the outbox;
+        # report how they ended so the updaters don't retry them as well
+        if op != "reserve":
+            return
+        for updater in list(self.ddns.values()):
+            if delivered:
+                updater.delivered(payload["domain"], payload["ipAddress"])
+            else:
+                updater.dropped(payload["domain"], payload["ipAddress"])
+
+    def make_mail_log(self):
+        return maillog.MailLogFollower(
+            self.instance.container,
+            self.instance.state_path("maillog.json"),
+            env=self.SUBPROCESS_ENV,
+            on_update=lambda summary: self.ui(self.on_mail_log_update, summary),
+        )
+
+    def make_stats(self):
+        return StatsCollector(
+            self.instance.container,
+            on_update=lambda collector: self.ui(
+                self.on_stats_update, collector.summary(), collector.alerts()
+            ),
+            env=self.SUBPROCESS_ENV,
+        )
+
+    def make_metrics_server(self):
+        """Opt-in Prometheus endpoint, enabled by "metrics_port" in the config."""
+        port = self.load_config().get("metrics_port")
+        if not port:
+            return None
+        try:
+            server = metrics.MetricsServer(int(port))
+            server.start()
+            return server
+        except OSError:
+            logging.exception(f"Could not serve metrics on port {port}")
+            return None
+
+    def docker_kind(self, instance=None):
+        """Task kind that serializes docker work per instance."""
+        return f"docker:{(instance or self.instance).slug}"
+
+    def instance_items(self):
+        return [instance.label for instance in instances.list_instances()] or [
+            self.instance.label
+        ]
+
+    def on_instance_change(self, widget):
+        for instance in instances.list_instances():
+            if instance.label == widget.value and instance != self.instance:
+                self.switch_instance(instance)
+                return
+
+    def switch_instance(self, instance):
+        logging.info(f"Switching to instance {instance.slug}")
+        self.instance = instance
+        instances.set_current(instance)
+
+        self.mail_log.stop()
+        self.mail_log = self.make_mail_log()
+        self.stats.stop()
+        self.stats = self.make_stats()
+        self.resources_label.text = ""
+        self.cancel_canary()
+        self.canary_history = canary.LatencyHistory()
+        self.stop_propagation()
+        # Rows about the previous instance (ports, its containers...) go;
+        # the next health probe reports everything afresh
+        for label in list(self.checklist.rows):
+            if label not in HOST_CHECKS:
+                self.checklist.remove(label)
+        if self.health is not None:
+            self.health.last = {}
+        self.fill_form()
+        self.start_checks()
+
+    def add_instance(self, widget):
+        domain = self.domain_input.value
+        settings = {
+            "username": self.firstname_input.value,
+            "familyname": self.familyname_input.value,
+            "password": self.password_input.value,
+            "tuning_preset": self.tuning_select.value or tuning.AUTO,
+            "mail_format": self.format_select.value or storage.DEFAULT_FORMAT,
+            "mail_compression": self.compression_select.value
+            or storage.DEFAULT_COMPRESSION,
+        }
+        try:
+            instance = instances.create_instance(domain, settings)
+        except ValueError as e:
+            self.main_window.error_dialog("Cannot add domain", str(e))
+            return
+
+        self.instance_select.items = self.instance_items()
+        self.instance_select.value = instance.label
+        self.switch_instance(instance)
+
+        def worker():
+            self.reserve_domain(domain, instance=instance)
+
+        self.tasks.submit(f"reserve-{instance.slug}", worker)
+
     # ------------------ WELCOME SCREEN ------------------
 
     def show_welcome_screen(self):
@@ -228,7 +473,13 @@ class SetupApp(toga.App):
         )
 
         self.port_input = toga.TextInput(
-            readonly=True, value="36245", style=Pack(padding=5)
+            readonly=True, value=str(self.instance.smtp_port), style=Pack(padding=5)
+        )
+
+        add_instance_btn = toga.Button(
+            "Add as New Domain",
+            on_press=self.add_instance,
+            style=Pack(padding=(5, 0)),
         )
 
         network_box = toga.Box(
@@ -237,12 +488,62 @@ class SetupApp(toga.App):
                 toga.Label("Domain"),
                 self.domain_input,
                 self.domain_status_label,
+                add_instance_btn,
                 toga.Label("Port"),
                 self.port_input,
             ],
             style=Pack(direction=COLUMN, padding=20),
         )
 
+        # ---------- SERVER ----------
+        self.tuning_select = toga.Selection(
+            items=tuning.PRESET_NAMES, style=Pack(padding=5)
+        )
+        self.tuning_label = toga.Label(
+            "", style=Pack(padding=(4, 0, 5, 0), font_size=10)
+        )
+
+        self.instance_select = toga.Selection(
+            items=self.instance_items(), style=Pack(padding=5)
+        )
+
+        self.format_select = toga.Selection(
+            items=storage.FORMATS, style=Pack(padding=5)
+        )
+        self.compression_select = toga.Selection(
+            items=storage.COMPRESSIONS, style=Pack(padding=5)
+        )
+
+        self.relay_input = toga.TextInput(
+            placeholder="smtp.example.com:587 (optional)", style=Pack(padding=5)
+        )
+        self.relay_user_input = toga.TextInput(
+            placeholder="Relay username", style=Pack(padding=5)
+        )
+        self.relay_password_input = toga.PasswordInput(
+            placeholder="Relay password", style=Pack(padding=5)
+        )
+
+        server_box = toga.Box(
+            children=[
+                toga.Label("Server", style=Pack(padding=(0, 0, 5, 0))),
+                toga.Label("Mail server"),
+                self.instance_select,
+                toga.Label("Tuning profile"),
+                self.tuning_select,
+                self.tuning_label,
+                toga.Label("Mailbox format"),
+                self.format_select,
+                toga.Label("Compression"),
+                self.compression_select,
+                toga.Label("Outgoing relay"),
+                self.relay_input,
+                self.relay_user_input,
+                self.relay_password_input,
+            ],
+            style=Pack(direction=COLUMN, padding=20),
+        )
+
         # ---------- EMAIL ----------
         self.firstname_input = toga.TextInput(
             placeholder="First Name", style=Pack(padding=5)
@@ -272,6 +573,9 @@ class SetupApp(toga.App):
 
         # ---------- CHECKLIST ----------
         self.checklist_box = toga.Box(style=Pack(direction=COLUMN, padding=10))
+        self.resources_label = toga.Label(
+            "", style=Pack(padding=(0, 10), font_family="monospace", font_size=11)
+        )
 
         checks_box = toga.Box(
             children=[
@@ -280,6 +584,7 @@ class SetupApp(toga.App):
                     style=Pack(padding=(0, 0, 10, 0), font_size=16, font_weight="bold"),
                 ),
                 self.checklist_box,
+                self.resources_label,
             ],
             style=Pack(direction=COLUMN, padding=20),
         )
@@ -303,12 +608,47 @@ class SetupApp(toga.App):
         )
         thunderbird_btn.style.padding = (5, 0)
 
+        backup_btn = toga.Button(
+            "Back Up",
+            on_press=self.backup_mail,
+            style=Pack(padding=(5, 0, 5, 10)),
+        )
+
+        import_btn = toga.Button(
+            "Import Mail",
+            on_press=self.choose_import_source,
+            style=Pack(padding=(5, 0, 5, 10)),
+        )
+
+        loadtest_btn = toga.Button(
+            "Load Test",
+            on_press=self.run_load_test,
+            style=Pack(padding=(5, 0, 5, 10)),
+        )
+
+        search_btn = toga.Button(
+            "Search Mail",
+            on_press=self.show_search,
+            style=Pack(padding=(5, 0, 5, 10)),
+        )
+
+        logs_btn = toga.Button(
+            "Diagnostics",
+            on_press=self.show_diagnostics,
+            style=Pack(padding=(5, 0, 5, 10)),
+        )
+
         action_box = toga.Box(
             children=[
                 toga.Box(style=Pack(flex=1)),  # spacer
                 save_btn,
                 self.docker_btn,
                 thunderbird_btn,
+                backup_btn,
+                import_btn,
+                loadtest_btn,
+                search_btn,
+                logs_btn,
             ],
             style=Pack(direction=ROW, padding=10),
         )
@@ -320,6 +660,7 @@ class SetupApp(toga.App):
                 checks_box,
                 email_box,
                 network_box,
+                server_box,
                 action_box,
             ],
             style=Pack(direction=COLUMN, padding=5, alignment="center"),
@@ -329,31 +670,43 @@ class SetupApp(toga.App):
 
         self.main_window.content = container
 
-        config = self.load_config()
-        self.firstname_input.value = config.get("username", "")
-        self.familyname_input.value = config.get("familyname", "")
-        self.password_input.value = config.get("password", "")
-        self.domain_input.value = config.get("domain", "family_name.riamumail.com")
-        self.update_email(None)
+        self.instance_select.value = self.instance.label
+        self.fill_form()
 
         self.domain_input.on_change = self.on_domain_change
         self.firstname_input.on_change = self.update_email
         self.familyname_input.on_change = self.update_email
+        self.tuning_select.on_change = self.update_tuning_label
+        self.instance_select.on_change = self.on_instance_change
 
         self.start_checks()
 
+    def fill_form(self):
+        config = self.load_config()
+        self.firstname_input.value = config.get("username", "")
+        self.familyname_input.value = config.get("familyname", "")
+        self.password_input.value = config.get("password", "")
+        self.domain_input.value = config.get("domain", "family_name.riamumail.com")
+        self.tuning_select.value = config.get("tuning_preset", tuning.AUTO)
+        fmt, compression = storage.settings(config)
+        self.format_select.value = fmt
+        self.compression_select.value = compression
+        relay = config.get("relay") or {}
+        host = relay.get("host", "")
+        if host and relay.get("port"):
+            host = f"{host}:{relay['port']}"
+        self.relay_input.value = host
+        self.relay_user_input.value = relay.get("username", "")
+        self.relay_password_input.value = relay.get("password", "")
+        self.port_input.value = str(self.instance.smtp_port)
+        self.update_email(None)
+        self.update_tuning_label(None)
+
     # ------------------ BACKGROUND CHECKS ------------------
 
     def check_domain_availability_http(self, domain):
         try:
-            r = requests.get(
-                API_BASE + "/domain/check",
-                params={"domain": domain},
-                timeout=5,
-            )
-            r.raise_for_status()
-            data = r.json()
-            return data.get("available")
+            return self.api.check_domain(domain)
         except Exception:
             logging.exception("Domain availability check failed")
             return -1
@@ -390,34 +743,27 @@ class SetupApp(toga.App):
 
         def worker():
             available = self.check_domain_availability_http(domain)
-            self.ui(self.set_domain_status, available)
+            if domain == self.domain_input.value.strip():
+                self.ui(self.set_domain_status, available)
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.tasks.submit("domain-check", worker, kind="domain-check", replace=True)
 
     def start_checks(self):
-        self.spinner_running = True
-        self._update_spinner()
         self.check_run_id += 1
         run_id = self.check_run_id
-        self.clear_checklist()
-        threading.Thread(
-            target=self.run_checks_safe,
-            args=(run_id,),
-            daemon=True,
-        ).start()
+        self.tasks.submit(
+            "checks", self.run_checks_safe, run_id, kind="checks", replace=True
+        )
 
     def _start_checks_ui(self):
         self.check_run_id += 1
         run_id = self.check_run_id
 
-        self.clear_checklist()
         self.loader.start()
 
-        threading.Thread(
-            target=self.run_checks_safe,
-            args=(run_id,),
-            daemon=True,
-        ).start()
+        self.tasks.submit(
+            "checks", self.run_checks_safe, run_id, kind="checks", replace=True
+        )
 
     def run_checks_safe(self, run_id):
         try:
@@ -457,12 +803,16 @@ class SetupApp(toga.App):
         """Safely run UI code on the main thread."""
         self.app.loop.call_soon_threadsafe(fn, *args)
 
+    def refresh_checks(self):
+        """Re-run the checks after background work, unless it was cancelled."""
+        if tasks.cancelled() or self.tasks.closed:
+            return
+        self.ui(self.start_checks)
+
     def update_ui(self, git_ok, docker_ok, thunderbird_ok, run_id):
         if run_id != self.check_run_id:
             return
 
-        self.spinner_running = False  # stop spinner
-
         running = self.docker_container_running()
         self.docker_btn.text = "Stop Mail Server" if running else "Start Mail Server"
 
@@ -471,35 +821,19 @@ class SetupApp(toga.App):
         self.add_check("Thunderbird", thunderbird_ok)
         self.add_check("Domain mapped to IP", self.domain_ok)
         self.add_check("Mail server running", running)
-        self.add_check("Port 36245 open", self.port_ok)
+        self.add_check(f"Port {self.port_input.value} open", self.port_ok)
 
         self.loader.stop()
 
-    def _update_spinner(self):
-        if not self.spinner_running:
-            return
-
-        # Update all "pending" checks with spinner symbol
-        for label, widget in self.check_labels.items():
-            if widget.text.startswith("⟳") or widget.text.endswith("…"):
-                widget.text = f"{self.spinner_frames[self.spinner_index]} {label}…"
-
-        # Advance spinner
-        self.spinner_index = (self.spinner_index + 1) % len(self.spinner_frames)
-
-        # Schedule next tick
-        self.app.loop.call_later(0.1, self._update_spinner)
-
-    def clear_checklist(self):
-        self.spinning_labels.clear()
-        self.check_labels.clear()
-
-        for child in list(self.checklist_box.children):
-            self.checklist_box.remove(child)
+        self.start_health_monitor()
+        if git_ok and docker_ok and not running:
+            self.start_preparation()
 
     def ensure_dependencies(self):
         try:
-            threading.Thread(target=self.install_missing_apps_safe, daemon=True).start()
+            self.tasks.submit(
+                "install-dependencies", self.install_missing_apps_safe, kind="install"
+            )
         except Exception:
             logging.exception("Failed to start dependency installer")
 
@@ -511,15 +845,15 @@ class SetupApp(toga.App):
 
     def install_missing_apps(self):
         if not self.git_exists():
-            self.ui(self.add_check, "Git", None)
+            self.add_check("Git", None)
             self.install_git_quiet()
 
         if not self.app_exists("docker"):
-            self.ui(self.add_check, "Docker Desktop", None)
+            self.add_check("Docker Desktop", None)
             self.install_docker()
 
         if not self.app_exists("thunderbird"):
-            self.ui(self.add_check, "Thunderbird", None)
+            self.add_check("Thunderbird", None)
             self.install_thunderbird()
 
         git_ok = self.git_exists()
@@ -628,26 +962,195 @@ class SetupApp(toga.App):
     def download_file(self, url):
         logging.info(f"Downloading: {url}")
         try:
-            temp_dir = tempfile.mkdtemp()
-            local_path = os.path.join(temp_dir, os.path.basename(url.split("?")[0]))
-
-            with requests.get(url, stream=True, timeout=30) as r:
-                r.raise_for_status()
-                with open(local_path, "wb") as f:
-                    for chunk in r.iter_content(chunk_size=8192):
-                        f.write(chunk)
-
-            return local_path
+            # Resumes a partial download and reuses a finished one
+            return journal.download(url, DOWNLOAD_PATH, self.journal)
 
         except Exception:
             logging.exception(f"Download failed: {url}")
             raise
 
+    # ------------------ HEALTH MONITOR ------------------
+
+    def start_health_monitor(self):
+        """Start background health probes, or probe again soon if already running."""
+        if self.health is None:
+            self.health = HealthMonitor(
+                self.app.loop,
+                self.health_snapshot,
+                self.run_health_probes,
+                self.on_health_result,
+            )
+            self.health.start()
+        else:
+            self.health.poke()
+
+    def health_snapshot(self):
+        return self.domain_input.value, int(self.port_input.value), self.instance
+
+    def run_health_probes(self, domain, port, instance):
+        self.ip = self.get_public_ip()
+        containers = self.running_containers()
+        running = instance.container in containers
+        smtp, imap = instance.smtp_port, instance.imap_port
+
+        def timed(label, probe, *args):
+            with metrics.CHECK_DURATION.time(check=label):
+                return probe(*args)
+
+        results = {
+            "Domain mapped to IP": timed(
+                "Domain mapped to IP", self.check_domain, domain
+            ),
+            f"Port {port} open": timed(f"Port {port} open", self.check_port, port),
+            "Mail server running": running,
+        }
+        results[f"SMTP {smtp} ready"] = (
+            timed(f"SMTP {smtp} ready", port_ready, smtp, b"220") if running else None
+        )
+        results[f"IMAP {imap} ready"] = (
+            timed(f"IMAP {imap} ready", port_ready, imap, b"* OK") if running else None
+        )
+        metrics.CONTAINER_UP.set(int(running), instance=instance.slug)
+
+        # One summary row for every other instance on this host
+        for other in instances.list_instances():
+            if other != instance:
+                up = other.container in containers
+                results[f"Mail server {other.label}"] = up
+                metrics.CONTAINER_UP.set(int(up), instance=other.slug)
+        return results
+
+    def collect_task_metrics(self):
+        counts = self.tasks.counts()
+        metrics.TASKS_QUEUED.set(counts["queued"])
+        metrics.TASKS_RUNNING.clear()
+        metrics.TASKS_WAITING.clear()
+        for kind, count in counts["by_kind"].items():
+            metrics.TASKS_RUNNING.set(count["running"], kind=kind)
+            metrics.TASKS_WAITING.set(count["waiting"], kind=kind)
+
+    def on_health_result(self, results, changed):
+        self.domain_ok = results.get("Domain mapped to IP", self.domain_ok)
+        self.port_ok = results.get(f"Port {self.port_input.value} open", self.port_ok)
+
+        if "Mail server running" in changed:
+            running = results["Mail server running"]
+            self.docker_btn.text = (
+                "Stop Mail Server" if running else "Start Mail Server"
+            )
+            if running:
+                self.mail_log.start()
+                self.stats.start()
+                self.schedule_canary(10)
+            else:
+                self.mail_log.stop()
+                self.stats.stop()
+                self.cancel_canary()
+
+        for label, ok in results.items():
+            if ok is not None:
+                self.add_check(label, ok)
+            elif label in self.check_labels:
+                # Don't leave an earlier ✓ standing
+                self.checklist.skip(label)
+
+    def on_mail_log_update(self, summary):
+        self.add_check(
+            "Mail delivery",
+            self.mail_log.metrics.healthy(summary),
+            maillog.describe(summary),
+        )
+        # Delivered or sent mail: keep the search index current
+        delivered = summary["totals"]["sent"]
+        if delivered != self.indexed_deliveries:
+            self.indexed_deliveries = delivered
+            self.schedule_search_update()
+
+    # ------------------ DELIVERY CANARY ------------------
+
+    def schedule_canary(self, delay=None):
+        self.cancel_canary()
+        if delay is None:
+            delay = self.load_config().get("canary_interval", canary.INTERVAL)
+        self.canary_handle = self.app.loop.call_later(delay, self.run_canary)
+
+    def cancel_canary(self):
+        if self.canary_handle is not None:
+            self.canary_handle.cancel()
+            self.canary_handle = None
+
+    def run_canary(self):
+        self.canary_handle = None
+        if self.canary_task and not self.canary_task.future.done():
+            self.schedule_canary()
+            return
+
+        username, domain, password, email = self.get_user_config()
+        probe = canary.Canary(
+            username.lower(),
+            password,
+            f"{username.lower()}@{domain}",
+            smtp_port=self.instance.smtp_port,
+            imap_port=self.instance.imap_port,
+        )
+
+        def worker():
+            try:
+                latency = probe.probe()
+            except Exception:
+                logging.exception("Delivery canary failed")
+                latency = None
+            self.ui(self.on_canary_result, latency)
+
+        self.canary_task = self.tasks.submit("canary", worker)
+
+    def on_canary_result(self, latency):
+        history = self.canary_history
+        history.record(latency)
+        logging.info(f"Canary latency histogram: {history.histogram()}")
+        if history.degraded():
+            logging.warning(f"Delivery latency degraded: {history.describe()}")
+        self.add_check("Delivery canary", not history.degraded(), history.describe())
+        self.schedule_canary()
+
+    def track_propagation(self, domain, ip):
+        """Follow `domain` -> `ip` across public resolvers until all agree."""
+        self.stop_propagation()
+        self.propagation = PropagationTracker(
+            domain,
+            ip,
+            resolvers=self.load_config().get("dns_resolvers"),
+            on_update=self.on_propagation_update,
+        )
+        self.add_check("DNS propagation", None)
+        self.propagation.start()
+
+    def stop_propagation(self):
+        if self.propagation:
+            self.propagation.stop()
+            self.propagation = None
+            self.checklist.remove("DNS propagation")
+
+    def on_propagation_update(self, tracker):
+        if tracker is not self.propagation:
+            return
+        if tracker.complete():
+            ok = True
+        elif tracker.incomplete:
+            ok = False
+        else:
+            ok = None
+        self.add_check("DNS propagation", ok, tracker.describe())
+
+    def on_stats_update(self, summary, alerts):
+        self.resources_label.text = summary
+        self.add_check("Container resources", not alerts, ", ".join(alerts))
+
     # ------------------ HELPERS ------------------
 
     def get_public_ip(self):
         try:
-            return requests.get("https://ipecho.net/plain", timeout=5).text.strip()
+            return self.public_ip.get() or "Unknown"
         except Exception:
             logging.exception("Failed to fetch public IP")
             return "Unknown"
@@ -718,76 +1221,57 @@ class SetupApp(toga.App):
                     return True
             return False
 
-    def add_check(self, label, ok):
-        if ok is True:
-            icon, color, text = "✓", "green", label
-            self.spinning_labels.discard(label)
+    def add_check(self, label, ok, detail=None):
+        """Show a checklist row; safe to call from any thread."""
+        if ok is not None:
+            metrics.CHECK_OK.set(int(bool(ok)), check=label)
+        self.checklist.update(label, ok, detail)
 
-        elif ok is False:
-            icon, color, text = "✗", "red", label
-            self.spinning_labels.discard(label)
+    def render_check(self, label, text, color):
+        lbl = self.check_labels.get(label)
 
-        else:
-            icon = self.spinner_frames[self.spinner_index]
-            color = "#f0ad4e"
-            text = f"{label}…"
-            self.spinning_labels.add(label)
-
-        if label in self.check_labels:
-            lbl = self.check_labels[label]
-            lbl.text = f"{icon} {text}"
-            lbl.style.color = color
+        if text is None:
+            if lbl is not None:
+                self.checklist_box.remove(self.check_labels.pop(label))
             return
 
-        lbl = toga.Label(
-            f"{icon} {text}",
-            style=Pack(
-                padding=(4, 0),
-                color=color,
-                font_size=16,
-                font_weight="bold",
-            ),
-        )
-
-        self.check_labels[label] = lbl
-        self.checklist_box.add(lbl)
-
-    def build_subprocess_env():
-        env = os.environ.copy()
-
-        extra_paths = []
-
-        if sys.platform == "darwin":
-            extra_paths = [
-                "/opt/homebrew/bin",
-                "/usr/local/bin",
-                "/usr/bin",
-            ]
-        elif sys.platform == "linux":
-            extra_paths = [
-                "/usr/local/bin",
-                "/usr/bin",
-                "/bin",
-            ]
-        elif sys.platform == "win32":
-            extra_paths = [
-                r"C:\Program Files\Docker\Docker\resources\bin",
-                r"C:\Program Files\Git\bin",
-            ]
-
-        existing = env.get("PATH", "")
-        env["PATH"] = os.pathsep.join(extra_paths + [existing])
+        if lbl is None:
+            lbl = toga.Label(
+                text,
+                style=Pack(
+                    padding=(4, 0),
+                    color=color,
+                    font_size=16,
+                    font_weight="bold",
+                ),
+            )
+            self.check_labels[label] = lbl
+            self.checklist_box.add(lbl)
+            return
 
-        return env
+        lbl.text = text
+        if lbl.style.color != color:
+            lbl.style.color = color
 
-    SUBPROCESS_ENV = build_subprocess_env()
+    SUBPROCESS_ENV = riamu_config.SUBPROCESS_ENV
+    base_image_lock = threading.Lock()
+    journals_lock = threading.Lock()
 
     def run_subprocess(self, cmd, *, cwd=None, check=False):
         """
         Run a subprocess and log stdout/stderr line by line.
         """
-        logging.info("Running command: %s", " ".join(cmd))
-
+        # Every line of this command carries its id, so the diagnostics
+        # window can show a failed command's output on its own
+        command_id = next_command_id()
+        logging.info("Running command [%s]: %s", command_id, " ".join(cmd))
+
+        tasks.check_cancelled()
+        task = tasks.current()
+        if task is not None and task.kind == PREPARE_KIND:
+            # Speculative work yields the CPU and disk to everything else
+            # (docker builds themselves run in the daemon, at its priority)
+            cmd = low_priority(cmd)
         process = subprocess.Popen(
             cmd,
             cwd=cwd,
@@ -797,31 +1281,240 @@ class SetupApp(toga.App):
             text=True,
             bufsize=1,
         )
+        # Cancelling the task (or quitting the app) terminates the command
+        if task is not None:
+            task.track(process)
 
         def log_stream(stream, level):
             for line in iter(stream.readline, ""):
-                logging.log(level, line.rstrip())
+                SUBPROCESS_LOG.log(level, "[%s] %s", command_id, line.rstrip())
 
-        stdout_thread = threading.Thread(
-            target=log_stream, args=(process.stdout, logging.INFO), daemon=True
-        )
         stderr_thread = threading.Thread(
-            target=log_stream, args=(process.stderr, logging.ERROR), daemon=True
+            target=log_stream,
+            args=(process.stderr, logging.ERROR),
+            name="riamumail-stderr",
+            daemon=True,
         )
-
-        stdout_thread.start()
         stderr_thread.start()
+        log_stream(process.stdout, logging.INFO)
 
         return_code = process.wait()
-        stdout_thread.join()
         stderr_thread.join()
+        if task is not None:
+            task.untrack(process)
+        tasks.check_cancelled()
+
+        if return_code != 0:
+            logging.error("Command [%s] failed with code %s", command_id, return_code)
+        else:
+            logging.info("Command [%s] exited with code 0", command_id)
 
         if check and return_code != 0:
             raise subprocess.CalledProcessError(return_code, cmd)
-
-        logging.info("Command exited with code %s", return_code)
         return return_code
 
+    # ------------------ SEARCH ------------------
+
+    def show_search(self, widget):
+        if self.search_window is not None:
+            self.search_window.show()
+            return
+
+        self.search_index = search.SearchIndex(
+            self.instance.state_path("search.sqlite")
+        )
+        self.search_input = toga.TextInput(
+            placeholder='words, "a phrase", from:name, subject:word',
+            on_confirm=self.run_search,
+            style=Pack(flex=1, padding=5),
+        )
+        self.search_status = toga.Label("", style=Pack(padding=5))
+        self.search_output = toga.MultilineTextInput(
+            readonly=True, style=Pack(flex=1, font_family="monospace")
+        )
+
+        window = toga.Window(title="Search Mail", size=(800, 500))
+        window.content = toga.Box(
+            children=[
+                toga.Box(
+                    children=[
+                        self.search_input,
+                        toga.Button(
+                            "Search", on_press=self.run_search, style=Pack(padding=5)
+                        ),
+                    ],
+                    style=Pack(direction=ROW),
+                ),
+                self.search_status,
+                self.search_output,
+            ],
+            style=Pack(direction=COLUMN, padding=5),
+        )
+        window.on_close = self.on_search_close
+        self.search_window = window
+        window.show()
+
+        # Searches answer from what is already indexed while new mail is added
+        self.tasks.submit(
+            "search-index",
+            self.update_search_index,
+            self.instance,
+            kind=f"mailbox:{self.instance.slug}",
+        )
+
+    def schedule_search_update(self):
+        if self.search_update_handle is None:
+            self.search_update_handle = self.app.loop.call_later(
+                search.UPDATE_DELAY, self.start_search_update
+            )
+
+    def start_search_update(self):
+        self.search_update_handle = None
+        instance = self.instance
+
+        def worker():
+            if self.docker_container_running(instance):
+                self.update_search_index(instance)
+
+        self.tasks.submit("search-index", worker, kind=f"mailbox:{instance.slug}")
+
+    def update_search_index(self, instance):
+        try:
+            self.add_check("Search index", None)
+            username, domain, password, email = self.get_user_config()
+            fmt, compression = storage.settings(instance.load_config())
+            # dbox is read through doveadm rather than a full Maildir export
+            reader = ContainerMaildir if fmt == storage.MAILDIR else DoveadmMailbox
+            source = reader(instance.container, username.lower(), self.SUBPROCESS_ENV)
+            index = search.SearchIndex(instance.state_path("search.sqlite"))
+            try:
+                stats = index.update(
+                    source,
+                    progress=lambda text: self.add_check("Search index", None, text),
+                )
+            finally:
+                index.close()
+            self.add_check("Search index", True, f"{stats['messages']} messages")
+        except Exception:
+            logging.exception("Updating the search index failed")
+            self.add_check("Search index", False)
+
+    def run_search(self, widget):
+        query = self.search_input.value.strip()
+        if not query:
+            return
+        started = time.perf_counter()
+        results = self.search_index.search(query)
+        elapsed = (time.perf_counter() - started) * 1000
+        self.search_status.text = f"{len(results)} matches in {elapsed:.0f} ms"
+        self.search_output.value = "\n\n".join(search.format_result(r) for r in results)
+
+    def on_search_close(self, window):
+        self.search_index.close()
+        self.search_index = None
+        self.search_window = None
+        return True
+
+    # ------------------ DIAGNOSTICS ------------------
+
+    def show_diagnostics(self, widget):
+        if self.diagnostics_window is not None:
+            self.diagnostics_window.show()
+            return
+
+        # Only the tail of app.log is read, then appends as they arrive
+        self.log_view = LogView(LOG_FILE)
+        self.log_view.load()
+        self.log_command = None
+
+        self.log_level_select = toga.Selection(items=LEVELS, style=Pack(padding=5))
+        self.log_level_select.value = "INFO"
+        self.log_subsystem_select = toga.Selection(
+            items=["all"] + self.log_view.subsystems(), style=Pack(padding=5)
+        )
+        failed_btn = toga.Button(
+            "Last Failed Command",
+            on_press=self.show_failed_command,
+            style=Pack(padding=5),
+        )
+        self.log_output = toga.MultilineTextInput(
+            readonly=True, style=Pack(flex=1, font_family="monospace")
+        )
+        self.task_counts_label = toga.Label(
+            tasks.format_counts(self.tasks.counts()), style=Pack(padding=5)
+        )
+
+        window = toga.Window(title="Diagnostics", size=(900, 600))
+        window.content = toga.Box(
+            children=[
+                toga.Box(
+                    children=[
+                        toga.Label("Level", style=Pack(padding=(10, 0, 0, 5))),
+                        self.log_level_select,
+                        toga.Label("Subsystem", style=Pack(padding=(10, 0, 0, 5))),
+                        self.log_subsystem_select,
+                        failed_btn,
+                    ],
+                    style=Pack(direction=ROW),
+                ),
+                self.task_counts_label,
+                self.log_output,
+            ],
+            style=Pack(direction=COLUMN, padding=5),
+        )
+        window.on_close = self.on_diagnostics_close
+        self.diagnostics_window = window
+        window.show()
+
+        # Only once log_output exists: setting a value fires on_change
+        self.log_level_select.on_change = self.on_log_filter
+        self.log_subsystem_select.on_change = self.on_log_filter
+        self.render_log()
+        self.log_refresh_handle = self.app.loop.call_later(1, self.refresh_log)
+
+    def refresh_log(self):
+        self.task_counts_label.text = tasks.format_counts(self.tasks.counts())
+        if self.log_view.refresh():
+            subsystems = ["all"] + self.log_view.subsystems()
+            if subsystems != [str(item) for item in self.log_subsystem_select.items]:
+                selected = self.log_subsystem_select.value
+                self.log_subsystem_select.items = subsystems
+                self.log_subsystem_select.value = selected
+            if self.log_command is None:
+                self.render_log()
+        self.log_refresh_handle = self.app.loop.call_later(1, self.refresh_log)
+
+    def render_log(self):
+        if self.log_command is not None:
+            entries = self.log_view.command_output(self.log_command)
+        else:
+            subsystem = self.log_subsystem_select.value
+            entries = self.log_view.filtered(
+                self.log_level_select.value,
+                None if subsystem in (None, "all") else {subsystem},
+            )
+        self.log_output.value = "\n".join(e.text for e in entries)
+        self.log_output.scroll_to_bottom()
+
+    def on_log_filter(self, widget):
+        self.log_command = None
+        self.render_log()
+
+    def show_failed_command(self, widget):
+        command_id = self.log_view.last_failed_command()
+        if command_id is None:
+            self.log_output.value = "No failed commands in the recent log."
+            return
+        # Stays on this command until a filter is changed
+        self.log_command = command_id
+        self.render_log()
+
+    def on_diagnostics_close(self, window):
+        self.log_refresh_handle.cancel()
+        self.diagnostics_window = None
+        self.log_view = None
+        return True
+
     # ------------------ EVENTS ------------------
 
     def update_email(self, widget):
@@ -836,6 +1529,17 @@ class SetupApp(toga.App):
 
         self.email_display.value = f"{(self.firstname_input.value or "first_name").lower()}@{self.domain_input.value}"
 
+    def update_tuning_label(self, widget):
+        built = self.load_config().get("tuning_profile")
+        preset = self.tuning_select.value or tuning.AUTO
+        # Docker's limits as of the last build; asking Docker here would
+        # block the UI
+        host = built.get("host") if built else None
+        text = tuning.describe(tuning.build_profile(preset, host))
+        if built and built.get("summary") != text:
+            text = f"{text} (server built with {built.get('summary')})"
+        self.tuning_label.text = text
+
     def on_domain_change(self, widget):
         self.email_display.value = f"{(self.firstname_input.value or "first_name").lower()}@{self.domain_input.value}"
 
@@ -843,7 +1547,7 @@ class SetupApp(toga.App):
         self.start_checks()
 
     def is_first_run(self):
-        return not CONFIG_FILE.exists()
+        return not self.instance.exists()
 
     def save_data(self, widget):
         new_domain = self.domain_input.value
@@ -854,9 +1558,9 @@ class SetupApp(toga.App):
             def worker():
                 self.reserve_domain(new_domain)
                 self.save_config(self.collect_config())
-                self.ui(self.start_checks)
+                self.refresh_checks()
 
-            threading.Thread(target=worker, daemon=True).start()
+            self.tasks.submit("first-save", worker)
             return
 
         # ---------- DOMAIN CHANGE ----------
@@ -866,7 +1570,8 @@ class SetupApp(toga.App):
                 message=(
                     "You are changing your email domain.\n\n"
                     "• The new domain may take a few minutes to a few hours to activate\n"
-                    "• In some cases it can take 24 hours or more\n\n"
+                    "• In some cases it can take 24 hours or more\n"
+                    "• Progress is shown under DNS propagation\n\n"
                     "Do you want to continue?"
                 ),
                 on_result=lambda window, confirmed: self.on_domain_change_confirmed(
@@ -904,14 +1609,28 @@ class SetupApp(toga.App):
 
         def worker():
             if old_domain:
-                self.release_domain(old_domain)
+                # Otherwise a pending IP update could reserve it again
+                updater = self.ddns_for(self.instance)
+                previous = updater.clear(old_domain)
+                released = self.release_domain(old_domain)
+                if not released and not self.api.queued(old_domain):
+                    # Still ours; keep it pointing at this host
+                    if previous:
+                        updater.restore(previous)
+                    logging.error(f"Domain change to {new_domain} rolled back")
+                    self.ui(
+                        self.main_window.error_dialog,
+                        "Domain not changed",
+                        f"Could not release {old_domain}. Please try again later.",
+                    )
+                    return
 
             self.reserve_domain(new_domain)
 
             self.save_config(self.collect_config())
-            self.ui(self.start_checks)
+            self.refresh_checks()
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.tasks.submit("domain-change", worker)
 
     def on_save_confirmed(self, window, confirmed):
         if not confirmed:
@@ -919,85 +1638,156 @@ class SetupApp(toga.App):
             return  # 🚫 Do nothing
 
         def worker():
+            # Keep a copy of the mail before the container is deleted, and
+            # delete nothing unless that copy was made
+            if not self.backup_before_removal():
+                logging.error("Mail backup failed; settings not saved")
+                self.add_check(
+                    "Mail backup", False, "failed; mail server kept, nothing saved"
+                )
+                self.refresh_checks()
+                return
+
             # Stop container & remove image
             self.cleanup_docker_state_safe()
 
             # Save config
             self.save_config(self.collect_config())
 
-            # Refresh UI checks
-            self.ui(self.start_checks)
+            self.refresh_checks()
 
-        threading.Thread(target=worker, daemon=True).start()
+        self.tasks.submit("save-config", worker, kind=self.docker_kind())
+
+    def backup_before_removal(self, instance=None):
+        """
+        Back up the mail in the instance's container before it is removed,
+        starting the container first if it is stopped (without a volume the
+        mail lives only in it). True if there was nothing to back up or the
+        backup was made.
+        """
+        instance = instance or self.instance
+        if not self.docker_container_exists(instance):
+            return True
+        if not self.docker_container_running(instance):
+            try:
+                self.run_subprocess(["docker", "start", instance.container], check=True)
+            except Exception:
+                logging.exception("Could not start the mail server for a backup")
+                return False
+            deadline = time.monotonic() + BACKUP_START_WAIT
+            while not port_ready(instance.imap_port, b"* OK"):
+                if time.monotonic() > deadline:
+                    logging.error("Mail server did not come up for a backup")
+                    return False
+                tasks.check_cancelled()
+                time.sleep(1)
+        return self.backup_mail_safe(instance) is not None
 
     def collect_config(self):
-        return {
-            "domain": self.domain_input.value,
-            "username": self.firstname_input.value,
-            "familyname": self.familyname_input.value,
-            "password": self.password_input.value,
-        }
+        # Keep settings that have no form field (e.g. "log_levels")
+        config = self.load_config()
+        config.update(
+            {
+                "domain": self.domain_input.value,
+                "username": self.firstname_input.value,
+                "familyname": self.familyname_input.value,
+                "password": self.password_input.value,
+                "tuning_preset": self.tuning_select.value or tuning.AUTO,
+                "mail_format": self.format_select.value or storage.DEFAULT_FORMAT,
+                "mail_compression": self.compression_select.value
+                or storage.DEFAULT_COMPRESSION,
+            }
+        )
+        config["relay"] = self.collect_relay(config.get("relay") or {})
+        return config
 
-    def load_config(self):
-        if not CONFIG_FILE.exists():
+    def collect_relay(self, relay):
+        """Relay fields from the form; limits set in the config file are kept."""
+        host, _, port = (self.relay_input.value or "").strip().partition(":")
+        if not host:
             return {}
+        port = int(port) if port.isdigit() else outbound.RELAY_PORT
+        relay = dict(relay, host=host, port=port)
+        relay["username"] = self.relay_user_input.value or ""
+        relay["password"] = self.relay_password_input.value or ""
+        return relay
 
-        try:
-            with open(CONFIG_FILE, "r") as f:
-                return json.load(f)
-        except Exception:
-            logging.exception("Failed to load config")
-            return {}
+    def load_config(self):
+        return self.instance.load_config()
 
     def save_config(self, data):
-        try:
-            CONFIG_PATH.mkdir(exist_ok=True)
-            with open(CONFIG_FILE, "w") as f:
-                json.dump(data, f)
-            logging.info("Config saved")
-        except Exception:
-            logging.exception("Failed to save config")
+        self.instance.save_config(data)
 
     def get_user_config(self):
-        config = self.load_config()
-        username = config.get("username", "umair")
-        domain = config.get("domain", "riamuapp.com")
-        password = config.get("password", "test")
-        email = f"{username}@{domain}"
-        return username, domain, password, email
+        return riamu_config.user_config(self.load_config())
 
     def domain_changed(self, new_domain):
         old_domain = self.load_config().get("domain")
         return old_domain and old_domain != new_domain
 
     def release_domain(self, domain):
+        # Queued in the outbox and replayed in the background if this fails
         try:
-            r = requests.post(
-                API_BASE + "/domain/release",
-                json={"domain": domain},
-                timeout=10,
-            )
-            r.raise_for_status()
+            if not self.api.release_domain(domain):
+                logging.error(f"Failed to release domain: {domain} (queued)")
+                return False
             logging.info(f"Released domain: {domain}")
             return True
         except Exception:
             logging.exception(f"Failed to release domain: {domain}")
             return False
 
-    def reserve_domain(self, domain):
+    def push_domain(self, domain, ip):
+        """Reserve `domain` for `ip` with the API; True once acknowledged."""
         try:
-            r = requests.post(
-                API_BASE + "/domain/reserve",
-                json={"domain": domain, "ipAddress": self.ip},
-                timeout=10,
-            )
-            r.raise_for_status()
+            if not self.api.reserve_domain(domain, ip):
+                logging.error(f"Failed to reserve domain: {domain} (queued)")
+                return False
             logging.info(f"Reserved domain: {domain}")
             return True
         except Exception:
             logging.exception(f"Failed to reserve domain: {domain}")
             return False
 
+    def reserve_domain(self, domain, ip=None, instance=None):
+        instance = instance or self.instance
+        ip = ip or self.ip
+        if not self.push_domain(domain, ip):
+            return False
+
+        if parse_ip(ip):
+            # Only this instance's updater; the others keep their own domains
+            updater = self.ddns_for(instance)
+            updater.mark_pushed(domain, ip)
+            updater.start()
+            if instance == self.instance:
+                self.ui(self.track_propagation, domain, ip)
+        return True
+
+    def reserve_pending_domain(self, instance):
+        """Reserve the domain of an instance added from the command line."""
+        ip = self.public_ip.get()
+        if not ip:
+            logging.warning(f"No public IP; not reserving {instance.domain} yet")
+            return
+        if self.reserve_domain(instance.domain, ip, instance):
+            instances.mark_reserved(instance)
+
+    def update_domain_ip(self, domain, ip, instance=None):
+        """
+        Point an already reserved domain at a new public IP. Called by the
+        DDNS updater, which records the result itself, so unlike
+        reserve_domain this must not mark it as pushed. None if the update
+        is queued in the outbox, which retries it and reports the outcome
+        through on_outbox_result.
+        """
+        logging.info(f"Updating {domain} to {ip}")
+        if not self.push_domain(domain, ip):
+            return None if self.api.queued(domain) else False
+        if instance is None or instance == self.instance:
+            self.ui(self.track_propagation, domain, ip)
+        return True
+
     def open_thunderbird(self, widget):
         try:
             subprocess.Popen(
@@ -1006,6 +1796,146 @@ class SetupApp(toga.App):
         except Exception:
             logging.exception("Failed to open Thunderbird")
 
+    def run_load_test(self, widget):
+        self.main_window.confirm_dialog(
+            title="Run load test",
+            message=(
+                "The load test sends a few hundred test messages to your own "
+                "mailbox and opens many connections at once, so the mail "
+                "server will be slower while it runs.\n\n"
+                "The test messages are deleted afterwards.\n\n"
+                "Do you want to continue?"
+            ),
+            on_result=self.on_load_test_confirmed,
+        )
+
+    def on_load_test_confirmed(self, window, confirmed):
+        if not confirmed:
+            return
+        username, domain, password, email = self.get_user_config()
+        username = username.lower()
+        test = LoadTest(
+            username,
+            password,
+            f"{username}@{domain}",
+            smtp_port=self.instance.smtp_port,
+            imap_port=self.instance.imap_port,
+        )
+
+        def worker():
+            try:
+                results = test.run(
+                    progress=lambda text: self.add_check("Load test", None, text)
+                )
+                report = format_report(results)
+                logging.info(f"Load test results:\n{report}")
+                self.add_check("Load test", None, "removing test messages")
+                test.cleanup()
+                errors = sum(sum(r.errors.values()) for r in results)
+                self.add_check("Load test", errors == 0)
+                self.ui(self.main_window.info_dialog, "Load test results", report)
+            except Exception:
+                logging.exception("Load test failed")
+                self.add_check("Load test", False)
+
+        self.tasks.submit("load-test", worker)
+
+    def backup_mail(self, widget):
+        self.tasks.submit(
+            "backup", self.backup_mail_safe, kind=f"mailbox:{self.instance.slug}"
+        )
+
+    def backup_mail_safe(self, instance=None):
+        instance = instance or self.instance
+        try:
+            self.add_check("Mail backup", None)
+            username, domain, password, email = riamu_config.user_config(
+                instance.load_config()
+            )
+            source = ContainerMaildir(
+                instance.container, username.lower(), self.SUBPROCESS_ENV
+            )
+            stats = backup(source, ChunkStore(instance.state_path("backups")))
+            self.add_check("Mail backup", True)
+            return stats
+        except Exception:
+            logging.exception("Mail backup failed")
+            self.add_check("Mail backup", False)
+
+    def restore_mail_safe(self, instance=None):
+        """Put the latest backup into a freshly started container."""
+        instance = instance or self.instance
+        try:
+            self.add_check("Mail restore", None)
+            deadline = time.monotonic() + BACKUP_START_WAIT
+            while not port_ready(instance.imap_port, b"* OK"):
+                if time.monotonic() > deadline:
+                    raise TimeoutError("Mail server did not come up")
+                tasks.check_cancelled()
+                time.sleep(1)
+            username, domain, password, email = riamu_config.user_config(
+                instance.load_config()
+            )
+            target = ContainerMaildir(
+                instance.container, username.lower(), self.SUBPROCESS_ENV
+            )
+            restore(ChunkStore(instance.state_path("backups")), target)
+            self.add_check("Mail restore", True)
+        except Exception:
+            logging.exception("Mail restore failed")
+            self.add_check("Mail restore", False)
+
+    def choose_import_source(self, widget):
+        self.main_window.question_dialog(
+            title="Import mail",
+            message=(
+                "Import a folder (a Maildir or a folder of .eml files)?\n\n"
+                "Choose No to pick a single mbox or .eml file."
+            ),
+            on_result=self.on_import_kind_chosen,
+        )
+
+    def on_import_kind_chosen(self, window, folder):
+        def chosen(window, path):
+            if path:
+                self.import_mail(path)
+
+        if folder:
+            self.main_window.select_folder_dialog(
+                title="Choose a Maildir or .eml folder to import", on_result=chosen
+            )
+        else:
+            self.main_window.open_file_dialog(
+                title="Choose an mbox or .eml file to import", on_result=chosen
+            )
+
+    def import_mail(self, path):
+        def progress(stats, total_bytes):
+            detail = f"{stats['imported']} messages"
+            percent = percent_read(stats, total_bytes)
+            if percent is not None:
+                detail += f" ({percent}%)"
+            self.add_check("Import mail", None, detail)
+
+        def worker():
+            try:
+                self.add_check("Import mail", None)
+                username, domain, password, email = self.get_user_config()
+                target = ContainerMaildir(
+                    self.instance.container, username.lower(), self.SUBPROCESS_ENV
+                )
+                index = self.instance.state_path("import-index.sqlite")
+                stats = import_mail(path, target, index, progress=progress)
+                detail = (
+                    f"{stats['imported']} imported, {stats['duplicates']} duplicates"
+                )
+                self.add_check("Import mail", not stats["failed"], detail)
+            except Exception:
+                logging.exception(f"Mail import from {path} failed")
+                self.add_check("Import mail", False)
+
+        self.tasks.submit("import", worker, kind=f"mailbox:{self.instance.slug}")
+
     # ------------------ GIT HELPERS ------------------
 
     def git_exists(self):
@@ -1015,24 +1945,88 @@ class SetupApp(toga.App):
         except Exception:
             return False
 
+    def instance_journal(self, instance=None):
+        instance = instance or self.instance
+        with self.journals_lock:
+            if instance.slug not in self.journals:
+                self.journals[instance.slug] = journal.Journal(
+                    instance.state_path("steps.json")
+                )
+            return self.journals[instance.slug]
+
+    def start_preparation(self):
+        """
+        Clone the repository and build the shared base image while the
+        user is still filling in the form; none of it depends on their
+        details. Start then only builds the small per-user image on top.
+        Opt out with "prepare_in_background": false in the config.
+        """
+        if self.preparation is not None and not self.preparation.future.done():
+            return
+        if not self.load_config().get("prepare_in_background", True):
+            return
+        if self.journal.done(
+            "clone", journal.input_hash(MAIL_EXP_REPO)
+        ) and self.journal.done("base-image", journal.input_hash(BASE_DOCKERFILE)):
+            return
+        self.preparation = self.tasks.submit(
+            "prepare", self.prepare_safe, kind=PREPARE_KIND
+        )
+
+    def prepare_safe(self):
+        try:
+            self.journal.step(
+                "clone",
+                journal.input_hash(MAIL_EXP_REPO),
+                self.clone_with_progress,
+                still_valid=MAIL_EXP_PATH.exists,
+            )
+            tasks.check_cancelled()
+            self.build_base_image()
+            logging.info("Background preparation finished")
+        except tasks.TaskCancelled:
+            raise
+        except Exception:
+            # Start runs the same steps again and reports them
+            logging.exception("Background preparation failed")
+
+    def wait_for_preparation(self):
+        """Let a running preparation finish rather than repeat its steps."""
+        task = self.preparation
+        if task is None or task.future.done():
+            return
+        logging.info("Waiting for background preparation")
+        while not task.future.done():
+            tasks.check_cancelled()
+            concurrent.futures.wait([task.future], timeout=1)
+
+    def clone_with_progress(self):
+        self.add_check("Cloning mail server repository", None)
+        self.clone_mailexp_repo()
+        self.add_check("Cloning mail server repository", True)
+
     def clone_mailexp_repo(self):
         logging.info("Cloning mailexp repository")
 
         if MAIL_EXP_PATH.exists():
-            return
+            if self.journal.done("clone", journal.input_hash(MAIL_EXP_REPO)):
+                return
+            # Left over from a clone that never finished
+            shutil.rmtree(MAIL_EXP_PATH)
 
         MAIL_EXP_PATH.parent.mkdir(parents=True, exist_ok=True)
 
         self.run_subprocess(
-            ["/usr/bin/git", "clone", MAIL_EXP_REPO, str(MAIL_EXP_PATH)]
+            ["/usr/bin/git", "clone", MAIL_EXP_REPO, str(MAIL_EXP_PATH)],
+            check=True,
         )
 
     # ------------------ DOCKER HELPERS ------------------
 
-    def docker_image_exists(self):
+    def docker_image_exists(self, image=None):
         try:
             subprocess.check_output(
-                ["docker", "image", "inspect", DOCKER_IMAGE],
+                ["docker", "image", "inspect", image or self.instance.image],
                 stderr=subprocess.DEVNULL,
                 env=self.SUBPROCESS_ENV,
             )
@@ -1040,62 +2034,110 @@ class SetupApp(toga.App):
         except subprocess.CalledProcessError:
             return False
 
-    def docker_container_exists(self):
+    def list_containers(self, all=False):
+        """Names of this app's containers (running only unless `all`)."""
         try:
             output = subprocess.check_output(
-                [
-                    "docker",
-                    "ps",
-                    "-a",
+                ["docker", "ps"]
+                + (["-a"] if all else [])
+                + [
                     "--filter",
-                    f"name={DOCKER_CONTAINER}",
+                    f"name=^/?{DOCKER_CONTAINER}",
                     "--format",
                     "{{.Names}}",
                 ],
                 env=self.SUBPROCESS_ENV,
             ).decode()
-            return DOCKER_CONTAINER in output
+            return set(output.split())
         except Exception:
-            return False
+            return set()
+
+    def running_containers(self):
+        return self.list_containers()
 
-    def docker_container_running(self):
+    def docker_container_exists(self, instance=None):
+        return (instance or self.instance).container in self.list_containers(all=True)
+
+    def docker_container_running(self, instance=None):
+        return (instance or self.instance).container in self.list_containers()
+
+    def container_state(self, instance=None):
+        """Docker's state for the container ("created", "exited", ...), or None."""
         try:
             output = subprocess.check_output(
                 [
                     "docker",
-                    "ps",
-                    "--filter",
-                    f"name={DOCKER_CONTAINER}",
+                    "inspect",
                     "--format",
-                    "{{.Names}}",
+                    "{{.State.Status}}",
+                    (instance or self.instance).container,
                 ],
+                stderr=subprocess.DEVNULL,
                 env=self.SUBPROCESS_ENV,
-            ).decode()
-            return DOCKER_CONTAINER in output
-        except Exception:
-            return False
+            )
+            return output.decode().strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    def build_base_image(self):
+        """Packages shared by every instance, built once per host."""
+        with self.base_image_lock:
+            digest = journal.input_hash(BASE_DOCKERFILE)
+            if self.journal.done("base-image", digest) and self.docker_image_exists(
+                instances.BASE_IMAGE
+            ):
+                return
 
-    def build_docker_image(self):
-        logging.info("Building Docker image")
+            self.add_check("Building base image", None)
+            BASE_BUILD_PATH.mkdir(parents=True, exist_ok=True)
+            (BASE_BUILD_PATH / "Dockerfile").write_text(BASE_DOCKERFILE)
+            try:
+                with metrics.STEP_DURATION.time(step="base-image"):
+                    self.run_subprocess(
+                        ["docker", "build", "-t", instances.BASE_IMAGE, "."],
+                        cwd=BASE_BUILD_PATH,
+                        check=True,
+                    )
+                self.journal.complete("base-image", digest)
+                self.add_check("Building base image", True)
+            except subprocess.CalledProcessError:
+                self.add_check("Building base image", False, "failed (see logs)")
+                raise
+
+    def build_docker_image(self, instance=None):
+        instance = instance or self.instance
+        logging.info(f"Building Docker image {instance.image}")
 
         if not self.git_exists():
             raise RuntimeError("Git is not installed")
 
-        if not MAIL_EXP_PATH.exists():
-            self.app.loop.call_soon_threadsafe(
-                self.add_check,
-                "Cloning mail server repository",
-                None,
-            )
-            self.clone_mailexp_repo()
+        steps = self.instance_journal(instance)
+
+        self.journal.step(
+            "clone",
+            journal.input_hash(MAIL_EXP_REPO),
+            self.clone_with_progress,
+            still_valid=MAIL_EXP_PATH.exists,
+        )
+
+        self.build_base_image()
+
+        # Each instance gets its own build context so builds can run side by side
+        build_path = instance.build_path
+        shutil.copytree(
+            MAIL_EXP_PATH / "postfix", build_path / "postfix", dirs_exist_ok=True
+        )
+        shutil.copy(MAIL_EXP_PATH / "dovecot.conf", build_path / "dovecot.conf")
 
         # Read username, domain, password, email
-        username, domain, password, email = self.get_user_config()
+        username, domain, password, email = riamu_config.user_config(
+            instance.load_config()
+        )
 
         username = username.lower()
 
         # ------------------ Replace users file ------------------
-        users_file = MAIL_EXP_PATH / "users"
+        users_file = build_path / "users"
         users_content = (
             f"{username}:{{PLAIN}}{password}:1000:1000::/home/{username}:/bin/false\n"
         )
@@ -1103,7 +2145,7 @@ class SetupApp(toga.App):
         logging.info(f"Replaced users file for {username}")
 
         # ------------------ Replace aliases file ------------------
-        aliases_file = MAIL_EXP_PATH / "postfix/aliases"
+        aliases_file = build_path / "postfix/aliases"
         aliases_content = f"""
 #
 # Generated aliases
@@ -1136,14 +2178,89 @@ decode:         root
         aliases_file.write_text(aliases_content)
         logging.info(f"Replaced aliases file for {username}")
 
+        # ------------------ Tuning profile ------------------
+        config = instance.load_config()
+        host = tuning.detect_host(tuning.docker_resources(self.SUBPROCESS_ENV))
+        profile = tuning.build_profile(config.get("tuning_preset", tuning.AUTO), host)
+        (build_path / "dovecot-tuning.conf").write_text(tuning.dovecot_config(profile))
+        postconf = "\n".join(
+            f"RUN {c}"
+            for c in tuning.postconf_commands(profile) + [maillog.POSTCONF_LOGGING]
+        )
+        (build_path / "dovecot-logging.conf").write_text(maillog.DOVECOT_LOGGING)
+        config["tuning_profile"] = dict(profile, summary=tuning.describe(profile))
+        instance.save_config(config)
+        logging.info(f"Tuning profile: {tuning.describe(profile)}")
+
+        # ------------------ Local delivery ------------------
+        # Through Dovecot LMTP, which updates indexes as mail arrives
+        postconf += f"\nRUN {delivery.postconf_command(profile)}"
+        (build_path / "dovecot-delivery.conf").write_text(
+            delivery.dovecot_config(profile)
+        )
+        logging.info(f"Local delivery: {delivery.describe(profile)}")
+
+        # ------------------ Outbound delivery ------------------
+        relay = outbound.relay_settings(config)
+        postconf += f"\nRUN {outbound.postconf_command(relay, profile)}"
+        (build_path / "unbound.conf").write_text(
+            outbound.unbound_config(config.get("dns_forwarders"))
+        )
+        credentials = outbound.sasl_passwd(relay)
+        if credentials:
+            # Baked into an image layer; see outbound.sasl_passwd
+            (build_path / "sasl_passwd").write_text(credentials)
+            postconf += f"""
+COPY sasl_passwd {outbound.SASL_PASSWD}
+RUN chmod 600 {outbound.SASL_PASSWD} && postmap lmdb:{outbound.SASL_PASSWD}"""
+        else:
+            (build_path / "sasl_passwd").unlink(missing_ok=True)
+        logging.info(f"Outbound delivery: {outbound.describe(relay)}")
+
+        # A small supervisor: local resolver, Dovecot, the storage migration
+        # (doveadm needs Dovecot's auth service), then Postfix in the
+        # foreground so its log reaches `docker logs`. The container stops
+        # when either daemon exits.
+        (build_path / "riamumail-entrypoint").write_text(f"""#!/bin/sh
+unbound -c {outbound.UNBOUND_CONF}
+dovecot "$@" &
+DOVECOT=$!
+{storage.SCRIPT} migrate
+postfix start-fg &
+POSTFIX=$!
+
+STOPPING=
+trap 'STOPPING=1' TERM INT
+while [ -z "$STOPPING" ] && kill -0 $DOVECOT 2>/dev/null && kill -0 $POSTFIX 2>/dev/null; do
+    sleep 1
+done
+postfix stop >/dev/null 2>&1
+kill -TERM $DOVECOT 2>/dev/null
+wait
+""")
+
+        # ------------------ Mailbox storage ------------------
+        # Mail in another format is converted when the container starts
+        mail_format, compression = storage.settings(config)
+        (build_path / "dovecot-storage.conf").write_text(
+            storage.dovecot_config(mail_format, compression)
+        )
+        (build_path / "riamumail-storage").write_text(
+            storage.storage_script(username, mail_format)
+        )
+        mail_dir = storage.DIRECTORIES[mail_format]
+        if mail_format == storage.MAILDIR:
+            mkdirs = f"""RUN mkdir -p /home/{username}/Maildir/cur && \\
+    mkdir -p /home/{username}/Maildir/new && \\
+    mkdir -p /home/{username}/Maildir/tmp"""
+        else:
+            mkdirs = f"RUN mkdir -p /home/{username}/{mail_dir}"
+        logging.info(f"Mailbox storage: {storage.describe(mail_format, compression)}")
+
         # ------------------ Replace Dockerfile ------------------
-        dockerfile_path = MAIL_EXP_PATH / "Dockerfile"
+        dockerfile_path = build_path / "Dockerfile"
         dockerfile_content = f"""
-FROM alpine:latest
-
-RUN apk update
-RUN apk add busybox-extras vim
-RUN apk add postfix dovecot mailutils
+FROM {instances.BASE_IMAGE}
 
 COPY postfix/* /etc/postfix/
 COPY dovecot.conf /etc/dovecot/
@@ -1151,19 +2268,25 @@ COPY users /etc/dovecot/
 RUN chown root:dovecot /etc/dovecot/users
 RUN chmod 640 /etc/dovecot/users
 
+COPY dovecot-tuning.conf /etc/dovecot/riamumail-tuning.conf
+COPY dovecot-delivery.conf /etc/dovecot/riamumail-delivery.conf
+COPY dovecot-logging.conf /etc/dovecot/riamumail-logging.conf
+COPY dovecot-storage.conf /etc/dovecot/riamumail-storage.conf
+COPY riamumail-storage {storage.SCRIPT}
+COPY riamumail-entrypoint /usr/local/bin/riamumail-entrypoint
+RUN chmod 755 {storage.SCRIPT} /usr/local/bin/riamumail-entrypoint
+COPY unbound.conf {outbound.UNBOUND_CONF}
+RUN echo '!include_try /etc/dovecot/riamumail-*.conf' >> /etc/dovecot/dovecot.conf
+{postconf}
+
 RUN adduser -D {username} mail
-RUN mkdir -p /home/{username}/Maildir/cur && \\
-    mkdir -p /home/{username}/Maildir/new && \\
-    mkdir -p /home/{username}/Maildir/tmp
-RUN chown {username}:{username} -R /home/{username}/Maildir
+{mkdirs}
+RUN chown {username}:{username} -R /home/{username}/{mail_dir}
 RUN echo "{username}:{password}" | chpasswd
 
-RUN awk '{{gsub(/smtp\\t+25/, "smtp\\t\\t36245"); print}}' /etc/services > /tmp/services
-RUN cp /tmp/services /etc/ && rm /tmp/services
-
 RUN newaliases && postfix start
 
-ENTRYPOINT ["dovecot"]
+ENTRYPOINT ["/usr/local/bin/riamumail-entrypoint"]
 CMD ["-F"]
 """
 
@@ -1172,87 +2295,131 @@ CMD ["-F"]
 
         # ------------------ Build Docker image ------------------
         try:
-            self.app.loop.call_soon_threadsafe(
-                self.add_check,
+            self.add_check(
                 "Building mail server image",
                 None,
             )
-            self.run_subprocess(
-                ["docker", "build", "-t", DOCKER_IMAGE, "."],
-                cwd=MAIL_EXP_PATH,
+
+            def build():
+                with metrics.STEP_DURATION.time(step="build"):
+                    self.run_subprocess(
+                        ["docker", "build", "-t", instance.image, "."],
+                        cwd=build_path,
+                        check=True,
+                    )
+
+            # Only rebuilt when the generated build context changed
+            ran = steps.step(
+                "build",
+                journal.input_hash(
+                    journal.tree_hash(build_path), self.journal.steps.get("base-image")
+                ),
+                build,
+                still_valid=lambda: self.docker_image_exists(instance.image),
+            )
+            self.add_check(
+                "Building mail server image", True, None if ran else "up to date"
             )
         except subprocess.CalledProcessError:
-            self.app.loop.call_soon_threadsafe(
-                self.add_check,
-                "Docker build failed (see logs)",
+            self.add_check(
+                "Building mail server image",
                 False,
+                "failed (see logs)",
             )
             raise
 
-    def start_container(self):
-        logging.info("Starting container")
-        self.run_subprocess(
-            [
-                "docker",
-                "run",
-                "-d",
-                "--name",
-                DOCKER_CONTAINER,
-                "--dns",
-                "8.8.8.8",
-                "--hostname",
-                self.domain_input.value,
-                "-p",
-                "36245:36245",
-                "-p",
-                "10143:143",
-                DOCKER_IMAGE,
-            ]
-        )
+    def start_container(self, instance=None):
+        instance = instance or self.instance
+        logging.info(f"Starting container {instance.container}")
+        with metrics.STEP_DURATION.time(step="start"):
+            self.run_subprocess(
+                ["docker", "run", "-d", "--dns", outbound.RESOLVER]
+                + instance.docker_run_args(instance.domain or self.domain_input.value)
+                + [instance.image]
+            )
 
-    def stop_container(self):
-        logging.info("Stopping container")
-        self.run_subprocess(["docker", "rm", "-f", DOCKER_CONTAINER])
+    def stop_container(self, instance=None):
+        instance = instance or self.instance
+        logging.info(f"Stopping container {instance.container}")
+        self.run_subprocess(["docker", "rm", "-f", instance.container])
 
     def toggle_container(self, widget):
-        threading.Thread(target=self.toggle_container_safe, daemon=True).start()
+        self.tasks.submit(
+            "toggle-container",
+            self.toggle_container_safe,
+            self.instance,
+            kind=self.docker_kind(),
+        )
 
-    def toggle_container_safe(self):
+    def toggle_container_safe(self, instance=None):
+        instance = instance or self.instance
         try:
-            if not self.docker_image_exists():
-                self.build_docker_image()
+            if self.docker_container_running(instance):
+                self.stop_container(instance)
+                self.instance_journal(instance).forget("start")
+                return
 
-            if self.docker_container_running():
-                self.stop_container()
-            else:
-                self.start_container()
+            # Each step is skipped if it already completed with the same
+            # inputs, which usually includes the background preparation
+            self.wait_for_preparation()
+            self.build_docker_image(instance)
+
+            steps = self.instance_journal(instance)
+            digest = instances.start_digest(instance, steps.steps)
+            action = instances.container_action(
+                self.container_state(instance), steps.done("start", digest)
+            )
+            if action == "start":
+                logging.info(f"Restarting container {instance.container}")
+                self.run_subprocess(["docker", "start", instance.container], check=True)
+                return
+            if action == "recreate":
+                # Built from an older image or settings. Without a volume its
+                # mail lives in the container, so keep a copy to put back
+                logging.info(f"Recreating outdated container {instance.container}")
+                if not self.backup_before_removal(instance):
+                    self.add_check(
+                        "Mail backup", False, "failed; outdated mail server kept"
+                    )
+                    return
+                steps.forget("start")
+            if action is not None:
+                self.stop_container(instance)
+            steps.step(
+                "start",
+                digest,
+                lambda: self.start_container(instance),
+                still_valid=lambda: self.docker_container_running(instance),
+            )
+            if action == "recreate" and not instance.volume:
+                self.restore_mail_safe(instance)
 
         except Exception:
             logging.exception("Docker toggle failed")
 
         finally:
-            # Instead of calling start_checks() directly, marshal to main thread
-            self.ui(self.start_checks)
+            self.refresh_checks()
 
-    def remove_docker_image(self):
+    def remove_docker_image(self, instance=None):
         logging.info("Removing Docker image if it exists")
         subprocess.call(
-            ["docker", "rmi", "-f", DOCKER_IMAGE],
+            ["docker", "rmi", "-f", (instance or self.instance).image],
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
             env=self.SUBPROCESS_ENV,
         )
 
-    def cleanup_docker_state_safe(self):
+    def cleanup_docker_state_safe(self, instance=None):
+        instance = instance or self.instance
         try:
             # Stop & remove container if it exists
-            if self.docker_container_exists():
+            if self.docker_container_exists(instance):
                 logging.info("Stopping existing mail container")
-                self.stop_container()
+                self.stop_container(instance)
 
             # Remove image if it exists
-            if self.docker_image_exists():
-                self.remove_docker_image()
+            if self.docker_image_exists(instance.image):
+                self.remove_docker_image(instance)
 
         except Exception:
             logging.exception("Docker cleanup failed")
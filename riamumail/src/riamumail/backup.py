@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import logging
+from pathlib import Path
+
+from riamumail.maildir import unique_name, is_message, is_index
+
+log = logging.getLogger("riamumail.backup")
+
+CHUNK_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+
+
+class ChunkStore:
+    """
+    Content-addressed store of zlib-compressed chunks plus one JSON manifest
+    per snapshot:
+
+        objects/ab/abcdef...   compressed chunk, named by sha256 of its data
+        snapshots/<stamp>.json path -> {"size", "chunks": [sha256, ...]}
+
+    Identical content is stored once no matter how many snapshots or paths
+    refer to it.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.objects = self.root / "objects"
+        self.snapshots = self.root / "snapshots"
+
+    def object_path(self, digest):
+        return self.objects / digest[:2] / digest
+
+    def has(self, digest):
+        return self.object_path(digest).exists()
+
+    def put(self, data):
+        """Store one chunk; returns (digest, stored bytes or 0 if already present)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            return digest, 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        packed = zlib.compress(data, COMPRESS_LEVEL)
+        tmp = path.with_name(f".{digest}.tmp")
+        tmp.write_bytes(packed)
+        os.replace(tmp, path)
+        return digest, len(packed)
+
+    def get(self, digest):
+        return zlib.decompress(self.object_path(digest).read_bytes())
+
+    def list_snapshots(self):
+        return sorted(p.stem for p in self.snapshots.glob("*.json"))
+
+    def load_snapshot(self, name=None):
+        names = self.list_snapshots()
+        if not names:
+            return None
+        name = name or names[-1]
+        with open(self.snapshots / f"{name}.json") as f:
+            return json.load(f)
+
+    def save_snapshot(self, manifest):
+        self.snapshots.mkdir(parents=True, exist_ok=True)
+        name = time.strftime("%Y%m%d-%H%M%S")
+        n = 0
+        while (self.snapshots / f"{name}.json").exists():
+            n += 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{n}"
+        tmp = self.snapshots / f".{name}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self.snapshots / f"{name}.json")
+        return name
+
+
+class ChunkReader:
+    """File-like view over a stored file's chunks, decompressed on demand."""
+
+    def __init__(self, store, chunks):
+        self.store = store
+        self.chunks = list(chunks)
+        self.buffer = b""
+
+    def read(self, size=-1):
+        while self.chunks and (size < 0 or len(self.buffer) < size):
+            self.buffer += self.store.get(self.chunks.pop(0))
+        if size < 0:
+            data, self.buffer = self.buffer, b""
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def store_file(store, fileobj):
+    chunks, stored = [], 0
+    while True:
+        data = fileobj.read(CHUNK_SIZE)
+        if not data:
+            break
+        digest, packed = store.put(data)
+        chunks.append(digest)
+        stored += packed
+    return chunks, stored
+
+
+def backup(source, store, progress=None):
+    """
+    Snapshot `source` (a LocalMaildir or ContainerMaildir) into `store`.
+
+    Delivered messages are immutable, so any message whose unique name is
+    already in the previous snapshot is carried over without reading it;
+    only new messages and the small mutable Dovecot files are transferred.
+    """
+    started = time.monotonic()
+    previous = store.load_snapshot() or {"files": {}}
+    known = {
+        unique_name(path): entry
+        for path, entry in previous["files"].items()
+        if is_message(path)
+    }
+
+    files, fetch = {}, []
+    for path in source.list_files():
+        if is_index(path) or "/tmp/" in f"/{path}":
+            continue
+        entry = known.get(unique_name(path)) if is_message(path) else None
+        if entry:
+            files[path] = entry
+        else:
+            fetch.append(path)
+
+    stats = {"files": 0, "new": 0, "bytes_read": 0, "bytes_stored": 0}
+    for i, (path, size, fileobj) in enumerate(source.read_files(fetch), 1):
+        chunks, stored = store_file(store, fileobj)
+        files[path] = {"size": size, "chunks": chunks}
+        stats["bytes_read"] += size
+        stats["bytes_stored"] += stored
+        stats["new"] += 1
+        if progress and i % 100 == 0:
+            progress(f"Backing up: {i}/{len(fetch)} new files")
+
+    stats["files"] = len(files)
+    name = store.save_snapshot({"created": time.time(), "files": files})
+    stats["snapshot"] = name
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    log.info(f"Backup {name}: {stats}")
+    return stats
+
+
+def restore(store, target, snapshot=None, progress=None):
+    """Stream a snapshot's files into `target` without staging a copy."""
+    manifest = store.load_snapshot(snapshot)
+    if manifest is None:
+        raise FileNotFoundError("No backup snapshots found")
+
+    with target.writer() as writer:
+        for i, (path, entry) in enumerate(sorted(manifest["files"].items()), 1):
+            writer.add(path, ChunkReader(store, entry["chunks"]), entry["size"])
+            if progress and i % 100 == 0:
+                progress(f"Restoring: {i}/{len(manifest['files'])} files")
+
+    log.info(f"Restored {len(manifest['files'])} files")
+    return len(manifest["files"])
@@ -0,0 +1,171 @@
+import os
+import time
+import bisect
+import imaplib
+import smtplib
+import logging
+import collections
+
+from riamumail.loadtest import SMTP_PORT, IMAP_PORT, make_message, percentile
+
+log = logging.getLogger("riamumail.canary")
+
+HEADER = "X-Riamu-Canary"
+INTERVAL = 5 * 60
+TIMEOUT = 60
+POLL = 0.5
+
+# Upper bounds (seconds) of the histogram buckets; the last is open-ended
+BUCKETS = [0.5, 1, 2, 5, 10, 30, 60]
+RECENT = 12
+HISTORY = 288  # a day at the default interval
+DEGRADED_FACTOR = 2
+DEGRADED_FLOOR = 5.0
+BARS = "▁▂▃▄▅▆▇█"
+
+
+class Canary:
+    """
+    One end-to-end probe: send a tagged message through SMTP, wait for it
+    to appear over IMAP, then delete it. `probe()` returns the delivery
+    latency in seconds, or None if the message never arrived.
+    """
+
+    def __init__(
+        self,
+        user,
+        password,
+        recipient,
+        host="127.0.0.1",
+        smtp_port=SMTP_PORT,
+        imap_port=IMAP_PORT,
+        timeout=TIMEOUT,
+        poll=POLL,
+    ):
+        self.user = user
+        self.password = password
+        self.recipient = recipient
+        self.host = host
+        self.smtp_port = smtp_port
+        self.imap_port = imap_port
+        self.timeout = timeout
+        self.poll = poll
+
+    def probe(self):
+        token = os.urandom(8).hex()
+        msg = make_message(self.recipient, self.recipient, 256, tag="canary")
+        msg[HEADER] = token
+
+        imap = imaplib.IMAP4(self.host, self.imap_port, timeout=self.timeout)
+        try:
+            imap.login(self.user, self.password)
+            imap.select("INBOX")
+
+            started = time.monotonic()
+            with smtplib.SMTP(self.host, self.smtp_port, timeout=self.timeout) as smtp:
+                smtp.send_message(msg)
+
+            deadline = started + self.timeout
+            while True:
+                typ, data = imap.search(None, "HEADER", HEADER, token)
+                found = data[0].split() if typ == "OK" and data[0] else []
+                if found:
+                    latency = time.monotonic() - started
+                    self.delete(imap)
+                    return latency
+                if time.monotonic() >= deadline:
+                    log.warning(f"Canary {token} not delivered in {self.timeout}s")
+                    return None
+                time.sleep(self.poll)
+        finally:
+            try:
+                imap.logout()
+            except Exception:
+                pass
+
+    @staticmethod
+    def delete(imap):
+        """Delete every canary message, including ones that arrived too late."""
+        typ, data = imap.search(None, "HEADER", HEADER, '""')
+        if typ != "OK" or not data[0]:
+            return
+        for seq in data[0].split():
+            imap.store(seq.decode(), "+FLAGS", "\\Deleted")
+        imap.expunge()
+
+
+class LatencyHistory:
+    """
+    Bucketed histogram of every canary result plus the latest results for
+    percentiles. Degraded means the p95 of the last `recent` probes is
+    more than `factor` times the p95 of the ones before (and above
+    `floor`), or the last probe failed.
+    """
+
+    def __init__(
+        self,
+        buckets=BUCKETS,
+        recent=RECENT,
+        history=HISTORY,
+        factor=DEGRADED_FACTOR,
+        floor=DEGRADED_FLOOR,
+    ):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.failures = 0
+        self.recent = recent
+        self.factor = factor
+        self.floor = floor
+        self.samples = collections.deque(maxlen=history)
+        self.last = None
+
+    def record(self, latency):
+        self.last = latency
+        if latency is None:
+            self.failures += 1
+            return
+        self.counts[bisect.bisect_left(self.buckets, latency)] += 1
+        self.samples.append(latency)
+
+    def p95(self, last=None):
+        samples = list(self.samples)[-last:] if last else list(self.samples)
+        return percentile(samples, 95)
+
+    def degraded(self):
+        if self.last is None and (self.failures or self.samples):
+            return True
+        if len(self.samples) < self.recent * 2:
+            return False
+        samples = list(self.samples)
+        baseline = percentile(samples[: -self.recent], 95)
+        recent = percentile(samples[-self.recent :], 95)
+        return recent > self.floor and recent > self.factor * baseline
+
+    def histogram(self):
+        """Bucket label -> count, e.g. {"≤0.5s": 3, ..., ">60s": 0}."""
+        labels = [f"≤{b:g}s" for b in self.buckets] + [f">{self.buckets[-1]:g}s"]
+        return dict(zip(labels, self.counts))
+
+    def sparkline(self):
+        """
+        One bar per bucket, scaled to the fullest, e.g. "≤0.5s ▂█▁····· >60s";
+        "·" marks an empty bucket. Empty string before the first result.
+        """
+        top = max(self.counts)
+        if not top:
+            return ""
+        bars = "".join(
+            BARS[round((len(BARS) - 1) * c / top)] if c else "·" for c in self.counts
+        )
+        return f"≤{self.buckets[0]:g}s {bars} >{self.buckets[-1]:g}s"
+
+    def describe(self):
+        if self.last is None:
+            text = f"not delivered ({self.failures} failed)"
+        else:
+            text = f"{self.last:.1f}s, p95 {self.p95(self.recent):.1f}s"
+            if self.failures:
+                text += f", {self.failures} failed"
+        if self.samples:
+            text += f" · {self.sparkline()}"
+        return text
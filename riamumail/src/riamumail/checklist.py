@@ -0,0 +1,109 @@
+import threading
+
+FRAME = 1 / 30
+SPINNER_INTERVAL = 0.1
+SPINNER_FRAMES = ["⠋", "⠙", "⠹", "⠸", "⠼", "⠴", "⠦", "⠧", "⠇", "⠏"]
+
+REMOVED = object()
+# A check that could not run this time, e.g. with the mail server stopped
+SKIPPED = "skipped"
+
+COLORS = {True: "green", False: "red", None: "#f0ad4e", SKIPPED: "gray"}
+
+
+class Checklist:
+    """
+    View model for the checklist rows.
+
+    `update` may be called from any thread; updates are queued (the
+    latest per label wins) and applied once per frame on `loop`. Only
+    rows whose state actually changed are passed to
+    `render(label, text, color)`; `render(label, None, None)` removes a
+    row. The spinner only ticks while at least one row is pending.
+    """
+
+    def __init__(self, loop, render, frame=FRAME, spinner_interval=SPINNER_INTERVAL):
+        self.loop = loop
+        self.render = render
+        self.frame = frame
+        self.spinner_interval = spinner_interval
+
+        self.rows = {}  # label -> (ok, detail), in display order
+        self.queued = {}
+        self.flush_scheduled = False
+        self.lock = threading.Lock()
+
+        self.spinner_index = 0
+        self.spinner_handle = None
+
+    # ---------- updates ----------
+
+    def update(self, label, ok, detail=None):
+        with self.lock:
+            self.queued[label] = (ok, detail)
+            if self.flush_scheduled:
+                return
+            self.flush_scheduled = True
+        self.loop.call_soon_threadsafe(self.loop.call_later, self.frame, self.flush)
+
+    def flush(self):
+        with self.lock:
+            queued, self.queued = self.queued, {}
+            self.flush_scheduled = False
+
+        for label, state in queued.items():
+            if state[0] is REMOVED:
+                if self.rows.pop(label, None) is not None:
+                    self.render(label, None, None)
+                continue
+            if self.rows.get(label) == state:
+                continue
+            self.rows[label] = state
+            self.draw(label)
+
+        self.update_spinner()
+
+    def remove(self, label):
+        self.update(label, REMOVED)
+
+    def skip(self, label):
+        self.update(label, SKIPPED, "not checked")
+
+    # ---------- drawing ----------
+
+    def text(self, label):
+        ok, detail = self.rows[label]
+        text = f"{label}: {detail}" if detail else label
+        if ok is True:
+            return f"✓ {text}"
+        if ok is False:
+            return f"✗ {text}"
+        if ok is SKIPPED:
+            return f"– {text}"
+        return f"{SPINNER_FRAMES[self.spinner_index]} {text}…"
+
+    def draw(self, label):
+        self.render(label, self.text(label), COLORS[self.rows[label][0]])
+
+    def pending(self):
+        return [label for label, (ok, _) in self.rows.items() if ok is None]
+
+    def update_spinner(self):
+        if self.pending():
+            if self.spinner_handle is None:
+                self.spinner_handle = self.loop.call_later(
+                    self.spinner_interval, self.spin
+                )
+        elif self.spinner_handle is not None:
+            self.spinner_handle.cancel()
+            self.spinner_handle = None
+
+    def spin(self):
+        self.spinner_handle = None
+        pending = self.pending()
+        if not pending:
+            return
+        self.spinner_index = (self.spinner_index + 1) % len(SPINNER_FRAMES)
+        for label in pending:
+            self.draw(label)
+        self.spinner_handle = self.loop.call_later(self.spinner_interval, self.spin)
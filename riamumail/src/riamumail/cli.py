@@ -0,0 +1,245 @@
+import sys
+import json
+import logging
+import argparse
+
+from riamumail import loadtest, instances, storage, search
+from riamumail.backup import ChunkStore, backup, restore
+from riamumail.importer import import_mail, percent_read
+from riamumail.maildir import ContainerMaildir
+from riamumail.config import SUBPROCESS_ENV, user_config
+
+COMMANDS = {"loadtest", "backup", "restore", "import", "instances", "search"}
+
+
+def cmd_loadtest(args):
+    instance = instances.get(args.instance)
+    username, domain, password, email = user_config(instance.load_config())
+
+    test = loadtest.LoadTest(
+        user=args.user or username.lower(),
+        password=args.password or password,
+        recipient=args.to or f"{username.lower()}@{domain}",
+        host=args.host,
+        smtp_port=args.smtp_port or instance.smtp_port,
+        imap_port=args.imap_port or instance.imap_port,
+        sizes=loadtest.parse_sizes(args.sizes) if args.sizes else None,
+        mix=loadtest.parse_mix(args.mix) if args.mix else None,
+        ops_per_worker=args.ops,
+    )
+    fmt, compression = storage.settings(instance.load_config())
+    try:
+        used = storage.disk_usage(instance.container, username.lower(), SUBPROCESS_ENV)
+        used = f", {used / 1e6:.1f} MB on disk"
+    except Exception:
+        used = ""
+    print(f"Mail storage: {storage.describe(fmt, compression)}{used}", file=sys.stderr)
+
+    if args.ingest:
+        size = test.sizes[0][0] if args.sizes else loadtest.INGEST_SIZE
+        result = test.ingest(args.ingest, args.ingest_concurrency, size=size)
+        remove_test_messages(test, args)
+        if args.json:
+            print(json.dumps(result.summary(), indent=2))
+        else:
+            print(loadtest.format_ingest_report(result))
+        return 1 if result.errors or result.delivered < result.accepted else 0
+
+    results = test.run(
+        [int(c) for c in args.concurrency.split(",")],
+        progress=lambda text: print(text, file=sys.stderr),
+    )
+    remove_test_messages(test, args)
+
+    if args.json:
+        print(json.dumps([r.summary() for r in results], indent=2))
+    else:
+        print(loadtest.format_report(results))
+    return 1 if any(sum(r.errors.values()) for r in results) else 0
+
+
+def remove_test_messages(test, args):
+    if args.keep:
+        return
+    try:
+        removed = test.cleanup()
+        print(f"Removed {removed} test messages", file=sys.stderr)
+    except Exception as e:
+        print(f"Could not remove the test messages: {e}", file=sys.stderr)
+
+
+def container_maildir(args):
+    instance = instances.get(args.instance)
+    username = args.user or user_config(instance.load_config())[0]
+    container = args.container or instance.container
+    return ContainerMaildir(container, username.lower(), SUBPROCESS_ENV)
+
+
+def backup_store(args):
+    return ChunkStore(args.store or instances.get(args.instance).state_path("backups"))
+
+
+def cmd_backup(args):
+    stats = backup(container_maildir(args), backup_store(args), progress=print)
+    print(
+        f"Snapshot {stats['snapshot']}: {stats['files']} files, {stats['new']} new, "
+        f"{stats['bytes_read'] / 1e6:.1f} MB read, "
+        f"{stats['bytes_stored'] / 1e6:.1f} MB stored in {stats['elapsed']}s"
+    )
+    return 0
+
+
+def cmd_restore(args):
+    store = backup_store(args)
+    if args.list:
+        print("\n".join(store.list_snapshots()))
+        return 0
+    count = restore(store, container_maildir(args), args.snapshot, progress=print)
+    print(f"Restored {count} files")
+    return 0
+
+
+def cmd_import(args):
+    def progress(stats, total_bytes):
+        percent = percent_read(stats, total_bytes)
+        done = f" ({percent}%)" if percent is not None else ""
+        print(f"\r{stats['imported']} messages imported{done}", end="", flush=True)
+
+    index = args.index or instances.get(args.instance).state_path("import-index.sqlite")
+    stats = import_mail(
+        args.source,
+        container_maildir(args),
+        index,
+        workers=args.workers,
+        progress=progress,
+    )
+    print(
+        f"\n{stats['imported']} imported, {stats['duplicates']} duplicates, "
+        f"{stats['failed']} failed in {stats['elapsed']}s"
+    )
+    return 1 if stats["failed"] else 0
+
+
+def cmd_search(args):
+    path = args.index or instances.get(args.instance).state_path("search.sqlite")
+    index = search.SearchIndex(path)
+    try:
+        if not args.no_update:
+            stats = index.update(
+                container_maildir(args),
+                progress=lambda text: print(text, file=sys.stderr),
+            )
+            print(
+                f"{stats['indexed']} new messages indexed, {stats['messages']} total "
+                f"in {stats['elapsed']}s",
+                file=sys.stderr,
+            )
+        results = index.search(" ".join(args.query), limit=args.limit)
+    finally:
+        index.close()
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("\n".join(search.format_result(r) for r in results) or "No matches")
+    return 0 if results else 1
+
+
+def cmd_instances(args):
+    if args.add:
+        instance = instances.create_instance(
+            args.add, instances.get().load_config(), reserved=False
+        )
+        print(
+            f"Created {instance.slug}: SMTP {instance.smtp_port}, IMAP {instance.imap_port}"
+        )
+        print(f"{args.add} will be reserved the next time the app starts")
+        return 0
+    for instance in instances.list_instances():
+        print(
+            f"{instance.slug:<24} {instance.label:<32} "
+            f"SMTP {instance.smtp_port:<6} IMAP {instance.imap_port:<6} "
+            f"{instance.container}"
+        )
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="riamumail")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("loadtest", help="SMTP/IMAP throughput test")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--instance", help="instance name (see `riamumail instances`)")
+    p.add_argument("--smtp-port", type=int, help="default: the instance's port")
+    p.add_argument("--imap-port", type=int, help="default: the instance's port")
+    p.add_argument("--user", help="IMAP login (default: configured user)")
+    p.add_argument("--password", help="IMAP password (default: configured)")
+    p.add_argument("--to", help="recipient (default: configured address)")
+    p.add_argument("--concurrency", default="1,4,16", help="e.g. 1,4,16")
+    p.add_argument("--ops", type=int, default=loadtest.OPS_PER_WORKER)
+    p.add_argument("--sizes", help='size:weight list, e.g. "2k:70,64k:25,1m:5"')
+    p.add_argument(
+        "--mix", help='op:weight list, e.g. "smtp:80,imap:20" or "smtp:50,list:50"'
+    )
+    p.add_argument(
+        "--ingest",
+        type=int,
+        metavar="N",
+        help="instead: time delivering a burst of N messages until IMAP sees them",
+    )
+    p.add_argument(
+        "--ingest-concurrency", type=int, default=loadtest.INGEST_CONCURRENCY
+    )
+    p.add_argument(
+        "--keep", action="store_true", help="leave the test messages in the mailbox"
+    )
+    p.add_argument("--json", action="store_true", help="machine-readable output")
+    p.set_defaults(func=cmd_loadtest)
+
+    for name, func, text in (
+        ("backup", cmd_backup, "incremental Maildir backup"),
+        ("restore", cmd_restore, "restore a Maildir backup"),
+    ):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("--instance", help="instance name (see `riamumail instances`)")
+        p.add_argument("--container", help="default: the instance's container")
+        p.add_argument("--user", help="mailbox owner (default: configured user)")
+        p.add_argument("--store", help="default: the instance's backup directory")
+        if name == "restore":
+            p.add_argument("--snapshot", help="snapshot name (default: latest)")
+            p.add_argument("--list", action="store_true", help="list snapshots")
+        p.set_defaults(func=func)
+
+    p = sub.add_parser("import", help="import mbox, Maildir or .eml mail")
+    p.add_argument("source", help="mbox file, Maildir directory or .eml directory")
+    p.add_argument("--instance", help="instance name (see `riamumail instances`)")
+    p.add_argument("--container", help="default: the instance's container")
+    p.add_argument("--user", help="mailbox owner (default: configured user)")
+    p.add_argument("--workers", type=int, default=4)
+    p.add_argument("--index", help="default: the instance's import index")
+    p.set_defaults(func=cmd_import)
+
+    p = sub.add_parser("search", help="full-text search of the mailbox")
+    p.add_argument("query", nargs="+", help='words, "phrases", from:/to:/subject:')
+    p.add_argument("--instance", help="instance name (see `riamumail instances`)")
+    p.add_argument("--container", help="default: the instance's container")
+    p.add_argument("--user", help="mailbox owner (default: configured user)")
+    p.add_argument("--index", help="default: the instance's search index")
+    p.add_argument(
+        "--no-update", action="store_true", help="search without indexing new mail"
+    )
+    p.add_argument("--limit", type=int, default=search.LIMIT)
+    p.add_argument("--json", action="store_true", help="machine-readable output")
+    p.set_defaults(func=cmd_search)
+
+    p = sub.add_parser("instances", help="list or add mail server instances")
+    p.add_argument("--add", metavar="DOMAIN", help="add an instance for DOMAIN")
+    p.set_defaults(func=cmd_instances)
+
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import logging
+from pathlib import Path
+
+CONFIG_PATH = Path.home() / ".riamumail"
+CONFIG_FILE = CONFIG_PATH / "config.json"
+LOG_FILE = CONFIG_PATH / "app.log"
+
+DOCKER_IMAGE = "mailexp:latest"
+DOCKER_CONTAINER = "mailexp"
+
+
+def load_config(path=CONFIG_FILE):
+    if not path.exists():
+        return {}
+
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception:
+        logging.exception("Failed to load config")
+        return {}
+
+
+def save_config(data, path=CONFIG_FILE):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(data, f)
+        logging.info("Config saved")
+    except Exception:
+        logging.exception("Failed to save config")
+
+
+def user_config(config):
+    """(username, domain, password, email) with the app's defaults."""
+    username = config.get("username", "umair")
+    domain = config.get("domain", "riamuapp.com")
+    password = config.get("password", "test")
+    email = f"{username}@{domain}"
+    return username, domain, password, email
+
+
+def build_subprocess_env():
+    env = os.environ.copy()
+
+    extra_paths = []
+
+    if sys.platform == "darwin":
+        extra_paths = [
+            "/opt/homebrew/bin",
+            "/usr/local/bin",
+            "/usr/bin",
+        ]
+    elif sys.platform == "linux":
+        extra_paths = [
+            "/usr/local/bin",
+            "/usr/bin",
+            "/bin",
+        ]
+    elif sys.platform == "win32":
+        extra_paths = [
+            r"C:\Program Files\Docker\Docker\resources\bin",
+            r"C:\Program Files\Git\bin",
+        ]
+
+    existing = env.get("PATH", "")
+    env["PATH"] = os.pathsep.join(extra_paths + [existing])
+
+    return env
+
+
+SUBPROCESS_ENV = build_subprocess_env()
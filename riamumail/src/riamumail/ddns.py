@@ -0,0 +1,290 @@
+import json
+import time
+import random
+import logging
+import threading
+import collections
+
+log = logging.getLogger("riamumail.ddns")
+
+POLL_INTERVAL = 60
+MIN_INTERVAL = 60
+RETRY_BASE = 5
+RETRY_MAX = 5 * 60
+
+
+class DynamicDNSUpdater:
+    """
+    Keeps the reserved domain pointing at the current public IP.
+
+    `push(domain, ip)` is only called when the observed address differs
+    from the last one the API acknowledged (persisted in `state_file`, so
+    restarts don't cause redundant updates). Pushes are at least
+    `min_interval` apart, failures are retried with jittered exponential
+    backoff, and rapid changes collapse into one update for the latest IP.
+
+    `push` returns None when the update was queued for delivery elsewhere
+    (the API outbox); the updater then leaves retrying to the queue until
+    `delivered` or `dropped` reports the outcome.
+    """
+
+    def __init__(
+        self,
+        push,
+        state_file,
+        poll=None,
+        poll_interval=POLL_INTERVAL,
+        min_interval=MIN_INTERVAL,
+        retry_base=RETRY_BASE,
+        retry_max=RETRY_MAX,
+        clock=time.monotonic,
+        rng=random.random,
+    ):
+        self.push = push
+        self.state_file = state_file
+        self.poll = poll
+        self.poll_interval = poll_interval
+        self.min_interval = min_interval
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.clock = clock
+        self.rng = rng
+
+        state = self.load_state()
+        self.domain = state.get("domain")
+        self.pushed_ip = state.get("ip")
+        self.desired_ip = None
+        self.queued_ip = None
+
+        self.stale_since = None
+        self.stale_history = collections.deque(maxlen=20)
+        self.pushes = 0
+        self.failures = 0
+
+        self.attempt = 0
+        self.next_push = 0
+        self.next_poll = 0
+
+        self.cond = threading.Condition()
+        self.thread = None
+        self.running = False
+
+    # ---------- state ----------
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            log.exception("Failed to load DDNS state")
+            return {}
+
+    def save_state(self):
+        try:
+            with open(self.state_file, "w") as f:
+                json.dump({"domain": self.domain, "ip": self.pushed_ip}, f)
+        except Exception:
+            log.exception("Failed to save DDNS state")
+
+    # ---------- inputs ----------
+
+    def observe(self, ip):
+        """Record the current public IP (safe to call from any thread)."""
+        if not ip:
+            return
+        with self.cond:
+            self.desired_ip = ip
+            if self.is_stale() and self.stale_since is None:
+                self.stale_since = self.clock()
+                log.info(f"{self.domain} points at {self.pushed_ip}, public IP is {ip}")
+            elif not self.is_stale():
+                self.stale_since = None
+            self.cond.notify()
+
+    def mark_pushed(self, domain, ip):
+        """The domain was (re)reserved elsewhere with `ip`."""
+        with self.cond:
+            if domain != self.domain:
+                self.attempt = 0
+                self.queued_ip = None
+            self.domain = domain
+            self.pushed_ip = ip
+            self.desired_ip = self.desired_ip or ip
+            self.stale_since = self.clock() if self.is_stale() else None
+            self.next_push = self.clock() + self.min_interval
+            self.save_state()
+            self.cond.notify()
+
+    def adopt(self, domain):
+        """
+        Follow `domain`, reserved before this updater kept state. The
+        address it points at is unknown, so the next observed IP is pushed.
+        """
+        with self.cond:
+            if self.domain:
+                return
+            self.domain = domain
+            if self.is_stale():
+                self.stale_since = self.clock()
+            self.save_state()
+            self.cond.notify()
+
+    def clear(self, domain):
+        """
+        Stop following `domain`, which is about to be released, so no
+        update re-reserves it. Returns what `restore` needs to undo this,
+        or None if the updater was not following it.
+        """
+        with self.cond:
+            if domain != self.domain:
+                return None
+            previous = (self.domain, self.pushed_ip)
+            self.domain = self.pushed_ip = self.queued_ip = None
+            self.stale_since = None
+            self.attempt = 0
+            self.save_state()
+            return previous
+
+    def restore(self, previous):
+        """Follow the domain given up by `clear` again, e.g. if its release failed."""
+        domain, ip = previous
+        if ip:
+            self.mark_pushed(domain, ip)
+        else:
+            self.adopt(domain)
+
+    def delivered(self, domain, ip):
+        """A queued update of `domain` to `ip` reached the API."""
+        with self.cond:
+            if domain != self.domain:
+                return
+            if self.queued_ip == ip:
+                self.queued_ip = None
+            if ip == self.pushed_ip:
+                return
+            self.pushes += 1
+            self.attempt = 0
+            self.pushed_ip = ip
+            now = self.clock()
+            if self.stale_since is not None:
+                self.stale_history.append(now - self.stale_since)
+            self.stale_since = now if self.is_stale() else None
+            self.save_state()
+            log.info(f"{domain} now points at {ip} (delivered from the outbox)")
+            self.cond.notify()
+
+    def dropped(self, domain, ip):
+        """A queued update was given up on; retry it with backoff."""
+        with self.cond:
+            if domain != self.domain or self.queued_ip != ip:
+                return
+            self.queued_ip = None
+            self.failures += 1
+            self.attempt += 1
+            self.next_push = self.clock() + self.backoff()
+            self.cond.notify()
+
+    def backoff(self):
+        delay = min(self.retry_base * 2 ** (self.attempt - 1), self.retry_max)
+        return delay * (0.5 + self.rng())
+
+    def is_stale(self):
+        return bool(
+            self.domain and self.desired_ip and self.desired_ip != self.pushed_ip
+        )
+
+    # ---------- scheduling ----------
+
+    def step(self):
+        """Do whatever is due now and return seconds until the next step."""
+        now = self.clock()
+
+        if self.poll and now >= self.next_poll:
+            self.next_poll = now + self.poll_interval
+            try:
+                self.observe(self.poll())
+            except Exception:
+                log.exception("Public IP poll failed")
+
+        with self.cond:
+            # An update already in the outbox is retried there, not here
+            due = (
+                self.is_stale()
+                and now >= self.next_push
+                and self.desired_ip != self.queued_ip
+            )
+            domain, ip = self.domain, self.desired_ip
+
+        if due:
+            self.try_push(domain, ip)
+
+        with self.cond:
+            waits = []
+            if self.poll:
+                waits.append(self.next_poll - self.clock())
+            if self.is_stale() and self.desired_ip != self.queued_ip:
+                waits.append(self.next_push - self.clock())
+            return max(0, min(waits)) if waits else None
+
+    def try_push(self, domain, ip):
+        try:
+            ok = self.push(domain, ip)
+        except Exception:
+            log.exception(f"DDNS update for {domain} crashed")
+            ok = False
+
+        now = self.clock()
+        with self.cond:
+            if ok is None:
+                if ip != self.pushed_ip:
+                    self.queued_ip = ip
+                self.next_push = now + self.min_interval
+                log.info(f"DDNS update for {domain} queued in the outbox")
+            elif ok:
+                self.pushes += 1
+                self.attempt = 0
+                self.pushed_ip = ip
+                self.next_push = now + self.min_interval
+                if self.stale_since is not None:
+                    stale = now - self.stale_since
+                    self.stale_history.append(stale)
+                    log.info(f"{domain} now points at {ip} (stale for {stale:.0f}s)")
+                self.stale_since = None if not self.is_stale() else now
+                self.save_state()
+            else:
+                self.failures += 1
+                self.attempt += 1
+                delay = self.backoff()
+                self.next_push = now + delay
+                log.warning(
+                    f"DDNS update for {domain} failed, retrying in {delay:.0f}s"
+                )
+
+    # ---------- thread ----------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(
+            target=self._run, name="riamumail-ddns", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def _run(self):
+        while self.running:
+            try:
+                wait = self.step()
+            except Exception:
+                log.exception("DDNS step failed")
+                wait = self.poll_interval
+            with self.cond:
+                if self.running:
+                    self.cond.wait(wait)
@@ -0,0 +1,55 @@
+import logging
+
+log = logging.getLogger("riamumail.delivery")
+
+QUEUE_DIRECTORY = "/var/spool/postfix"
+# Relative to Postfix's queue directory, so it works chrooted or not
+LMTP_SOCKET = "private/dovecot-lmtp"
+
+# Cache fields IMAP clients ask for when opening a folder, written as
+# mail arrives instead of on the first login afterwards
+CACHE_FIELDS = "flags date.received size.virtual imap.envelope"
+
+
+def postfix_settings(profile):
+    """
+    main.cf parameters handing local mail to Dovecot LMTP. Aliases and
+    .forward files are still resolved by local(8) first.
+    """
+    return {
+        "mailbox_transport": f"lmtp:unix:{LMTP_SOCKET}",
+        "lmtp_destination_concurrency_limit": profile["lmtp_processes"],
+        # Deliveries to one mailbox no longer need Postfix's mailbox lock
+        "local_destination_concurrency_limit": profile["lmtp_processes"],
+    }
+
+
+def postconf_command(profile):
+    main = " ".join(f"'{k}={v}'" for k, v in postfix_settings(profile).items())
+    return f"postconf -e {main}"
+
+
+def dovecot_config(profile):
+    """Dovecot's LMTP service, included from dovecot.conf."""
+    return f"""# Generated by Riamu Mail: Postfix delivers through LMTP
+protocols = $protocols lmtp
+
+service lmtp {{
+  process_limit = {profile["lmtp_processes"]}
+  unix_listener {QUEUE_DIRECTORY}/{LMTP_SOCKET} {{
+    mode = 0600
+    user = postfix
+    group = postfix
+  }}
+}}
+
+protocol lmtp {{
+  # Postfix passes user@hostname; users are looked up by name
+  auth_username_format = %Ln
+  mail_always_cache_fields = {CACHE_FIELDS}
+}}
+"""
+
+
+def describe(profile):
+    return f"LMTP, {profile['lmtp_processes']} processes"
@@ -0,0 +1,157 @@
+import random
+import socket
+import logging
+import concurrent.futures
+
+log = logging.getLogger("riamumail.health")
+
+MIN_INTERVAL = 15
+MAX_INTERVAL = 15 * 60
+FAILING_MAX_INTERVAL = 2 * 60
+BACKOFF_FACTOR = 2
+JITTER = 0.2
+
+
+class AdaptiveSchedule:
+    """
+    Probe interval that resets to min_interval on any change and grows by
+    `factor` while results stay the same. While something is failing the
+    interval is capped lower so a recovery is noticed sooner.
+    """
+
+    def __init__(
+        self,
+        min_interval=MIN_INTERVAL,
+        max_interval=MAX_INTERVAL,
+        failing_max_interval=FAILING_MAX_INTERVAL,
+        factor=BACKOFF_FACTOR,
+        jitter=JITTER,
+        rng=random.random,
+    ):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.failing_max_interval = failing_max_interval
+        self.factor = factor
+        self.jitter = jitter
+        self.rng = rng
+        self.interval = min_interval
+
+    def reset(self):
+        self.interval = self.min_interval
+
+    def update(self, changed, failing):
+        if changed:
+            self.interval = self.min_interval
+        else:
+            cap = self.failing_max_interval if failing else self.max_interval
+            self.interval = min(self.interval * self.factor, cap)
+        return self.interval
+
+    def next_delay(self):
+        # +/- jitter so several probes never line up with each other
+        spread = self.interval * self.jitter
+        return self.interval - spread + 2 * spread * self.rng()
+
+
+def port_ready(port, greeting, host="127.0.0.1", timeout=3):
+    """True if something accepts on host:port and greets with `greeting`."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            return sock.recv(128).startswith(greeting)
+    except OSError:
+        return False
+
+
+class HealthMonitor:
+    """
+    Re-runs health probes on a jittered timer on the app's event loop.
+
+    `probe` is called off the loop with the arguments returned by
+    `snapshot` (read on the loop, so it may touch widgets) and returns a
+    dict of name -> bool, where None means "not checked this time" (so a
+    stale result is not kept). `on_result` is called on the loop with the
+    full results and the set of names whose value changed.
+    """
+
+    def __init__(self, loop, snapshot, probe, on_result, schedule=None, executor=None):
+        self.loop = loop
+        self.snapshot = snapshot
+        self.probe = probe
+        self.on_result = on_result
+        self.schedule = schedule or AdaptiveSchedule()
+        self.executor = executor or concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="riamumail-health"
+        )
+        self.last = {}
+        self.handle = None
+        self.pending = None
+        self.running = False
+
+    def start(self, delay=None):
+        self.running = True
+        self._schedule(self.schedule.next_delay() if delay is None else delay)
+
+    def stop(self):
+        self.running = False
+        if self.handle:
+            self.handle.cancel()
+            self.handle = None
+
+    def poke(self):
+        """Something changed (user action, new config); probe again soon."""
+        self.schedule.reset()
+        if self.running and not self.pending:
+            self._schedule(self.schedule.next_delay())
+
+    def _schedule(self, delay):
+        if self.handle:
+            self.handle.cancel()
+        self.handle = self.loop.call_later(delay, self._tick)
+
+    def _tick(self):
+        self.handle = None
+        if not self.running or self.pending:
+            return
+        try:
+            args = self.snapshot()
+        except Exception:
+            log.exception("Health snapshot failed")
+            self._schedule(self.schedule.next_delay())
+            return
+        self.pending = self.loop.run_in_executor(self.executor, self._probe, args)
+        self.pending.add_done_callback(self._done)
+
+    def _probe(self, args):
+        try:
+            return self.probe(*args)
+        except Exception:
+            log.exception("Health probe crashed")
+            return {}
+
+    def _done(self, future):
+        self.pending = None
+        if future.cancelled():
+            # The loop or executor is shutting down
+            return
+        results = future.result()
+
+        changed = {k for k, v in results.items() if self.last.get(k) != v}
+        failing = any(v is False for v in results.values())
+        self.last.update(results)
+
+        interval = self.schedule.update(bool(changed), failing)
+        if changed:
+            log.info(
+                f"Health changed: {sorted(changed)} -> next probe in ~{interval:.0f}s"
+            )
+        else:
+            log.debug(f"Health stable, next probe in ~{interval:.0f}s")
+
+        try:
+            self.on_result(results, changed)
+        except Exception:
+            log.exception("Health result handler failed")
+
+        if self.running:
+            self._schedule(self.schedule.next_delay())
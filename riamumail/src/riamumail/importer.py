@@ -0,0 +1,318 @@
+import io
+import os
+import re
+import time
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+import concurrent.futures
+from pathlib import Path
+
+log = logging.getLogger("riamumail.importer")
+
+BATCH_MESSAGES = 500
+BATCH_BYTES = 32 * 1024 * 1024
+WORKERS = 4
+
+MESSAGE_ID = re.compile(rb"^message-id:[ \t]*(<[^>\r\n]+>)", re.I | re.M)
+STATUS = re.compile(rb"^status:[ \t]*(\S+)", re.I | re.M)
+FROM_QUOTED = re.compile(rb"^>+From ")
+
+
+def header_block(data):
+    end = data.find(b"\n\n")
+    crlf = data.find(b"\r\n\r\n")
+    if crlf != -1 and (end == -1 or crlf < end):
+        end = crlf
+    return data if end == -1 else data[:end]
+
+
+def message_id(data):
+    match = MESSAGE_ID.search(header_block(data))
+    return match.group(1).decode("ascii", "replace").lower() if match else None
+
+
+def content_hash(data):
+    return hashlib.sha256(data.replace(b"\r\n", b"\n")).hexdigest()
+
+
+# ------------------ SOURCES ------------------
+#
+# Each source yields (folder, flags, data) one message at a time; folder is
+# "" for INBOX or a Maildir++ name such as ".Sent".
+
+
+def read_mbox(path):
+    """Split an mbox file on "From " lines without loading it whole."""
+
+    def finish(lines):
+        data = b"".join(lines)
+        status = STATUS.search(header_block(data))
+        seen = status and b"R" in status.group(1)
+        return "", "S" if seen else "", data
+
+    lines = []
+    previous_blank = True
+    with open(path, "rb") as f:
+        for line in f:
+            if line.startswith(b"From ") and previous_blank:
+                if lines:
+                    # The blank line before "From " belongs to the mbox format
+                    if lines[-1].strip() == b"":
+                        lines.pop()
+                    yield finish(lines)
+                lines = []
+                previous_blank = False
+                continue
+            if FROM_QUOTED.match(line):
+                line = line[1:]
+            lines.append(line)
+            previous_blank = line.strip() == b""
+    if lines:
+        if lines[-1].strip() == b"":
+            lines.pop()
+        yield finish(lines)
+
+
+def read_maildir(root):
+    """Messages of a Maildir tree, keeping Maildir++ subfolders and flags."""
+    root = Path(root)
+    folders = [("", root)] + sorted(
+        (p.name, p) for p in root.iterdir() if p.is_dir() and p.name.startswith(".")
+    )
+    for folder, base in folders:
+        for sub in ("cur", "new"):
+            directory = base / sub
+            if not directory.is_dir():
+                continue
+            for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+                if not entry.is_file():
+                    continue
+                _, _, flags = entry.name.partition(":2,")
+                with open(entry.path, "rb") as f:
+                    yield folder, flags, f.read()
+
+
+def read_eml_dir(root):
+    for path in sorted(Path(root).rglob("*.eml")):
+        yield "", "", path.read_bytes()
+
+
+def open_source(path):
+    """Pick a reader for an mbox file, .eml file/directory or Maildir tree."""
+    path = Path(path)
+    if path.is_file():
+        if path.suffix.lower() == ".eml":
+            return iter([("", "", path.read_bytes())])
+        return read_mbox(path)
+    if (path / "cur").is_dir() or (path / "new").is_dir():
+        return read_maildir(path)
+    if any(path.rglob("*.eml")):
+        return read_eml_dir(path)
+
+    mboxes = [p for p in sorted(path.rglob("*")) if p.is_file() and is_mbox(p)]
+    if mboxes:
+        return (message for mbox in mboxes for message in read_mbox(mbox))
+    raise ValueError(f"No mbox, Maildir or .eml messages found in {path}")
+
+
+def is_mbox(path):
+    try:
+        with open(path, "rb") as f:
+            return f.read(5) == b"From "
+    except OSError:
+        return False
+
+
+def percent_read(stats, total_bytes):
+    """How far through the source an import is, or None without a size."""
+    if not total_bytes:
+        return None
+    return min(100, stats["read"] * 100 // total_bytes)
+
+
+def source_size(path):
+    path = Path(path)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+# ------------------ DEDUPLICATION ------------------
+
+
+class ImportIndex:
+    """Message-IDs and content hashes already imported, kept in SQLite."""
+
+    def __init__(self, path):
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock:
+            self.db.execute("CREATE TABLE IF NOT EXISTS ids (id TEXT PRIMARY KEY)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS hashes (h TEXT PRIMARY KEY)")
+            self.db.commit()
+
+    def seen(self, msgid, digest):
+        with self.lock:
+            if (
+                msgid
+                and self.db.execute(
+                    "SELECT 1 FROM ids WHERE id = ?", (msgid,)
+                ).fetchone()
+            ):
+                return True
+            return bool(
+                self.db.execute(
+                    "SELECT 1 FROM hashes WHERE h = ?", (digest,)
+                ).fetchone()
+            )
+
+    def add_many(self, keys):
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO ids VALUES (?)", [(m,) for m, _ in keys if m]
+            )
+            self.db.executemany(
+                "INSERT OR IGNORE INTO hashes VALUES (?)", [(d,) for _, d in keys]
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+# ------------------ IMPORT ------------------
+
+
+class Importer:
+    """
+    Streams messages from a source into a Maildir target (LocalMaildir or
+    ContainerMaildir) in batches written by a small worker pool. At most
+    2 * workers batches are in memory at once, whatever the archive size.
+    """
+
+    def __init__(
+        self,
+        target,
+        index,
+        workers=WORKERS,
+        batch_messages=BATCH_MESSAGES,
+        batch_bytes=BATCH_BYTES,
+        progress=None,
+    ):
+        self.target = target
+        self.index = index
+        self.workers = workers
+        self.batch_messages = batch_messages
+        self.batch_bytes = batch_bytes
+        self.progress = progress
+        self.hostname = socket.gethostname().replace("/", "_").replace(":", "_")
+        self.run_id = os.urandom(4).hex()
+        self.counter = 0
+
+        # "read" counts every message taken from the source, duplicates
+        # included, so progress follows the source rather than the writes
+        self.stats = {
+            "imported": 0,
+            "duplicates": 0,
+            "failed": 0,
+            "bytes": 0,
+            "read": 0,
+        }
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def filename(self, folder, flags):
+        self.counter += 1
+        unique = (
+            f"{int(time.time())}.M{self.counter}R{self.run_id}P{os.getpid()}"
+            f".{self.hostname}"
+        )
+        base = f"Maildir/{folder}/cur" if folder else "Maildir/cur"
+        return f"{base}/{unique}:2,{flags}"
+
+    def run(self, messages, total_bytes=None):
+        started = time.monotonic()
+        slots = threading.BoundedSemaphore(self.workers * 2)
+        # Keys of messages queued but not yet committed to the index
+        pending_ids, pending_hashes = set(), set()
+
+        def write(batch):
+            try:
+                with self.target.writer() as writer:
+                    for path, data, _ in batch:
+                        writer.add(path, io.BytesIO(data), len(data))
+                self.index.add_many([key for _, _, key in batch])
+                with self.lock:
+                    self.stats["imported"] += len(batch)
+                    self.stats["bytes"] += sum(len(d) for _, d, _ in batch)
+            except Exception:
+                log.exception(f"Import batch of {len(batch)} messages failed")
+                with self.lock:
+                    self.stats["failed"] += len(batch)
+            finally:
+                with self.lock:
+                    pending_ids.difference_update(k[0] for _, _, k in batch)
+                    pending_hashes.difference_update(k[1] for _, _, k in batch)
+                slots.release()
+                self.report(total_bytes)
+
+        with concurrent.futures.ThreadPoolExecutor(
+            self.workers, thread_name_prefix="riamumail-import"
+        ) as pool:
+            batch, size = [], 0
+            for count, (folder, flags, data) in enumerate(messages, 1):
+                if self.cancelled.is_set():
+                    break
+                with self.lock:
+                    self.stats["read"] += len(data)
+                if count % self.batch_messages == 0:
+                    # Also moves on while only duplicates are being skipped
+                    self.report(total_bytes)
+                msgid, digest = key = (message_id(data), content_hash(data))
+                with self.lock:
+                    duplicate = msgid in pending_ids or digest in pending_hashes
+                if duplicate or self.index.seen(msgid, digest):
+                    with self.lock:
+                        self.stats["duplicates"] += 1
+                    continue
+                with self.lock:
+                    if msgid:
+                        pending_ids.add(msgid)
+                    pending_hashes.add(digest)
+
+                batch.append((self.filename(folder, flags), data, key))
+                size += len(data)
+                if len(batch) >= self.batch_messages or size >= self.batch_bytes:
+                    slots.acquire()
+                    pool.submit(write, batch)
+                    batch, size = [], 0
+
+            if batch:
+                slots.acquire()
+                pool.submit(write, batch)
+
+        self.report(total_bytes)
+        self.stats["elapsed"] = round(time.monotonic() - started, 3)
+        log.info(f"Import finished: {self.stats}")
+        return self.stats
+
+    def report(self, total_bytes):
+        if self.progress:
+            with self.lock:
+                stats = dict(self.stats)
+            self.progress(stats, total_bytes)
+
+
+def import_mail(path, target, index_path, workers=WORKERS, progress=None):
+    index = ImportIndex(index_path)
+    try:
+        importer = Importer(target, index, workers=workers, progress=progress)
+        return importer.run(open_source(path), source_size(path))
+    finally:
+        index.close()
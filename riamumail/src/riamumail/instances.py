@@ -0,0 +1,256 @@
+import re
+import socket
+import logging
+
+from riamumail import config as riamu_config
+from riamumail import journal
+from riamumail.config import CONFIG_PATH, CONFIG_FILE, DOCKER_IMAGE, DOCKER_CONTAINER
+
+log = logging.getLogger("riamumail.instances")
+
+INSTANCES_PATH = CONFIG_PATH / "instances"
+# App-wide state, kept out of every instance's config.json
+STATE_FILE = CONFIG_PATH / "state.json"
+DEFAULT = "default"
+
+# Shared by every instance; per-instance images only add config on top
+BASE_IMAGE = "mailexp-base:latest"
+
+# What a new instance takes from the settings it is created with; the
+# rest (build results, relay, app state...) belongs to one instance
+SHARED_SETTINGS = (
+    "username",
+    "familyname",
+    "password",
+    "tuning_preset",
+    "mail_format",
+    "mail_compression",
+)
+
+SMTP_PORT = 36245
+IMAP_PORT = 10143
+PORT_SEARCH = 200
+
+
+class Instance:
+    """
+    One mail server on this host: its config file, container, image, data
+    volume and host ports. The default instance keeps the original names
+    (~/.riamumail/config.json, "mailexp", ports 36245/10143) so existing
+    setups carry on unchanged; others live in ~/.riamumail/instances/<slug>/.
+    """
+
+    def __init__(self, slug):
+        self.slug = slug
+        self.default = slug == DEFAULT
+        if self.default:
+            self.path = CONFIG_PATH
+            self.config_file = CONFIG_FILE
+            self.container = DOCKER_CONTAINER
+            self.image = DOCKER_IMAGE
+            self.volume = None
+        else:
+            self.path = INSTANCES_PATH / slug
+            self.config_file = self.path / "config.json"
+            self.container = f"{DOCKER_CONTAINER}-{slug}"
+            self.image = f"{DOCKER_CONTAINER}-{slug}:latest"
+            self.volume = f"{self.container}-data"
+
+    def __repr__(self):
+        return f"<Instance {self.slug}>"
+
+    def __eq__(self, other):
+        return isinstance(other, Instance) and other.slug == self.slug
+
+    def __hash__(self):
+        return hash(self.slug)
+
+    def exists(self):
+        return self.config_file.exists()
+
+    def load_config(self):
+        return riamu_config.load_config(self.config_file)
+
+    def save_config(self, data):
+        riamu_config.save_config(data, self.config_file)
+
+    def state_path(self, name):
+        """Where this instance keeps a state file or directory such as "ddns.json"."""
+        return self.path / name
+
+    @property
+    def build_path(self):
+        return self.state_path("build")
+
+    @property
+    def domain(self):
+        return self.load_config().get("domain", "")
+
+    @property
+    def label(self):
+        return self.domain or self.slug
+
+    @property
+    def smtp_port(self):
+        return self.load_config().get("ports", {}).get("smtp", SMTP_PORT)
+
+    @property
+    def imap_port(self):
+        return self.load_config().get("ports", {}).get("imap", IMAP_PORT)
+
+    def docker_run_args(self, hostname):
+        """Arguments for `docker run` specific to this instance."""
+        args = [
+            "--name",
+            self.container,
+            "--hostname",
+            hostname,
+            "-p",
+            f"{self.smtp_port}:{SMTP_PORT}",
+            "-p",
+            f"{self.imap_port}:143",
+        ]
+        if self.volume:
+            args += ["-v", f"{self.volume}:/home"]
+        return args
+
+
+def slugify(domain):
+    slug = re.sub(r"[^a-z0-9]+", "-", domain.lower()).strip("-")
+    return slug or "mail"
+
+
+def list_instances():
+    """The default instance (if set up) followed by the others by name."""
+    found = [Instance(DEFAULT)] if CONFIG_FILE.exists() else []
+    if INSTANCES_PATH.is_dir():
+        found += [
+            Instance(p.name)
+            for p in sorted(INSTANCES_PATH.iterdir())
+            if (p / "config.json").exists()
+        ]
+    return found
+
+
+def get(slug=None):
+    return Instance(slug or DEFAULT)
+
+
+def current():
+    """The instance selected in the app, or the default one."""
+    state = riamu_config.load_config(STATE_FILE)
+    slug = state.get("current_instance")
+    if not slug:
+        # Older versions kept the choice in the default instance's config,
+        # creating it when that instance was never set up
+        legacy = riamu_config.load_config(CONFIG_FILE)
+        slug = legacy.get("current_instance")
+        if slug and list(legacy) == ["current_instance"]:
+            set_current(get(slug))
+            CONFIG_FILE.unlink()
+    if slug and slug != DEFAULT and not get(slug).exists():
+        log.warning(f"Selected instance {slug} no longer exists")
+        slug = None
+    return get(slug)
+
+
+def set_current(instance):
+    state = riamu_config.load_config(STATE_FILE)
+    state["current_instance"] = instance.slug
+    riamu_config.save_config(state, STATE_FILE)
+
+
+def start_digest(instance, steps):
+    """
+    Inputs of the instance's "start" step given its journal `steps`: its run
+    arguments and the build it runs, so a rebuilt image or changed ports
+    invalidate the container.
+    """
+    return journal.input_hash(
+        instance.docker_run_args(instance.domain), steps.get("build")
+    )
+
+
+def container_action(state, started):
+    """
+    What to do with an instance's existing container before starting it.
+    `state` is its Docker state (None if there is none) and `started`
+    whether the journal's "start" step still matches the current inputs.
+
+    - None: there is no container, run one
+    - "remove": left "created" by an interrupted `docker run`; it never ran
+    - "start": stopped (e.g. by a reboot) but current, start it again
+    - "recreate": stopped and stale; back up its mail and replace it
+    """
+    if state is None:
+        return None
+    if state == "created":
+        return "remove"
+    return "start" if started else "recreate"
+
+
+def port_free(port, host="127.0.0.1"):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        try:
+            sock.bind((host, port))
+            return True
+        except OSError:
+            return False
+
+
+def allocate_ports(taken, is_free=port_free):
+    """
+    Next SMTP/IMAP host port pair after the defaults that no other
+    instance uses and nothing else on this host is listening on.
+    """
+
+    def pick(start):
+        for port in range(start, start + PORT_SEARCH):
+            if port not in taken and is_free(port):
+                taken.add(port)
+                return port
+        raise RuntimeError(f"No free port between {start} and {start + PORT_SEARCH}")
+
+    return {"smtp": pick(SMTP_PORT + 1), "imap": pick(IMAP_PORT + 1)}
+
+
+def create_instance(domain, settings=None, is_free=port_free, reserved=True):
+    """
+    Set up a new instance for `domain`, copying the SHARED_SETTINGS from
+    `settings` (user, password...). With `reserved=False` the domain is
+    flagged for the app to reserve, for callers that cannot do it.
+    """
+    existing = list_instances()
+    for instance in existing:
+        if instance.domain == domain:
+            raise ValueError(f"{domain} already has an instance")
+
+    slug = base = slugify(domain)
+    n = 1
+    while slug == DEFAULT or get(slug).exists():
+        n += 1
+        slug = f"{base}-{n}"
+
+    taken = set()
+    for instance in existing:
+        taken.update((instance.smtp_port, instance.imap_port))
+
+    instance = Instance(slug)
+    config = {k: v for k, v in (settings or {}).items() if k in SHARED_SETTINGS}
+    config.update({"domain": domain, "ports": allocate_ports(taken, is_free)})
+    if not reserved:
+        config["reserve_pending"] = True
+    instance.save_config(config)
+    log.info(f"Created instance {slug} for {domain}: {config['ports']}")
+    return instance
+
+
+def pending_reservations():
+    """Instances whose domain was never reserved (added from the command line)."""
+    return [i for i in list_instances() if i.load_config().get("reserve_pending")]
+
+
+def mark_reserved(instance):
+    config = instance.load_config()
+    if config.pop("reserve_pending", None):
+        instance.save_config(config)
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+
+import requests
+
+log = logging.getLogger("riamumail.journal")
+
+CHUNK_SIZE = 64 * 1024
+TIMEOUT = 30
+
+
+def input_hash(*parts):
+    """Stable hash of JSON-serialisable inputs."""
+    data = json.dumps(parts, sort_keys=True, default=str).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def tree_hash(root):
+    """Hash of every file's relative path and contents under `root`."""
+    root = Path(root)
+    digest = hashlib.sha256()
+    for path in sorted(p for p in root.rglob("*") if p.is_file()):
+        digest.update(str(path.relative_to(root)).replace(os.sep, "/").encode())
+        digest.update(b"\0")
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class Journal:
+    """
+    Completed steps of a long setup flow and the hash of the inputs each
+    one ran with, persisted after every step. `step()` skips a step whose
+    inputs are unchanged since it last completed, so after a crash or a
+    failed build the flow resumes at the first unfinished step.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.steps = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("steps", {})
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            log.exception("Failed to load step journal")
+            return {}
+
+    def save(self):
+        # Callers hold self.lock
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with open(tmp, "w") as f:
+            json.dump({"steps": self.steps}, f, indent=2)
+        os.replace(tmp, self.path)
+
+    def done(self, name, digest):
+        with self.lock:
+            entry = self.steps.get(name)
+        return entry is not None and entry["inputs"] == digest
+
+    def complete(self, name, digest):
+        with self.lock:
+            self.steps[name] = {"inputs": digest, "completed": time.time()}
+            self.save()
+
+    def forget(self, *names):
+        with self.lock:
+            for name in names:
+                self.steps.pop(name, None)
+            self.save()
+
+    def step(self, name, digest, fn, still_valid=None):
+        """
+        Run `fn` unless `name` already completed with the same inputs and
+        `still_valid()` (e.g. "the image still exists") agrees. Returns
+        True if the step ran.
+        """
+        if self.done(name, digest) and (still_valid is None or still_valid()):
+            log.info(f"Skipping {name}: already done with the same inputs")
+            return False
+        # Until it finishes, a step counts as not done even if it ran before
+        self.forget(name)
+        fn()
+        self.complete(name, digest)
+        return True
+
+
+def download(url, directory, journal=None, session=requests, timeout=TIMEOUT):
+    """
+    Download `url` into `directory`, resuming a partial download with an
+    HTTP Range request instead of starting over. A finished download is
+    recorded in `journal` and reused as long as the file is still there.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    name = os.path.basename(url.split("?")[0]) or "download"
+    dest = directory / f"{hashlib.sha256(url.encode()).hexdigest()[:12]}-{name}"
+    partial = dest.with_name(dest.name + ".part")
+    key = f"download:{url}"
+
+    if journal and journal.done(key, input_hash(url)) and dest.exists():
+        log.info(f"Reusing earlier download of {url}")
+        return str(dest)
+
+    offset = partial.stat().st_size if partial.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with session.get(url, stream=True, timeout=timeout, headers=headers) as r:
+        if r.status_code == 416:
+            # Already have every byte
+            pass
+        else:
+            r.raise_for_status()
+            if offset and r.status_code != 206:
+                log.info(f"{url} does not support resuming; starting over")
+                offset = 0
+            elif offset:
+                log.info(f"Resuming {url} at {offset} bytes")
+            with open(partial, "ab" if offset else "wb") as f:
+                for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                    f.write(chunk)
+
+    os.replace(partial, dest)
+    if journal:
+        journal.complete(key, input_hash(url))
+    return str(dest)
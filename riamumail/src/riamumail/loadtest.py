@@ -0,0 +1,496 @@
+import re
+import time
+import random
+import imaplib
+import smtplib
+import logging
+import threading
+from email.message import EmailMessage
+
+log = logging.getLogger("riamumail.loadtest")
+
+SMTP_PORT = 36245
+IMAP_PORT = 10143
+
+# (size in bytes, weight)
+DEFAULT_SIZES = [(2 * 1024, 70), (64 * 1024, 25), (1024 * 1024, 5)]
+# operation -> weight
+DEFAULT_MIX = {"smtp": 80, "imap": 20}
+# "list" times a folder listing (LIST plus STATUS of every folder), the
+# operation that depends most on the mailbox storage format
+OPERATIONS = ("smtp", "imap", "list")
+LIST_LINE = re.compile(r'\((?P<flags>[^)]*)\) (?:NIL|"[^"]*") (?P<name>.+)')
+DEFAULT_CONCURRENCY = [1, 4, 16]
+OPS_PER_WORKER = 20
+TIMEOUT = 30
+# Every test message carries it, so they can be removed afterwards
+TAG_HEADER = "X-Riamu-Load-Test"
+
+# Ingest benchmark: a burst of messages, timed until IMAP can read them
+INGEST_MESSAGES = 200
+INGEST_CONCURRENCY = 4
+INGEST_SIZE = 4 * 1024
+INGEST_WAIT = 300
+INGEST_POLL = 0.1
+STATUS_MESSAGES = re.compile(rb"MESSAGES (\d+)")
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def make_message(sender, recipient, size, tag="loadtest"):
+    msg = EmailMessage()
+    msg["From"] = sender
+    msg["To"] = recipient
+    msg["Subject"] = f"riamumail {tag} {size}B"
+    msg[TAG_HEADER] = tag
+    msg.set_content(("x" * 76 + "\n") * max(1, size // 77))
+    return msg
+
+
+class LevelResult:
+    """Outcome of running the load at one concurrency level."""
+
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.latencies = {"smtp": [], "imap": []}
+        self.errors = {"smtp": 0, "imap": 0}
+        self.bytes_sent = 0
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    def record(self, op, latency=None, size=0):
+        with self.lock:
+            if latency is None:
+                self.errors[op] = self.errors.get(op, 0) + 1
+            else:
+                self.latencies.setdefault(op, []).append(latency)
+                self.bytes_sent += size
+
+    @property
+    def messages_per_second(self):
+        return len(self.latencies["smtp"]) / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def ops_per_second(self):
+        done = sum(len(v) for v in self.latencies.values())
+        return done / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return {
+            "concurrency": self.concurrency,
+            "elapsed": round(self.elapsed, 3),
+            "messages_per_second": round(self.messages_per_second, 2),
+            "ops_per_second": round(self.ops_per_second, 2),
+            "mb_per_second": (
+                round(self.bytes_sent / 1e6 / self.elapsed, 3) if self.elapsed else 0.0
+            ),
+            "errors": dict(self.errors),
+            "latency_ms": {
+                op: {
+                    p: round(percentile(values, int(p[1:])) * 1000, 1)
+                    for p in ("p50", "p95", "p99")
+                }
+                for op, values in self.latencies.items()
+                if values
+            },
+        }
+
+
+class IngestResult:
+    """
+    Outcome of an ingest burst: how fast SMTP accepted it, how long until
+    every message was visible over IMAP, and how long a client then took
+    to open INBOX and read the new headers.
+    """
+
+    def __init__(self, messages, concurrency):
+        self.messages = messages
+        self.concurrency = concurrency
+        self.accepted = 0
+        self.delivered = 0
+        self.errors = 0
+        self.accept_elapsed = 0.0
+        self.deliver_elapsed = 0.0
+        self.open_elapsed = None
+        self.lock = threading.Lock()
+
+    def summary(self):
+        def rate(count, elapsed):
+            return round(count / elapsed, 2) if elapsed else 0.0
+
+        return {
+            "messages": self.messages,
+            "concurrency": self.concurrency,
+            "accepted": self.accepted,
+            "delivered": self.delivered,
+            "errors": self.errors,
+            "accepted_per_second": rate(self.accepted, self.accept_elapsed),
+            "delivered_per_second": rate(self.delivered, self.deliver_elapsed),
+            "deliver_seconds": round(self.deliver_elapsed, 3),
+            "open_ms": (
+                round(self.open_elapsed * 1000, 1)
+                if self.open_elapsed is not None
+                else None
+            ),
+        }
+
+
+class LoadTest:
+    """
+    Concurrent SMTP/IMAP load against the mail server. Each worker keeps
+    one SMTP and one IMAP session open and performs a weighted mix of
+    "send a message" and "open INBOX and fetch the newest header".
+    """
+
+    def __init__(
+        self,
+        user,
+        password,
+        recipient,
+        host="127.0.0.1",
+        smtp_port=SMTP_PORT,
+        imap_port=IMAP_PORT,
+        sizes=None,
+        mix=None,
+        ops_per_worker=OPS_PER_WORKER,
+        timeout=TIMEOUT,
+        seed=None,
+    ):
+        self.user = user
+        self.password = password
+        self.recipient = recipient
+        self.host = host
+        self.smtp_port = smtp_port
+        self.imap_port = imap_port
+        self.sizes = sizes or DEFAULT_SIZES
+        self.mix = mix or DEFAULT_MIX
+        self.ops_per_worker = ops_per_worker
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.cancelled = threading.Event()
+
+    def run(self, concurrency=None, progress=None):
+        results = []
+        for level in concurrency or DEFAULT_CONCURRENCY:
+            if self.cancelled.is_set():
+                break
+            if progress:
+                progress(f"Load test: {level} concurrent sessions")
+            result = self.run_level(level)
+            log.info(f"Load test level {level}: {result.summary()}")
+            results.append(result)
+        return results
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def cleanup(self):
+        """
+        Expunge the test's messages (every one carries TAG_HEADER) from
+        INBOX, leaving the rest of the mailbox alone. Returns the count.
+        """
+        imap = self.open_imap()
+        try:
+            typ, data = imap.select("INBOX")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"SELECT failed: {data}")
+            typ, data = imap.search(None, "HEADER", TAG_HEADER, '""')
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"SEARCH failed: {data}")
+            found = (data[0] or b"").split()
+            if found:
+                imap.store(b",".join(found).decode(), "+FLAGS", "(\\Deleted)")
+                imap.expunge()
+        finally:
+            self.close(imap)
+        log.info(f"Load test: removed {len(found)} test messages")
+        return len(found)
+
+    def ingest(
+        self,
+        messages=INGEST_MESSAGES,
+        concurrency=INGEST_CONCURRENCY,
+        size=INGEST_SIZE,
+        wait=INGEST_WAIT,
+    ):
+        """
+        Deliver a burst of `messages` over `concurrency` SMTP sessions,
+        then poll INBOX until all of them arrived. Compare runs before
+        and after a delivery change to see its effect on ingest.
+        """
+        result = IngestResult(messages, concurrency)
+        imap = self.open_imap()
+        try:
+            before = self.message_count(imap)
+            shares = [messages // concurrency] * concurrency
+            for i in range(messages % concurrency):
+                shares[i] += 1
+            start = threading.Barrier(concurrency + 1)
+            workers = [
+                threading.Thread(
+                    target=self.ingest_worker,
+                    args=(count, size, result, start),
+                    name=f"riamumail-ingest-{i}",
+                    daemon=True,
+                )
+                for i, count in enumerate(shares)
+            ]
+            for w in workers:
+                w.start()
+            start.wait()
+            began = time.perf_counter()
+            for w in workers:
+                w.join()
+            result.accept_elapsed = time.perf_counter() - began
+
+            deadline = time.monotonic() + wait
+            while not self.cancelled.is_set():
+                result.delivered = self.message_count(imap) - before
+                if result.delivered >= result.accepted or time.monotonic() > deadline:
+                    break
+                time.sleep(INGEST_POLL)
+            result.deliver_elapsed = time.perf_counter() - began
+        finally:
+            self.close(imap)
+
+        # What a client does next: log in, open INBOX, read the new headers
+        began = time.perf_counter()
+        imap = self.open_imap()
+        try:
+            typ, data = imap.select("INBOX", readonly=True)
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"SELECT failed: {data}")
+            if result.delivered > 0:
+                imap.fetch(f"{before + 1}:*", "(RFC822.HEADER)")
+            result.open_elapsed = time.perf_counter() - began
+        finally:
+            self.close(imap)
+
+        log.info(f"Ingest: {result.summary()}")
+        return result
+
+    def ingest_worker(self, count, size, result, start):
+        smtp = None
+        try:
+            smtp = self.open_smtp()
+        except Exception as e:
+            log.warning(f"Ingest session setup failed: {e}")
+        finally:
+            start.wait()
+
+        for _ in range(count):
+            if self.cancelled.is_set():
+                break
+            try:
+                smtp = smtp or self.open_smtp()
+                smtp.send_message(
+                    make_message(self.recipient, self.recipient, size, tag="ingest")
+                )
+                with result.lock:
+                    result.accepted += 1
+            except Exception as e:
+                log.debug(f"Ingest send failed: {e}")
+                with result.lock:
+                    result.errors += 1
+                smtp = self.close(smtp)
+        self.close(smtp)
+
+    @staticmethod
+    def message_count(imap):
+        typ, data = imap.status("INBOX", "(MESSAGES)")
+        match = STATUS_MESSAGES.search(data[0] or b"") if typ == "OK" else None
+        if not match:
+            raise imaplib.IMAP4.error(f"STATUS INBOX failed: {data}")
+        return int(match.group(1))
+
+    def run_level(self, concurrency):
+        result = LevelResult(concurrency)
+        plans = [self.plan() for _ in range(concurrency)]
+        start = threading.Barrier(concurrency + 1)
+
+        workers = [
+            threading.Thread(
+                target=self.worker,
+                args=(plan, result, start),
+                name=f"riamumail-load-{i}",
+                daemon=True,
+            )
+            for i, plan in enumerate(plans)
+        ]
+        for w in workers:
+            w.start()
+
+        start.wait()
+        began = time.perf_counter()
+        for w in workers:
+            w.join()
+        result.elapsed = time.perf_counter() - began
+        return result
+
+    def plan(self):
+        ops, weights = zip(*self.mix.items())
+        sizes, size_weights = zip(*self.sizes)
+        return [
+            (op, self.random.choices(sizes, size_weights)[0] if op == "smtp" else 0)
+            for op in self.random.choices(ops, weights, k=self.ops_per_worker)
+        ]
+
+    def worker(self, plan, result, start):
+        smtp = imap = None
+        try:
+            # Sessions are opened before the clock starts
+            if any(op == "smtp" for op, _ in plan):
+                smtp = self.open_smtp()
+            if any(op in ("imap", "list") for op, _ in plan):
+                imap = self.open_imap()
+        except Exception as e:
+            # Retried (and counted as errors) per operation below
+            log.warning(f"Load test session setup failed: {e}")
+        finally:
+            start.wait()
+
+        for op, size in plan:
+            if self.cancelled.is_set():
+                break
+            began = time.perf_counter()
+            try:
+                if op == "smtp":
+                    smtp = smtp or self.open_smtp()
+                    smtp.send_message(
+                        make_message(self.recipient, self.recipient, size)
+                    )
+                elif op == "list":
+                    imap = imap or self.open_imap()
+                    self.list_op(imap)
+                else:
+                    imap = imap or self.open_imap()
+                    self.imap_op(imap)
+                result.record(op, time.perf_counter() - began, size)
+            except Exception as e:
+                log.debug(f"Load test {op} failed: {e}")
+                result.record(op)
+                if op == "smtp":
+                    smtp = self.close(smtp)
+                else:
+                    imap = self.close(imap)
+
+        self.close(smtp)
+        self.close(imap)
+
+    def open_smtp(self):
+        smtp = smtplib.SMTP(self.host, self.smtp_port, timeout=self.timeout)
+        smtp.ehlo("riamumail-loadtest")
+        return smtp
+
+    def open_imap(self):
+        imap = imaplib.IMAP4(self.host, self.imap_port, timeout=self.timeout)
+        imap.login(self.user, self.password)
+        return imap
+
+    @staticmethod
+    def imap_op(imap):
+        typ, data = imap.select("INBOX", readonly=True)
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"SELECT failed: {data}")
+        count = int(data[0] or 0)
+        if count:
+            imap.fetch(str(count), "(RFC822.HEADER)")
+
+    @staticmethod
+    def list_op(imap):
+        typ, data = imap.list()
+        if typ != "OK":
+            raise imaplib.IMAP4.error(f"LIST failed: {data}")
+        for line in data:
+            match = LIST_LINE.match(line.decode()) if line else None
+            if not match or "\\Noselect" in match.group("flags"):
+                continue
+            name = match.group("name")
+            typ, status = imap.status(name, "(MESSAGES UNSEEN)")
+            if typ != "OK":
+                raise imaplib.IMAP4.error(f"STATUS {name} failed: {status}")
+
+    @staticmethod
+    def close(session):
+        if session is None:
+            return None
+        try:
+            if isinstance(session, smtplib.SMTP):
+                session.quit()
+            else:
+                session.logout()
+        except Exception:
+            pass
+        return None
+
+
+def format_report(results):
+    lines = [
+        f"{'conc':>5} {'msg/s':>8} {'ops/s':>8} {'MB/s':>7} "
+        f"{'smtp p50/p95/p99 ms':>22} {'imap p50/p95/p99 ms':>22} "
+        f"{'list p50/p95/p99 ms':>22} {'errors':>7} {'scale':>6}"
+    ]
+    base = results[0].messages_per_second if results else 0
+    for r in results:
+        s = r.summary()
+
+        def lat(op):
+            l = s["latency_ms"].get(op)
+            return f"{l['p50']}/{l['p95']}/{l['p99']}" if l else "-"
+
+        # Throughput gained per added session, relative to a single session
+        scale = (
+            r.messages_per_second / (base * r.concurrency)
+            if base and r.concurrency
+            else 0
+        )
+        lines.append(
+            f"{r.concurrency:>5} {s['messages_per_second']:>8} {s['ops_per_second']:>8} "
+            f"{s['mb_per_second']:>7} {lat('smtp'):>22} {lat('imap'):>22} "
+            f"{lat('list'):>22} "
+            f"{sum(s['errors'].values()):>7} {scale:>6.2f}"
+        )
+    return "\n".join(lines)
+
+
+def format_ingest_report(result):
+    s = result.summary()
+    return (
+        f"{s['messages']} messages over {s['concurrency']} sessions: "
+        f"{s['accepted_per_second']} msg/s accepted, "
+        f"{s['delivered_per_second']} msg/s delivered "
+        f"({s['delivered']}/{s['accepted']} in {s['deliver_seconds']}s), "
+        f"opening INBOX afterwards {s['open_ms']} ms, {s['errors']} errors"
+    )
+
+
+def parse_sizes(spec):
+    """Parse "2k:70,64k:25,1m:5" into [(2048, 70), (65536, 25), (1048576, 5)]."""
+    units = {"k": 1024, "m": 1024 * 1024}
+    sizes = []
+    for item in spec.split(","):
+        size, _, weight = item.strip().partition(":")
+        size = size.lower()
+        factor = units.get(size[-1:], 1)
+        number = size[:-1] if size[-1:] in units else size
+        sizes.append((int(float(number) * factor), float(weight or 1)))
+    return sizes
+
+
+def parse_mix(spec):
+    """Parse "smtp:80,imap:20" (or with "list")."""
+    mix = {}
+    for item in spec.split(","):
+        op, _, weight = item.strip().partition(":")
+        if op not in OPERATIONS:
+            raise ValueError(f"Unknown operation {op!r}")
+        mix[op] = float(weight or 1)
+    return mix
@@ -0,0 +1,281 @@
+import os
+import gzip
+import time
+import queue
+import atexit
+import shutil
+import logging
+import threading
+import logging.handlers
+from pathlib import Path
+
+LOG_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+MAX_BYTES = 5 * 1024 * 1024
+ROTATE_INTERVAL = 24 * 60 * 60
+BACKUP_COUNT = 5
+
+QUEUE_SIZE = 10000
+BATCH_SIZE = 500
+
+# Default levels per subsystem, overridable with RIAMUMAIL_LOG_LEVELS
+# ("subprocess=WARNING,health=DEBUG") or the "log_levels" config key.
+SUBSYSTEM_LEVELS = {
+    "subprocess": logging.INFO,
+}
+
+
+class RotatingLogWriter:
+    """
+    Appends to a log file and rotates it by size or age. Rotated segments
+    are gzipped next to the live file and only the newest few are kept.
+    When the live file was started is kept in a small sidecar file, since
+    its mtime moves with every write and would reset the age on restart.
+
+    Only the writer thread touches this object, so it needs no locking.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_bytes=MAX_BYTES,
+        interval=ROTATE_INTERVAL,
+        backup_count=BACKUP_COUNT,
+    ):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.backup_count = backup_count
+        self.stream = None
+        self.size = 0
+        self.opened_at = 0
+        self.open()
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.stream = open(self.path, "a", encoding="utf-8")
+        self.size = self.stream.tell()
+        self.opened_at = self.started() if self.size else None
+        if self.opened_at is None:
+            self.opened_at = time.time()
+            try:
+                self.started_file.write_text(str(self.opened_at))
+            except OSError:
+                pass
+
+    @property
+    def started_file(self):
+        return self.path.with_name(f".{self.path.name}.started")
+
+    def started(self):
+        """When the live file was started, or None if unknown."""
+        try:
+            return float(self.started_file.read_text())
+        except (OSError, ValueError):
+            pass
+        try:
+            # Files from before the sidecar; only some platforms record this
+            return self.path.stat().st_birthtime
+        except (OSError, AttributeError):
+            return None
+
+    def should_rotate(self):
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        if self.interval and time.time() - self.opened_at >= self.interval:
+            return self.size > 0
+        return False
+
+    def write(self, text):
+        if self.should_rotate():
+            self.rotate()
+        self.stream.write(text)
+        self.stream.flush()
+        self.size += len(text.encode("utf-8"))
+
+    def rotate(self):
+        self.stream.close()
+
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        # Several rotations can share a timestamp; keep names sortable
+        taken = self.path.parent.glob(f"{self.path.name}.{stamp}-*")
+        n = 1 + max((int(p.name.split("-")[-1][:3]) for p in taken), default=-1)
+        segment = self.path.with_name(f"{self.path.name}.{stamp}-{n:03d}")
+
+        try:
+            os.replace(self.path, segment)
+            with open(segment, "rb") as src, gzip.open(f"{segment}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            segment.unlink()
+        except OSError:
+            pass
+
+        self.prune()
+        self.open()
+
+    def segments(self):
+        return sorted(self.path.parent.glob(f"{self.path.name}.*.gz"))
+
+    def prune(self):
+        for old in self.segments()[: -self.backup_count or None]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+
+    def close(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BatchingLogListener:
+    """
+    Single writer thread for the log file. Waits for one record, drains
+    whatever else is already queued, and writes the whole batch at once.
+    """
+
+    def __init__(self, log_queue, writer, formatter, handler=None):
+        self.queue = log_queue
+        self.writer = writer
+        self.formatter = formatter
+        self.handler = handler
+        self.thread = None
+        self._stop = object()
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run, name="riamumail-log-writer", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        if not self.thread:
+            return
+        self.queue.put(self._stop)
+        self.thread.join(timeout=5)
+        self.thread = None
+        self.writer.close()
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stopping = self._stop in batch
+            records = [r for r in batch if r is not self._stop]
+
+            lines = [self.formatter.format(r) + "\n" for r in records]
+            if self.handler and self.handler.dropped:
+                dropped, self.handler.dropped = self.handler.dropped, 0
+                lines.append(
+                    self.formatter.format(
+                        logging.makeLogRecord(
+                            {
+                                "name": "riamumail.logs",
+                                "levelno": logging.WARNING,
+                                "levelname": "WARNING",
+                                "msg": f"Dropped {dropped} log records (queue full)",
+                            }
+                        )
+                    )
+                    + "\n"
+                )
+
+            if lines:
+                try:
+                    self.writer.write("".join(lines))
+                except Exception:
+                    pass
+
+            if stopping:
+                return
+
+
+def parse_levels(spec):
+    """Parse "subprocess=WARNING,health=DEBUG" into {"subprocess": 30, ...}."""
+    levels = {}
+    for item in (spec or "").split(","):
+        name, _, level = item.partition("=")
+        name, level = name.strip(), level.strip().upper()
+        if not name or not level:
+            continue
+        value = logging.getLevelName(level)
+        if isinstance(value, int):
+            levels[name] = value
+    return levels
+
+
+def apply_levels(levels):
+    for name, level in levels.items():
+        if isinstance(level, str):
+            level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            continue
+        if not name.startswith("riamumail."):
+            name = f"riamumail.{name}"
+        logging.getLogger(name).setLevel(level)
+
+
+_listener = None
+
+
+def configure(log_file, level=logging.INFO, levels=None):
+    """
+    Route all logging through a bounded queue to a single batching writer
+    thread, so callers never wait on disk I/O.
+    """
+    global _listener
+
+    if _listener:
+        _listener.stop()
+    else:
+        atexit.register(shutdown)
+
+    log_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    handler = DroppingQueueHandler(log_queue)
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    merged = dict(SUBSYSTEM_LEVELS)
+    merged.update(levels or {})
+    merged.update(parse_levels(os.environ.get("RIAMUMAIL_LOG_LEVELS")))
+    apply_levels(merged)
+
+    _listener = BatchingLogListener(
+        log_queue,
+        RotatingLogWriter(log_file),
+        logging.Formatter(LOG_FORMAT),
+        handler,
+    )
+    _listener.start()
+    return _listener
+
+
+def shutdown():
+    global _listener
+    if _listener:
+        _listener.stop()
+        _listener = None
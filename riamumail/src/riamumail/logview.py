@@ -0,0 +1,221 @@
+import os
+import re
+import logging
+import itertools
+import collections
+
+log = logging.getLogger("riamumail.logview")
+
+CHUNK_SIZE = 64 * 1024
+MAX_LINES = 2000
+# Longest stretch searched backwards for a command that scrolled out of view
+MAX_SCAN = 64 * 1024 * 1024
+MAX_READ = 4 * 1024 * 1024
+
+LEVELS = ["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]
+# Matches logs.LOG_FORMAT: "2024-05-01 12:00:00,123 [INFO] riamumail.health: ..."
+RECORD = re.compile(
+    r"^\d{4}-\d\d-\d\d \d\d:\d\d:\d\d,\d+ \[(?P<level>[A-Z]+)\] (?P<name>[^:]+): "
+)
+# run_subprocess tags every line of a command with its id
+COMMAND_TAG = re.compile(r"\[(?P<id>cmd-\d+-\d+)\]")
+COMMAND_FAILED = re.compile(r"Command \[(?P<id>cmd-\d+-\d+)\] failed")
+
+
+def subsystem(name):
+    """ "riamumail.health" -> "health"; records from the root logger -> "app"."""
+    if name == "root":
+        return "app"
+    return name[len("riamumail.") :] if name.startswith("riamumail.") else name
+
+
+class Entry:
+    """One log record; tracebacks and other continuation lines are kept with it."""
+
+    __slots__ = ("level", "subsystem", "lines")
+
+    def __init__(self, level, subsystem, line):
+        self.level = level
+        self.subsystem = subsystem
+        self.lines = [line]
+
+    @property
+    def text(self):
+        return "\n".join(self.lines)
+
+    @property
+    def command(self):
+        match = COMMAND_TAG.search(self.lines[0])
+        return match.group("id") if match else None
+
+
+def parse(lines, entries=None):
+    """Group lines into Entries, appending to `entries` (a list or deque)."""
+    entries = [] if entries is None else entries
+    for line in lines:
+        match = RECORD.match(line)
+        if match:
+            entries.append(
+                Entry(match.group("level"), subsystem(match.group("name")), line)
+            )
+        elif entries:
+            entries[-1].lines.append(line)
+        else:
+            entries.append(Entry("INFO", "app", line))
+    return entries
+
+
+def read_backwards(path, max_lines=MAX_LINES, chunk_size=CHUNK_SIZE, end=None):
+    """
+    The last `max_lines` complete lines before `end` (default: the end
+    of the file), read in chunks from the end so the cost depends on the
+    lines wanted, not the file size. Returns (lines, offset of the first
+    line, offset just past the last one); a line still being written
+    after the last newline is left for the caller to read later.
+    """
+    with open(path, "rb") as f:
+        end = f.seek(0, os.SEEK_END) if end is None else end
+        position = end
+        buffer = b""
+        while position > 0 and buffer.count(b"\n") <= max_lines:
+            step = min(chunk_size, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+
+    lines = buffer.split(b"\n")
+    end -= len(lines.pop())
+    if position > 0 and lines:
+        # The first piece is the tail of a line that started before `position`
+        position += len(lines.pop(0)) + 1
+    if len(lines) > max_lines:
+        position += sum(len(l) + 1 for l in lines[:-max_lines])
+        lines = lines[-max_lines:]
+    return [l.decode("utf-8", "replace") for l in lines], position, end
+
+
+class LogFollower:
+    """
+    Reads what was appended to a log file since the last call, by offset.
+    A partial last line is held back until its newline arrives; rotation
+    (the file shrinking or being replaced) starts over at the new file.
+    """
+
+    def __init__(self, path, offset=0, max_read=MAX_READ):
+        self.path = path
+        self.offset = offset
+        self.max_read = max_read
+        self.partial = b""
+        self.inode = self.stat_inode()
+
+    def stat_inode(self):
+        try:
+            return os.stat(self.path).st_ino
+        except OSError:
+            return None
+
+    def read(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return []
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            log.debug("Log file rotated; following the new file")
+            self.inode, self.offset, self.partial = stat.st_ino, 0, b""
+        if stat.st_size == self.offset:
+            return []
+
+        with open(self.path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read(self.max_read)
+        self.offset += len(data)
+
+        data = self.partial + data
+        lines = data.split(b"\n")
+        self.partial = lines.pop()
+        return [l.decode("utf-8", "replace") for l in lines]
+
+
+class LogView:
+    """
+    The newest `max_lines` records of a log file, kept up to date by
+    offset. Memory stays bounded however large the file grows.
+    """
+
+    def __init__(self, path, max_lines=MAX_LINES):
+        self.path = path
+        self.entries = collections.deque(maxlen=max_lines)
+        self.follower = None
+        self.start = 0
+
+    def load(self):
+        self.entries.clear()
+        try:
+            lines, self.start, end = read_backwards(self.path, self.entries.maxlen)
+        except FileNotFoundError:
+            lines, self.start, end = [], 0, 0
+        parse(lines, self.entries)
+        self.follower = LogFollower(self.path, end)
+        return len(lines)
+
+    def refresh(self):
+        """Append new records; returns how many lines were read."""
+        if self.follower is None:
+            return self.load()
+        lines = self.follower.read()
+        if self.follower.offset < self.start:
+            # Rotated: what is shown no longer matches the file
+            self.start = 0
+        parse(lines, self.entries)
+        return len(lines)
+
+    def filtered(self, min_level=None, subsystems=None):
+        floor = LEVELS.index(min_level) if min_level in LEVELS else 0
+        for entry in self.entries:
+            if entry.level in LEVELS and LEVELS.index(entry.level) < floor:
+                continue
+            if subsystems and entry.subsystem not in subsystems:
+                continue
+            yield entry
+
+    def subsystems(self):
+        return sorted({e.subsystem for e in self.entries})
+
+    def last_failed_command(self):
+        for entry in reversed(self.entries):
+            match = COMMAND_FAILED.search(entry.lines[0])
+            if match:
+                return match.group("id")
+        return None
+
+    def command_output(self, command_id, max_scan=MAX_SCAN):
+        """
+        Every record tagged with `command_id`. Searches backwards through
+        the file (up to `max_scan` bytes) when the command started before
+        the loaded records.
+        """
+        marker = f"Running command [{command_id}]"
+        entries = [e for e in self.entries if e.command == command_id]
+        if not self.start or any(marker in e.lines[0] for e in entries):
+            return entries
+
+        end, scanned, earlier = self.start, 0, []
+        while end > 0 and scanned < max_scan:
+            lines, position, _ = read_backwards(self.path, MAX_LINES, end=end)
+            if not lines:
+                break
+            scanned += end - position
+            end = position
+            chunk = [e for e in parse(lines) if e.command == command_id]
+            earlier = chunk + earlier
+            if any(marker in e.lines[0] for e in chunk):
+                break
+        return earlier + entries
+
+
+_command_ids = itertools.count(1)
+
+
+def next_command_id():
+    """Tag for one run_subprocess call, unique across app runs sharing a log."""
+    return f"cmd-{os.getpid()}-{next(_command_ids)}"
@@ -0,0 +1,256 @@
+import os
+import shutil
+import tarfile
+import logging
+import threading
+import subprocess
+import contextlib
+from pathlib import Path
+
+from riamumail import storage
+
+log = logging.getLogger("riamumail.maildir")
+
+MESSAGE_DIRS = ("cur", "new")
+
+
+def unique_name(path):
+    """
+    The part of a Maildir message filename that never changes. Flag
+    changes rename "123.host:2,S" to "123.host:2,RS" and moving from new/
+    to cur/ adds the ":2," suffix, but the unique part stays the same.
+    """
+    return os.path.basename(path).split(":2,")[0]
+
+
+def is_message(path):
+    """Files in cur/ or new/ (tmp/ holds deliveries still being written)."""
+    return Path(path).parent.name in MESSAGE_DIRS
+
+
+def is_index(path):
+    """Dovecot index/cache files are rebuilt automatically and change constantly."""
+    return os.path.basename(path).startswith("dovecot.index")
+
+
+class LocalMaildir:
+    """A user's home directory on this machine containing Maildir/."""
+
+    def __init__(self, home):
+        self.home = Path(home)
+
+    def list_files(self):
+        root = self.home / "Maildir"
+        return sorted(
+            str(p.relative_to(self.home)).replace(os.sep, "/")
+            for p in root.rglob("*")
+            if p.is_file()
+        )
+
+    def read_files(self, paths):
+        for path in paths:
+            full = self.home / path
+            try:
+                with open(full, "rb") as f:
+                    yield path, full.stat().st_size, f
+            except FileNotFoundError:
+                # Expunged (or renamed by a flag change) since listing
+                continue
+
+    @contextlib.contextmanager
+    def writer(self):
+        yield LocalWriter(self.home)
+
+
+class LocalWriter:
+    def __init__(self, home):
+        self.home = home
+
+    def add(self, path, fileobj, size):
+        dest = self.home / path
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        tmp = dest.with_name(f".{dest.name}.tmp")
+        with open(tmp, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(tmp, dest)
+
+
+class ContainerMaildir:
+    """
+    A user's Maildir inside a running container. Files move in and out as
+    tar streams through `docker exec`, never staged on disk. For dbox
+    mailboxes the image's storage script exports a Maildir copy before
+    listing and converts what was written afterwards. The copy is kept
+    and updated incrementally, so its file names stay stable and backups
+    only read new messages.
+    """
+
+    def __init__(self, container, user, env=None):
+        self.container = container
+        self.user = user
+        self.home = f"/home/{user}"
+        self.env = env
+
+    def exec_cmd(self, *args, stdin=False):
+        cmd = ["docker", "exec"]
+        if stdin:
+            cmd.append("-i")
+        return cmd + [self.container, *args]
+
+    def list_files(self):
+        storage.container_hook(self.container, "export", self.env)
+        output = subprocess.check_output(
+            self.exec_cmd("find", f"{self.home}/Maildir", "-type", "f"),
+            env=self.env,
+        ).decode()
+        prefix = f"{self.home}/"
+        return sorted(
+            line[len(prefix) :]
+            for line in output.splitlines()
+            if line.startswith(prefix) and not line.endswith(storage.EXPORT_MARKER)
+        )
+
+    def read_files(self, paths):
+        if not paths:
+            return
+        yield from _read_tar(
+            self.exec_cmd("tar", "-C", self.home, "-cf", "-", "-T", "-", stdin=True),
+            "".join(f"{p}\n" for p in paths).encode(),
+            self.env,
+        )
+
+    @contextlib.contextmanager
+    def writer(self):
+        storage.container_hook(self.container, "prepare", self.env)
+        process = subprocess.Popen(
+            self.exec_cmd("tar", "-C", self.home, "-xf", "-", stdin=True),
+            stdin=subprocess.PIPE,
+            env=self.env,
+        )
+        try:
+            with tarfile.open(fileobj=process.stdin, mode="w|") as tar:
+                yield TarWriter(tar)
+        finally:
+            process.stdin.close()
+            code = process.wait()
+        if code != 0:
+            raise subprocess.CalledProcessError(code, "tar -x")
+
+        subprocess.check_call(
+            self.exec_cmd(
+                "chown", "-R", f"{self.user}:{self.user}", f"{self.home}/Maildir"
+            ),
+            env=self.env,
+        )
+        storage.container_hook(self.container, "migrate", self.env)
+
+
+def message_path(mailbox, guid, uid):
+    """
+    A Maildir-style path standing for a dbox message, so the search index
+    treats both formats alike: "Sent", <guid>, 7 -> "Maildir/.Sent/cur/<guid>-7".
+    """
+    folder = "" if mailbox == "INBOX" else f".{mailbox.replace('/', '.')}/"
+    return f"Maildir/{folder}cur/{guid}-{uid}"
+
+
+def parse_listing(output):
+    """{path: (mailbox guid, uid)} from the storage script's `list` output."""
+    found = {}
+    for line in output.splitlines()[1:]:
+        fields = line.split("\t")
+        if len(fields) != 3:
+            continue
+        guid, uid, mailbox = fields
+        found[message_path(mailbox, guid, uid)] = (guid, uid)
+    return found
+
+
+class DoveadmMailbox:
+    """
+    A dbox mailbox in a running container, read through doveadm instead
+    of a Maildir export. Listing asks Dovecot for each message's mailbox
+    GUID and UID; reading exports only the requested messages into a
+    temporary directory that is removed once streamed. Used by the search
+    index, which would otherwise refresh a full export after every delivery.
+    """
+
+    def __init__(self, container, user, env=None):
+        self.container = container
+        self.user = user
+        self.env = env
+        self.ids = {}
+
+    def script(self, action, stdin=False):
+        cmd = ["docker", "exec"] + (["-i"] if stdin else [])
+        return cmd + [self.container, storage.SCRIPT, action]
+
+    def list_files(self):
+        output = subprocess.check_output(self.script("list"), env=self.env)
+        self.ids = parse_listing(output.decode(errors="replace"))
+        return sorted(self.ids)
+
+    def read_files(self, paths):
+        wanted = {"-".join(self.ids[p]): p for p in paths if p in self.ids}
+        if not wanted:
+            return
+        ids = "".join(" ".join(self.ids[p]) + "\n" for p in wanted.values())
+        for name, size, fileobj in _read_tar(
+            self.script("fetch", stdin=True), ids.encode(), self.env
+        ):
+            path = wanted.get(os.path.basename(name))
+            if path:
+                yield path, size, fileobj
+
+
+class TarWriter:
+    def __init__(self, tar):
+        self.tar = tar
+
+    def add(self, path, fileobj, size):
+        info = tarfile.TarInfo(path)
+        info.size = size
+        info.mode = 0o600
+        self.tar.addfile(info, fileobj)
+
+
+def _read_tar(cmd, data, env):
+    """Yield (name, size, fileobj) from the tar stream `cmd` writes for `data`."""
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        env=env,
+    )
+    # Feed stdin from a thread so a long list can't deadlock against tar
+    # filling the stdout pipe
+    feeder = _feed(process.stdin, data)
+    try:
+        with tarfile.open(fileobj=process.stdout, mode="r|") as tar:
+            for member in tar:
+                if not member.isfile():
+                    continue
+                yield member.name, member.size, tar.extractfile(member)
+    finally:
+        feeder.join()
+        process.stdout.close()
+        stderr = process.stderr.read().decode(errors="replace").strip()
+        process.stderr.close()
+        # Files expunged since listing make tar exit non-zero; that's fine
+        if process.wait() != 0 and stderr:
+            log.warning(f"{' '.join(cmd)}: {stderr}")
+
+
+def _feed(pipe, data):
+    def write():
+        try:
+            pipe.write(data)
+        except OSError:
+            pass
+        finally:
+            pipe.close()
+
+    thread = threading.Thread(target=write, name="riamumail-tar-feed", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import subprocess
+import collections
+
+from riamumail.loadtest import percentile
+
+log = logging.getLogger("riamumail.maillog")
+
+WINDOW = 60 * 60
+BUCKET = 60
+DELAY_SAMPLES = 2048
+NOTIFY_INTERVAL = 1.0
+SAVE_INTERVAL = 5.0
+RETRY_INTERVAL = 5.0
+READ_SIZE = 256 * 1024
+
+# Sent to the container so both daemons log to `docker logs`. Postfix
+# writes to /dev/stdout only under `postfix start-fg`, through postlogd
+POSTCONF_LOGGING = (
+    "postconf -e maillog_file=/dev/stdout && "
+    "postconf -M 'postlog/unix-dgram=postlog unix-dgram n - n - 1 postlogd'"
+)
+DOVECOT_LOGGING = """# Generated by Riamu Mail: log to the container output
+log_path = /dev/stderr
+auth_verbose = yes
+"""
+
+# `docker logs --timestamps` prefix: RFC 3339 with nanoseconds
+TIMESTAMP = re.compile(r"^(\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?Z) ")
+
+DELIVERY = re.compile(
+    r"postfix/(?:local|smtp|lmtp|virtual|pipe|error)\[\d+\]: (\w+): "
+    r"to=<([^>]*)>.*?, delay=([\d.]+).*?, status=(sent|deferred|bounced)"
+)
+QUEUED = re.compile(r"postfix/qmgr\[\d+\]: (\w+): from=<([^>]*)>, size=(\d+)")
+REJECT = re.compile(r"postfix/smtpd\[\d+\]: NOQUEUE: reject: ")
+# Dovecot 2.3 puts the level after the process: "imap-login: Info: Login: ..."
+LOGIN = re.compile(r"imap-login: (?:Info: )?Login: user=<([^>]*)>")
+LOGIN_FAILED = re.compile(
+    r"(?:imap|pop3|submission)-login: (?:Info: )?(?:Disconnected|Aborted login)"
+    r" \((?:auth failed|.*?auth attempts?)[^)]*\).*?user=<([^>]*)>"
+)
+
+
+def normalize_stamp(stamp):
+    """Pad the fraction to nanoseconds so stamps compare correctly as strings."""
+    seconds, _, fraction = stamp.rstrip("Z").partition(".")
+    return f"{seconds}.{fraction:0<9}Z"
+
+
+def parse_line(line):
+    """
+    Turn one Postfix or Dovecot log line into an event dict, or None for
+    lines that carry no delivery information. Cheap substring checks run
+    before any regex so the bulk of uninteresting lines cost almost nothing.
+    """
+    if "status=" in line:
+        match = DELIVERY.search(line)
+        if match:
+            queue_id, rcpt, delay, status = match.groups()
+            return {
+                "event": status,
+                "queue_id": queue_id,
+                "to": rcpt,
+                "delay": float(delay),
+            }
+    elif "qmgr[" in line and "from=<" in line:
+        match = QUEUED.search(line)
+        if match:
+            queue_id, sender, size = match.groups()
+            return {
+                "event": "accepted",
+                "queue_id": queue_id,
+                "from": sender,
+                "size": int(size),
+            }
+    elif "NOQUEUE: reject" in line:
+        if REJECT.search(line):
+            return {"event": "rejected"}
+    elif "-login: " in line:
+        match = LOGIN.search(line)
+        if match:
+            return {"event": "login", "user": match.group(1)}
+        match = LOGIN_FAILED.search(line)
+        if match:
+            return {"event": "login_failed", "user": match.group(1)}
+    return None
+
+
+class DeliveryMetrics:
+    """
+    Totals since start plus counts over the last `window` seconds (kept
+    in per-minute buckets) and recent queue delays for percentiles.
+    """
+
+    KINDS = (
+        "accepted",
+        "sent",
+        "deferred",
+        "bounced",
+        "rejected",
+        "login",
+        "login_failed",
+    )
+
+    def __init__(self, window=WINDOW, bucket=BUCKET, clock=time.time):
+        self.window = window
+        self.bucket = bucket
+        self.clock = clock
+        self.totals = collections.Counter()
+        self.buckets = collections.deque()  # [bucket start, Counter]
+        self.delays = collections.deque(maxlen=DELAY_SAMPLES)
+        self.lock = threading.Lock()
+
+    def add(self, events):
+        now = self.clock()
+        start = now - now % self.bucket
+        with self.lock:
+            if not self.buckets or self.buckets[-1][0] != start:
+                self.buckets.append([start, collections.Counter()])
+            counts = self.buckets[-1][1]
+            for event in events:
+                kind = event["event"]
+                self.totals[kind] += 1
+                counts[kind] += 1
+                if kind == "sent":
+                    self.delays.append(event["delay"])
+            self.expire(now)
+
+    def expire(self, now):
+        while self.buckets and self.buckets[0][0] <= now - self.window:
+            self.buckets.popleft()
+
+    def recent(self):
+        with self.lock:
+            self.expire(self.clock())
+            counts = collections.Counter()
+            for _, bucket in self.buckets:
+                counts.update(bucket)
+        return counts
+
+    def summary(self):
+        recent = self.recent()
+        with self.lock:
+            delays = list(self.delays)
+        return {
+            "totals": {k: self.totals[k] for k in self.KINDS},
+            "recent": {k: recent[k] for k in self.KINDS},
+            "delay_p50": round(percentile(delays, 50), 3),
+            "delay_p95": round(percentile(delays, 95), 3),
+            "delay_p99": round(percentile(delays, 99), 3),
+        }
+
+    def healthy(self, summary=None):
+        """False when more than a fifth of recent deliveries failed."""
+        recent = (summary or self.summary())["recent"]
+        failed = recent["deferred"] + recent["bounced"]
+        return failed * 5 <= failed + recent["sent"]
+
+
+def describe(summary):
+    recent = summary["recent"]
+    text = (
+        f"{recent['sent']} delivered · {recent['deferred']} deferred · "
+        f"{recent['bounced']} bounced in the last hour"
+    )
+    if recent["sent"]:
+        text += f" · p95 delay {summary['delay_p95']}s"
+    if recent["login_failed"]:
+        text += f" · {recent['login_failed']} failed logins"
+    return text
+
+
+class MailLogFollower:
+    """
+    Follows `docker logs` for the mail container on a background thread
+    and feeds parsed events into a DeliveryMetrics.
+
+    The timestamp of the last line read is persisted in `state_file`, so
+    a restart (of the app or the container stream) resumes with
+    `--since` instead of re-reading the whole log. `on_update(summary)`
+    is called from the thread at most every `notify_interval` seconds.
+    """
+
+    def __init__(
+        self,
+        container,
+        state_file,
+        env=None,
+        metrics=None,
+        on_update=None,
+        notify_interval=NOTIFY_INTERVAL,
+    ):
+        self.container = container
+        self.state_file = state_file
+        self.env = env
+        self.metrics = metrics or DeliveryMetrics()
+        self.on_update = on_update
+        self.notify_interval = notify_interval
+
+        self.since = self.load_state().get("since")
+        self.lines = 0
+        self.last_saved = 0
+        self.last_notified = 0
+
+        self.process = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+
+    # ---------- state ----------
+
+    def load_state(self):
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            log.exception("Failed to load mail log state")
+            return {}
+
+    def save_state(self):
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.state_file, "w") as f:
+                json.dump({"since": self.since}, f)
+        except Exception:
+            log.exception("Failed to save mail log state")
+
+    # ---------- parsing ----------
+
+    def feed(self, lines):
+        """Parse a batch of timestamped lines, skipping ones already seen."""
+        events = []
+        for line in lines:
+            match = TIMESTAMP.match(line)
+            if match:
+                stamp = normalize_stamp(match.group(1))
+                # --since is inclusive, so the last line read comes back
+                if self.since and stamp <= self.since:
+                    continue
+                self.since = stamp
+                line = line[match.end() :]
+            event = parse_line(line)
+            if event:
+                events.append(event)
+        self.lines += len(lines)
+        if events:
+            self.metrics.add(events)
+        return events
+
+    def command(self):
+        cmd = ["docker", "logs", "--follow", "--timestamps"]
+        if self.since:
+            cmd += ["--since", self.since]
+        return cmd + [self.container]
+
+    # ---------- thread ----------
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="riamumail-maillog", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        with self.lock:
+            if self.process and self.process.poll() is None:
+                self.process.terminate()
+        self.save_state()
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                self.follow()
+            except Exception:
+                log.exception("Mail log stream failed")
+            self.save_state()
+            # The stream ends when the container stops; try again later
+            self.stopping.wait(RETRY_INTERVAL)
+
+    def follow(self):
+        with self.lock:
+            self.process = subprocess.Popen(
+                self.command(),
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=self.env,
+            )
+        fd = self.process.stdout.fileno()
+        partial = b""
+        try:
+            # os.read returns whatever is available, so a burst is parsed
+            # as one batch and a lone line is handled as soon as it arrives
+            for chunk in iter(lambda: os.read(fd, READ_SIZE), b""):
+                lines = (partial + chunk).split(b"\n")
+                partial = lines.pop()
+                self.feed([line.decode("utf-8", "replace") for line in lines])
+                self.tick()
+            if partial:
+                self.feed([partial.decode("utf-8", "replace")])
+        finally:
+            self.process.stdout.close()
+            self.process.wait()
+
+    def tick(self):
+        now = time.monotonic()
+        if now - self.last_saved >= SAVE_INTERVAL:
+            self.last_saved = now
+            self.save_state()
+        if self.on_update and now - self.last_notified >= self.notify_interval:
+            self.last_notified = now
+            self.on_update(self.metrics.summary())
@@ -0,0 +1,264 @@
+import time
+import logging
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger("riamumail.metrics")
+
+HOST = "127.0.0.1"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; wide enough for a port probe and for a full image build
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"{self.name} takes labels {self.labels}, got {labels}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        with self.lock:
+            return [
+                (self.name, format_labels(self.labels, key), value)
+                for key, value in sorted(self.values.items())
+            ]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [
+            f"{name}{labels} {format_value(value)}"
+            for name, labels, value in self.samples()
+        ]
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels))
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            state = self.values.get(key)
+            if state is None:
+                state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe how long the `with` block took, whether or not it raised."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def count(self, **labels):
+        with self.lock:
+            state = self.values.get(self.key(labels))
+            return state[2] if state else 0
+
+    def samples(self):
+        found = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                for bound, n in zip(self.buckets, counts):
+                    le = [("le", format_value(bound))]
+                    labels = format_labels(self.labels, key, le)
+                    found.append((f"{self.name}_bucket", labels, n))
+                labels = format_labels(self.labels, key)
+                found.append((f"{self.name}_sum", labels, total))
+                found.append((f"{self.name}_count", labels, count))
+        return found
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} already registered")
+            self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, fn):
+        """Call `fn` before every render, for gauges read rather than pushed."""
+        with self.lock:
+            self.collectors.append(fn)
+        return fn
+
+    def render(self):
+        """Prometheus text exposition of the current values."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+            collectors = list(self.collectors)
+        for collect in collectors:
+            try:
+                collect()
+            except Exception:
+                log.exception("Metrics collector failed")
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+CHECK_OK = REGISTRY.gauge(
+    "riamumail_check_ok", "1 if the checklist item passed, 0 if it failed", ["check"]
+)
+CHECK_DURATION = REGISTRY.histogram(
+    "riamumail_check_duration_seconds", "Time taken by each health probe", ["check"]
+)
+CONTAINER_UP = REGISTRY.gauge(
+    "riamumail_container_up", "1 if the instance's mail server is running", ["instance"]
+)
+PUBLIC_IP_CHANGES = REGISTRY.counter(
+    "riamumail_public_ip_changes_total", "Public IP address changes observed"
+)
+API_DURATION = REGISTRY.histogram(
+    "riamumail_api_request_duration_seconds",
+    "Latency of each riamu API request attempt",
+    ["method", "path"],
+)
+API_ERRORS = REGISTRY.counter(
+    "riamumail_api_errors_total",
+    "Failed riamu API request attempts; status is empty for network errors",
+    ["method", "path", "status"],
+)
+TASKS_RUNNING = REGISTRY.gauge(
+    "riamumail_tasks_running", "Background tasks running, by kind", ["kind"]
+)
+TASKS_WAITING = REGISTRY.gauge(
+    "riamumail_tasks_waiting", "Background tasks waiting for a slot, by kind", ["kind"]
+)
+TASKS_QUEUED = REGISTRY.gauge(
+    "riamumail_tasks_queued", "Background tasks submitted but not yet started"
+)
+STEP_DURATION = REGISTRY.histogram(
+    "riamumail_step_duration_seconds",
+    "Duration of setup steps that ran (skipped steps are not counted)",
+    ["step"],
+)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format % args)
+
+
+class MetricsServer:
+    """
+    Serves `registry` at http://127.0.0.1:<port>/metrics on a background
+    thread. Scrapes only read the in-memory values.
+    """
+
+    def __init__(self, port, registry=REGISTRY, host=HOST):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.registry = registry
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, name="riamumail-metrics", daemon=True
+        )
+        self.thread.start()
+        log.info(f"Serving metrics on http://{HOST}:{self.port}/metrics")
+
+    def stop(self):
+        if self.thread:
+            self.server.shutdown()
+            self.thread = None
+        self.server.server_close()
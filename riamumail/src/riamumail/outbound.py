@@ -0,0 +1,140 @@
+import math
+import logging
+
+log = logging.getLogger("riamumail.outbound")
+
+# Submission with STARTTLS; most relays (and ISPs blocking 25) expect it
+RELAY_PORT = 587
+RELAY_CONCURRENCY = 5
+SASL_PASSWD = "/etc/postfix/sasl_passwd"
+CA_FILE = "/etc/ssl/certs/ca-certificates.crt"
+
+# Keep delivery connections open for follow-up mail to the same place
+CONNECTION_CACHE_TIME = "10s"
+CONNECTION_REUSE_TIME = "300s"
+
+RESOLVER = "127.0.0.1"
+UNBOUND_CONF = "/etc/unbound/unbound.conf"
+
+
+def relay_settings(config):
+    """
+    The "relay" section of an instance config with defaults, or None when
+    mail goes directly to each recipient's MX.
+
+        "relay": {"host": "smtp.example.com", "port": 587,
+                  "username": "...", "password": "...",
+                  "concurrency": 5, "per_minute": 60}
+    """
+    relay = config.get("relay") or {}
+    if not relay.get("host"):
+        return None
+    return {
+        "host": relay["host"],
+        "port": int(relay.get("port") or RELAY_PORT),
+        "username": relay.get("username", ""),
+        "password": relay.get("password", ""),
+        "concurrency": int(relay.get("concurrency") or RELAY_CONCURRENCY),
+        "per_minute": int(relay.get("per_minute") or 0),
+    }
+
+
+def relay_destination(relay):
+    # Brackets: deliver to this host, don't look up its MX records
+    return f"[{relay['host']}]:{relay['port']}"
+
+
+def rate_delay(per_minute):
+    """
+    smtp_destination_rate_delay for a messages-per-minute limit, rounded
+    up so the limit is never exceeded. The delay has one-second steps, so
+    any limit above 60/min becomes 60/min.
+    """
+    if not per_minute:
+        return "0s"
+    return f"{max(1, math.ceil(60 / per_minute))}s"
+
+
+def postfix_settings(relay, profile):
+    """main.cf parameters for outbound delivery."""
+    settings = {
+        "smtp_connection_cache_on_demand": "yes",
+        "smtp_connection_cache_time_limit": CONNECTION_CACHE_TIME,
+        "smtp_connection_reuse_time_limit": CONNECTION_REUSE_TIME,
+        "smtp_destination_concurrency_limit": profile["destination_concurrency"],
+        "smtp_tls_security_level": "may",
+        "smtp_tls_CAfile": CA_FILE,
+    }
+    if relay:
+        destination = relay_destination(relay)
+        settings.update(
+            {
+                "relayhost": destination,
+                # Every message goes to the relay; always reuse connections to it
+                "smtp_connection_cache_destinations": destination,
+                "smtp_destination_concurrency_limit": relay["concurrency"],
+                "smtp_destination_rate_delay": rate_delay(relay["per_minute"]),
+                "smtp_tls_security_level": "encrypt",
+            }
+        )
+        if relay["username"]:
+            settings.update(
+                {
+                    "smtp_sasl_auth_enable": "yes",
+                    "smtp_sasl_password_maps": f"lmdb:{SASL_PASSWD}",
+                    "smtp_sasl_security_options": "noanonymous",
+                    "smtp_sasl_tls_security_options": "noanonymous",
+                }
+            )
+    return settings
+
+
+def postconf_command(relay, profile):
+    main = " ".join(f"'{k}={v}'" for k, v in postfix_settings(relay, profile).items())
+    return f"postconf -e {main}"
+
+
+def sasl_passwd(relay):
+    """
+    Contents of SASL_PASSWD, or None without relay credentials. The file
+    is copied into the image, so the password is readable in that image
+    layer (`docker save`) and stays in the build directory next to the
+    Dockerfile until the relay is removed.
+    """
+    if not relay or not relay["username"]:
+        return None
+    return f"{relay_destination(relay)} {relay['username']}:{relay['password']}\n"
+
+
+def unbound_config(forwarders=None):
+    """
+    Caching resolver for Postfix inside the container. It recurses itself
+    unless `forwarders` (e.g. ["1.1.1.1"]) are configured.
+    """
+    lines = [
+        "server:",
+        f"  interface: {RESOLVER}",
+        "  access-control: 127.0.0.0/8 allow",
+        "  do-ip6: no",
+        "  num-threads: 1",
+        "  msg-cache-size: 8m",
+        "  rrset-cache-size: 16m",
+        # Refresh popular records (the relay, big MX hosts) before they expire
+        "  prefetch: yes",
+        "  serve-expired: yes",
+        "  cache-min-ttl: 60",
+        "  use-syslog: no",
+        "  logfile: /dev/stderr",
+    ]
+    if forwarders:
+        lines += ["", "forward-zone:", '  name: "."']
+        lines += [f"  forward-addr: {address}" for address in forwarders]
+    return "\n".join(lines) + "\n"
+
+
+def describe(relay):
+    if not relay:
+        return "direct to MX"
+    per_minute = min(relay["per_minute"], 60)
+    limit = f", {per_minute}/min" if per_minute else ""
+    return f"via {relay['host']}:{relay['port']} ({relay['concurrency']} connections{limit})"
@@ -0,0 +1,258 @@
+import os
+import re
+import sys
+import time
+import heapq
+import atexit
+import asyncio
+import logging
+import threading
+import collections
+
+from riamumail.config import CONFIG_PATH
+
+log = logging.getLogger("riamumail.profiling")
+
+PROFILE_ENV = "RIAMUMAIL_PROFILE"
+PROFILE_FLAG = "--profile"
+PROFILE_PATH = CONFIG_PATH / "profiles"
+
+INTERVAL = 0.005
+SLOW_CALLBACK = 0.05
+SLOWEST = 20
+TOP = 30
+
+_active = None
+
+
+def requested(argv=None, environ=None):
+    environ = os.environ if environ is None else environ
+    argv = sys.argv if argv is None else argv
+    return PROFILE_FLAG in argv or environ.get(PROFILE_ENV, "") not in ("", "0")
+
+
+def active():
+    """The running Profiler, or None when profiling is off."""
+    return _active
+
+
+def frame_label(frame):
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of every thread each `interval` seconds and counts
+    them per thread name. Unlike cProfile it needs no hook inside the
+    threads, so it covers the toga main loop, pool workers and pump
+    threads alike, including ones started before profiling began.
+    Worker threads carry their task's name, so samples are per task.
+    """
+
+    def __init__(self, interval=INTERVAL):
+        self.interval = interval
+        self.stacks = collections.defaultdict(collections.Counter)
+        self.samples = 0
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[names.get(ident, f"thread-{ident}")][tuple(stack)] += 1
+        self.samples += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="riamumail-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+
+class LoopMonitor:
+    """
+    Times every callback the event loop runs, keeping a duration
+    histogram and the slowest callbacks, so a blocking call made on the
+    main loop (a `docker ps` inside a UI update, say) shows up by name.
+    """
+
+    BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5]
+
+    def __init__(self, slow=SLOW_CALLBACK, keep=SLOWEST):
+        self.slow = slow
+        self.keep = keep
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+        self.slowest = []  # min-heap of (duration, n, description)
+        self.seen = 0
+        self.original = None
+        self.lock = threading.Lock()
+
+    def record(self, handle, duration):
+        with self.lock:
+            self.seen += 1
+            self.total += duration
+            for i, bound in enumerate(self.BUCKETS):
+                if duration <= bound:
+                    self.counts[i] += 1
+                    break
+            else:
+                self.counts[-1] += 1
+            if duration >= self.slow:
+                entry = (duration, self.seen, describe_handle(handle))
+                if len(self.slowest) < self.keep:
+                    heapq.heappush(self.slowest, entry)
+                else:
+                    heapq.heappushpop(self.slowest, entry)
+
+    def install(self):
+        """Wrap asyncio's Handle._run, which every loop callback goes through."""
+        if self.original is not None:
+            return
+        self.original = original = asyncio.events.Handle._run
+        monitor = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            try:
+                return original(handle)
+            finally:
+                monitor.record(handle, time.perf_counter() - started)
+
+        asyncio.events.Handle._run = _run
+
+    def uninstall(self):
+        if self.original is not None:
+            asyncio.events.Handle._run = self.original
+            self.original = None
+
+    def report(self):
+        lines = [f"Main loop callbacks: {self.seen}, {self.total:.2f}s total"]
+        labels = [f"<={b:g}s" for b in self.BUCKETS] + [f">{self.BUCKETS[-1]:g}s"]
+        lines += [f"  {label:>9} {n}" for label, n in zip(labels, self.counts)]
+        if self.slowest:
+            lines.append(f"Slowest callbacks (>= {self.slow:g}s):")
+            for duration, _, text in sorted(self.slowest, reverse=True):
+                lines.append(f"  {duration * 1000:8.1f} ms  {text}")
+        return "\n".join(lines)
+
+
+def describe_handle(handle):
+    callback = getattr(handle, "_callback", None)
+    name = getattr(callback, "__qualname__", None) or repr(callback)
+    # Tasks step through their coroutine; name that instead
+    owner = getattr(callback, "__self__", None)
+    if isinstance(owner, asyncio.Task):
+        name = f"task {owner.get_coro().__qualname__}"
+    return name
+
+
+def summarize(stacks, top=TOP):
+    """Functions by samples on the stack (inclusive) and on top of it (self)."""
+    inclusive = collections.Counter()
+    own = collections.Counter()
+    for counter in stacks.values():
+        for stack, n in counter.items():
+            for label in set(stack):
+                inclusive[label] += n
+            if stack:
+                own[stack[-1]] += n
+    return inclusive.most_common(top), own.most_common(top)
+
+
+class Profiler:
+    """
+    Whole-app profiling mode: a SamplingProfiler over every thread plus a
+    LoopMonitor on the main loop. `stop()` writes one folded-stack file
+    per thread (flamegraph.pl / speedscope input) and a merged summary
+    into a new directory under ~/.riamumail/profiles.
+    """
+
+    def __init__(self, directory=PROFILE_PATH, interval=INTERVAL, slow=SLOW_CALLBACK):
+        self.directory = directory
+        self.sampler = SamplingProfiler(interval)
+        self.loop_monitor = LoopMonitor(slow)
+        self.started = None
+        self.output = None
+
+    def start(self):
+        self.started = time.time()
+        self.sampler.start()
+        self.loop_monitor.install()
+        log.info("Profiling enabled")
+
+    def stop(self):
+        if self.started is None:
+            return self.output
+        self.sampler.stop()
+        self.loop_monitor.uninstall()
+        self.output = self.write()
+        self.started = None
+        log.info(f"Profiles written to {self.output}")
+        return self.output
+
+    def write(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started))
+        out = self.directory / f"{stamp}-{os.getpid()}"
+        out.mkdir(parents=True, exist_ok=True)
+
+        stacks = dict(self.sampler.stacks)
+        for name, counter in stacks.items():
+            with open(out / f"{safe_name(name)}.folded", "w") as f:
+                for stack, n in counter.most_common():
+                    f.write(f"{';'.join(stack)} {n}\n")
+
+        inclusive, own = summarize(stacks)
+        interval = self.sampler.interval
+        lines = [
+            f"Profiled {time.time() - self.started:.1f}s, "
+            f"{self.sampler.samples} samples every {interval * 1000:g} ms",
+            "",
+            "Samples per thread:",
+        ]
+        for name, counter in sorted(
+            stacks.items(), key=lambda item: -sum(item[1].values())
+        ):
+            n = sum(counter.values())
+            lines.append(f"  {n:8} ~{n * interval:7.2f}s  {name}")
+        for title, rows in (("Inclusive", inclusive), ("Self", own)):
+            lines += ["", f"{title} samples, all threads:"]
+            lines += [f"  {n:8} ~{n * interval:7.2f}s  {label}" for label, n in rows]
+        lines += ["", self.loop_monitor.report(), ""]
+        (out / "summary.txt").write_text("\n".join(lines))
+        return out
+
+
+def start(directory=PROFILE_PATH):
+    """Start whole-app profiling until exit."""
+    global _active
+    if _active is None:
+        _active = Profiler(directory)
+        _active.start()
+        atexit.register(_active.stop)
+    return _active
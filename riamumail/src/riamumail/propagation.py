@@ -0,0 +1,254 @@
+import time
+import struct
+import random
+import asyncio
+import logging
+
+log = logging.getLogger("riamumail.propagation")
+
+# Public resolvers run by different operators, so caches are independent
+DEFAULT_RESOLVERS = [
+    "8.8.8.8",
+    "1.1.1.1",
+    "9.9.9.9",
+    "208.67.222.222",
+    "64.6.64.6",
+]
+DNS_PORT = 53
+TIMEOUT = 3
+BACKOFF_BASE = 10
+BACKOFF_MAX = 5 * 60
+# Resolvers still behind after this long are not going to catch up by waiting
+MAX_DURATION = 48 * 60 * 60
+
+TYPE_A = 1
+CLASS_IN = 1
+
+
+def build_query(domain, qid):
+    """A recursive query for the A records of `domain`."""
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    name = b"".join(
+        bytes([len(label)]) + label.encode("idna")
+        for label in domain.strip(".").split(".")
+    )
+    return header + name + b"\0" + struct.pack("!HH", TYPE_A, CLASS_IN)
+
+
+def skip_name(data, offset):
+    while True:
+        length = data[offset]
+        if length == 0:
+            return offset + 1
+        if length & 0xC0 == 0xC0:
+            # Compression pointer; the name ends here
+            return offset + 2
+        offset += 1 + length
+
+
+def parse_response(data, qid):
+    """IPv4 addresses in the answer section, or None if `data` is not our reply."""
+    if len(data) < 12:
+        return None
+    rid, flags, qdcount, ancount, _, _ = struct.unpack("!HHHHHH", data[:12])
+    if rid != qid or not flags & 0x8000:
+        return None
+    if flags & 0x000F not in (0, 3):
+        # SERVFAIL, REFUSED...: no answer either way
+        return None
+
+    offset = 12
+    for _ in range(qdcount):
+        offset = skip_name(data, offset) + 4
+    addresses = []
+    for _ in range(ancount):
+        offset = skip_name(data, offset)
+        rtype, rclass, _, length = struct.unpack("!HHIH", data[offset : offset + 10])
+        offset += 10
+        if rtype == TYPE_A and rclass == CLASS_IN and length == 4:
+            addresses.append(".".join(str(b) for b in data[offset : offset + 4]))
+        offset += length
+    return addresses
+
+
+class _QueryProtocol(asyncio.DatagramProtocol):
+    def __init__(self, qid, future):
+        self.qid = qid
+        self.future = future
+
+    def datagram_received(self, data, addr):
+        try:
+            answer = parse_response(data, self.qid)
+        except (IndexError, struct.error):
+            answer = None
+        if answer is not None and not self.future.done():
+            self.future.set_result(answer)
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+def resolver_address(resolver):
+    """(host, port) for "8.8.8.8" or ["127.0.0.1", 5353] from the config."""
+    if isinstance(resolver, str):
+        return resolver, DNS_PORT
+    host, port = resolver
+    return host, port
+
+
+async def query(resolver, domain, timeout=TIMEOUT):
+    """A records for `domain` from one resolver, or None on timeout/error."""
+    loop = asyncio.get_running_loop()
+    qid = random.getrandbits(16)
+    future = loop.create_future()
+    transport = None
+    try:
+        # Fails for an unreachable network or a bad address in the config
+        transport, _ = await loop.create_datagram_endpoint(
+            lambda: _QueryProtocol(qid, future), remote_addr=resolver_address(resolver)
+        )
+        transport.sendto(build_query(domain, qid))
+        return await asyncio.wait_for(future, timeout)
+    except (asyncio.TimeoutError, OSError, ValueError, TypeError):
+        return None
+    finally:
+        if transport:
+            transport.close()
+
+
+class PropagationTracker:
+    """
+    Watches a domain change spread across several public resolvers.
+
+    Each round queries every resolver that does not yet return `ip`, all
+    at once, over UDP on the app's event loop: one packet per pending
+    resolver and no threads. Rounds back off from `base` to `maximum`
+    seconds and stop once every resolver agrees, or as incomplete after
+    `limit` seconds. `on_update(tracker)` is called after each round.
+    """
+
+    def __init__(
+        self,
+        domain,
+        ip,
+        resolvers=None,
+        on_update=None,
+        base=BACKOFF_BASE,
+        maximum=BACKOFF_MAX,
+        timeout=TIMEOUT,
+        limit=MAX_DURATION,
+        clock=time.monotonic,
+    ):
+        self.domain = domain
+        self.ip = ip
+        # Config lists become tuples so they can be dict keys
+        self.resolvers = [
+            r if isinstance(r, str) else tuple(r)
+            for r in resolvers or DEFAULT_RESOLVERS
+        ]
+        self.on_update = on_update
+        self.base = base
+        self.maximum = maximum
+        self.timeout = timeout
+        self.limit = limit
+        self.clock = clock
+
+        self.started = None
+        self.propagated = {}  # resolver -> seconds until it returned `ip`
+        self.answers = {}  # resolver -> latest answer
+        self.rounds = 0
+        self.incomplete = False
+        self.task = None
+
+    def start(self):
+        """Start tracking; must be called on the running event loop."""
+        self.stop()
+        self.task = asyncio.ensure_future(self.run())
+        return self.task
+
+    def stop(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
+        self.task = None
+
+    def pending(self):
+        return [r for r in self.resolvers if r not in self.propagated]
+
+    def fraction(self):
+        return len(self.propagated) / len(self.resolvers) if self.resolvers else 1.0
+
+    def complete(self):
+        return not self.pending()
+
+    def time_to_propagate(self):
+        """Seconds until the last resolver returned the new IP, once complete."""
+        return max(self.propagated.values(), default=0.0) if self.complete() else None
+
+    def elapsed(self):
+        return self.clock() - self.started if self.started is not None else 0.0
+
+    async def check(self):
+        pending = self.pending()
+        results = await asyncio.gather(
+            *(query(r, self.domain, self.timeout) for r in pending),
+            return_exceptions=True,
+        )
+        elapsed = self.elapsed()
+        for resolver, answer in zip(pending, results):
+            if isinstance(answer, Exception):
+                log.warning(f"Querying {resolver} failed: {answer!r}")
+                answer = None
+            self.answers[resolver] = answer
+            if answer and self.ip in answer:
+                self.propagated[resolver] = elapsed
+        self.rounds += 1
+
+    async def run(self):
+        self.started = self.clock()
+        delay = self.base
+        while True:
+            await self.check()
+            if self.on_update:
+                self.on_update(self)
+            if self.complete():
+                log.info(
+                    f"{self.domain} -> {self.ip} propagated to "
+                    f"{len(self.resolvers)} resolvers in "
+                    f"{self.time_to_propagate():.0f}s"
+                )
+                return self.time_to_propagate()
+            remaining = self.limit - self.elapsed()
+            if remaining <= 0:
+                self.incomplete = True
+                log.warning(f"{self.domain} -> {self.ip}: {self.describe()}")
+                if self.on_update:
+                    self.on_update(self)
+                return None
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.maximum)
+
+    def describe(self):
+        done = len(self.propagated)
+        total = len(self.resolvers)
+        if self.complete():
+            took = format_duration(self.time_to_propagate())
+            return f"{total}/{total} resolvers, propagated in {took}"
+        if self.incomplete:
+            return (
+                f"{done}/{total} resolvers, incomplete after "
+                f"{format_duration(self.elapsed())}"
+            )
+        return (
+            f"{done}/{total} resolvers ({self.fraction():.0%}) "
+            f"after {format_duration(self.elapsed())}"
+        )
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
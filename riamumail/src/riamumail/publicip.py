@@ -0,0 +1,160 @@
+import time
+import logging
+import threading
+import ipaddress
+import concurrent.futures
+
+import requests
+
+log = logging.getLogger("riamumail.publicip")
+
+# IPv4-only endpoints: the domain is published as an A record, so a
+# dual-stack provider answering over IPv6 would give the wrong address
+DEFAULT_PROVIDERS = [
+    "https://api.ipify.org",
+    "https://ipv4.icanhazip.com",
+    "https://v4.ident.me",
+    "https://ipv4.wtfismyip.com/text",
+]
+
+HEDGE_DELAY = 0.3
+TIMEOUT = 5
+TTL = 60
+
+
+def http_provider(url, timeout=TIMEOUT):
+    """Provider that GETs `url` and returns the body text."""
+
+    def fetch():
+        r = requests.get(url, timeout=timeout)
+        r.raise_for_status()
+        return r.text
+
+    fetch.__name__ = url
+    return fetch
+
+
+def parse_ip(text):
+    """Return the public IPv4 address in `text`, or None."""
+    try:
+        ip = ipaddress.IPv4Address((text or "").strip())
+    except ValueError:
+        return None
+    if not ip.is_global:
+        return None
+    return str(ip)
+
+
+class PublicIPResolver:
+    """
+    Discovers the public IP by asking several echo providers with hedged
+    requests: the first provider starts immediately and each further one
+    starts `hedge_delay` later (or as soon as an earlier one fails). The
+    first valid answer wins, so latency follows the fastest provider.
+
+    Providers are callables returning the response text. Answers are
+    cached for `ttl` seconds and `on_change(old, new)` callbacks fire when
+    the address changes.
+    """
+
+    def __init__(
+        self,
+        providers=None,
+        hedge_delay=HEDGE_DELAY,
+        timeout=TIMEOUT,
+        ttl=TTL,
+        clock=time.monotonic,
+    ):
+        self.providers = [
+            http_provider(p, timeout) if isinstance(p, str) else p
+            for p in (providers or DEFAULT_PROVIDERS)
+        ]
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.ttl = ttl
+        self.clock = clock
+
+        self.ip = None
+        self.fetched_at = None
+        self.changes = 0
+        self.listeners = []
+
+        self.lock = threading.Lock()
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.providers), thread_name_prefix="riamumail-publicip"
+        )
+
+    def on_change(self, callback):
+        self.listeners.append(callback)
+
+    def get(self, force=False):
+        """Cached public IP, refreshed when older than ttl. None if never found."""
+        with self.lock:
+            if not force and self.fresh():
+                return self.ip
+
+            ip = self.discover()
+            if ip is None:
+                if self.ip:
+                    log.warning(f"Public IP discovery failed, keeping {self.ip}")
+                return self.ip
+
+            old, self.ip = self.ip, ip
+            self.fetched_at = self.clock()
+
+        if old != ip:
+            if old is not None:
+                self.changes += 1
+                log.info(f"Public IP changed: {old} -> {ip}")
+            for callback in list(self.listeners):
+                try:
+                    callback(old, ip)
+                except Exception:
+                    log.exception("Public IP change listener failed")
+        return ip
+
+    def fresh(self):
+        return (
+            self.ip is not None
+            and self.fetched_at is not None
+            and self.clock() - self.fetched_at < self.ttl
+        )
+
+    def discover(self):
+        waiting = list(self.providers)
+        running = {}
+        deadline = time.monotonic() + self.timeout
+
+        def launch():
+            provider = waiting.pop(0)
+            running[self.executor.submit(provider)] = provider
+
+        launch()
+        while running:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            wait = min(self.hedge_delay, remaining) if waiting else remaining
+            done, _ = concurrent.futures.wait(
+                running, timeout=wait, return_when=concurrent.futures.FIRST_COMPLETED
+            )
+
+            for future in done:
+                provider = running.pop(future)
+                name = getattr(provider, "__name__", repr(provider))
+                try:
+                    ip = parse_ip(future.result())
+                except Exception as e:
+                    log.debug(f"IP provider {name} failed: {e}")
+                    ip = None
+                if ip:
+                    return ip
+                log.debug(f"IP provider {name} gave no valid address")
+
+            # Hedge delay passed, or a provider failed: start the next one
+            if waiting:
+                launch()
+
+        log.error("No IP provider returned a valid address")
+        return None
@@ -0,0 +1,281 @@
+import re
+import gzip
+import time
+import sqlite3
+import logging
+import email.utils
+from email import policy
+from email.parser import BytesParser
+
+from riamumail.maildir import unique_name, is_message
+
+log = logging.getLogger("riamumail.search")
+
+BATCH_MESSAGES = 500
+# Enough of a body to find a message by; the rest of a huge one adds little
+MAX_BODY = 256 * 1024
+LIMIT = 50
+# After new mail arrives, wait this long so a burst costs one update
+UPDATE_DELAY = 30
+
+SCHEMA = [
+    # Keyed by the Maildir unique name, so flag changes and new/ -> cur/
+    # moves only update `path` and never re-read the message
+    """CREATE TABLE IF NOT EXISTS messages (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE NOT NULL,
+        path TEXT NOT NULL,
+        folder TEXT NOT NULL,
+        date REAL,
+        subject TEXT,
+        sender TEXT
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS text USING fts5(
+        subject, sender, recipients, body, tokenize='unicode61 remove_diacritics 2'
+    )""",
+]
+
+# "from:alice" style field prefixes accepted in queries
+FIELDS = {"subject": "subject", "from": "sender", "to": "recipients", "body": "body"}
+TERM = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+TAG = re.compile(r"<[^>]+>")
+
+# Dovecot's zlib_save writes whole files in one of these
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def decompress(data):
+    """
+    A message file as Dovecot stored it, uncompressed: gzip and zstd
+    (the latter needs Python 3.14's compression.zstd) are detected by
+    their magic number. Returns None for zstd without support.
+    """
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    if data.startswith(ZSTD_MAGIC):
+        try:
+            from compression import zstd
+        except ImportError:
+            return None
+        return zstd.decompress(data)
+    return data
+
+
+def folder_name(path):
+    """ "Maildir/.Sent/cur/1.host" -> "Sent"; the top level is "INBOX"."""
+    parts = path.split("/")
+    if len(parts) > 3 and parts[1].startswith("."):
+        return parts[1][1:]
+    return "INBOX"
+
+
+def body_text(message):
+    """Plain text of a message: text/plain parts, else HTML with tags stripped."""
+    plain, html = [], []
+    for part in message.walk():
+        if part.is_multipart() or part.get_content_disposition() == "attachment":
+            continue
+        kind = part.get_content_type()
+        if kind not in ("text/plain", "text/html"):
+            continue
+        try:
+            text = part.get_content()
+        except (LookupError, ValueError):
+            payload = part.get_payload(decode=True) or b""
+            text = payload.decode("utf-8", "replace")
+        (plain if kind == "text/plain" else html).append(text)
+    if plain:
+        return "\n".join(plain)[:MAX_BODY]
+    return TAG.sub(" ", "\n".join(html))[:MAX_BODY]
+
+
+def parse_message(data):
+    """Indexed fields of a raw message."""
+    message = BytesParser(policy=policy.default).parsebytes(data)
+
+    def header(name):
+        try:
+            return str(message.get(name, ""))
+        except (ValueError, TypeError, IndexError):
+            # Malformed encoded words; fall back to the raw value
+            return str(message.get_all(name, [""])[0])
+
+    try:
+        date = email.utils.parsedate_to_datetime(header("Date")).timestamp()
+    except (TypeError, ValueError, IndexError):
+        date = None
+    return {
+        "subject": header("Subject"),
+        "sender": header("From"),
+        "recipients": " ".join(header(h) for h in ("To", "Cc")).strip(),
+        "date": date,
+        "body": body_text(message),
+    }
+
+
+def fts_query(text):
+    """
+    FTS5 query for what a user typed. Every word must match; "quoted
+    phrases" stay together and from:/to:/subject:/body: limit a word to
+    that field. Words are quoted, so punctuation is never FTS syntax.
+    """
+    terms = []
+    for field, word in TERM.findall(text):
+        word = word.strip('"').replace('"', "")
+        if not word:
+            continue
+        term = f'"{word}"'
+        if field.lower() in FIELDS:
+            term = f"{FIELDS[field.lower()]}:{term}"
+        elif field:
+            term = f'"{field}:{word}"'
+        terms.append(term)
+    return " ".join(terms)
+
+
+class SearchIndex:
+    """
+    Full-text index of a user's Maildir in SQLite FTS5. `update` reads
+    only messages that are not indexed yet; `search` answers from the
+    index without touching the mailbox. The connection can only be used
+    from the thread that opened the index, so the search window and each
+    update open their own; WAL lets searches run while an update writes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(str(path))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+    def count(self):
+        return self.db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def update(self, source, progress=None):
+        """
+        Bring the index in line with `source` (a LocalMaildir or
+        ContainerMaildir): index new messages, follow renames and drop
+        expunged ones. Returns stats like backup() does.
+        """
+        started = time.monotonic()
+        known = dict(self.db.execute("SELECT name, path FROM messages"))
+
+        current, fetch, moved = set(), [], []
+        for path in source.list_files():
+            if not is_message(path):
+                continue
+            name = unique_name(path)
+            current.add(name)
+            if name not in known:
+                fetch.append(path)
+            elif known[name] != path:
+                moved.append((path, folder_name(path), name))
+
+        gone = [name for name in known if name not in current]
+        with self.db:
+            self.db.executemany(
+                "UPDATE messages SET path = ?, folder = ? WHERE name = ?", moved
+            )
+            for name in gone:
+                self.delete(name)
+
+        stats = {
+            "indexed": 0,
+            "moved": len(moved),
+            "removed": len(gone),
+            "failed": 0,
+            "skipped": 0,
+        }
+        for i, (path, size, fileobj) in enumerate(source.read_files(fetch), 1):
+            try:
+                data = decompress(fileobj.read())
+                if data is None:
+                    log.warning(f"Not indexing {path}: zstd is not supported here")
+                    stats["skipped"] += 1
+                    continue
+                self.add(path, parse_message(data))
+                stats["indexed"] += 1
+            except Exception:
+                log.exception(f"Could not index {path}")
+                stats["failed"] += 1
+            if i % BATCH_MESSAGES == 0:
+                self.db.commit()
+                if progress:
+                    progress(f"Indexing: {i}/{len(fetch)} new messages")
+        self.db.commit()
+
+        stats["messages"] = self.count()
+        stats["elapsed"] = round(time.monotonic() - started, 3)
+        log.info(f"Search index updated: {stats}")
+        return stats
+
+    def add(self, path, fields):
+        self.delete(unique_name(path))
+        cursor = self.db.execute(
+            "INSERT INTO messages (name, path, folder, date, subject, sender)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                unique_name(path),
+                path,
+                folder_name(path),
+                fields["date"],
+                fields["subject"],
+                fields["sender"],
+            ),
+        )
+        self.db.execute(
+            "INSERT INTO text (rowid, subject, sender, recipients, body)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                cursor.lastrowid,
+                fields["subject"],
+                fields["sender"],
+                fields["recipients"],
+                fields["body"],
+            ),
+        )
+
+    def delete(self, name):
+        row = self.db.execute(
+            "SELECT id FROM messages WHERE name = ?", (name,)
+        ).fetchone()
+        if row:
+            self.db.execute("DELETE FROM text WHERE rowid = ?", row)
+            self.db.execute("DELETE FROM messages WHERE id = ?", row)
+
+    def search(self, text, limit=LIMIT):
+        """
+        Best matches first, as dicts with path, folder, date, subject,
+        sender and a snippet of the matching text.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self.db.execute(
+            "SELECT m.path, m.folder, m.date, m.subject, m.sender,"
+            " snippet(text, -1, '[', ']', '...', 12)"
+            " FROM text JOIN messages m ON m.id = text.rowid"
+            " WHERE text MATCH ? ORDER BY bm25(text, 10.0, 5.0, 2.0, 1.0) LIMIT ?",
+            (query, limit),
+        )
+        keys = ("path", "folder", "date", "subject", "sender", "snippet")
+        return [dict(zip(keys, row)) for row in rows]
+
+
+def format_result(result):
+    date = (
+        time.strftime("%Y-%m-%d", time.localtime(result["date"]))
+        if result["date"]
+        else "          "
+    )
+    return (
+        f"{date}  {result['folder']:<10} {result['sender'][:30]:<30} "
+        f"{result['subject']}\n    {result['snippet']}"
+    )
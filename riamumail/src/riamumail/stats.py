@@ -0,0 +1,358 @@
+import os
+import re
+import sys
+import json
+import time
+import socket
+import logging
+import threading
+import subprocess
+import collections
+import http.client
+from pathlib import Path
+from urllib.parse import quote
+
+log = logging.getLogger("riamumail.stats")
+
+DOCKER_SOCKET = "/var/run/docker.sock"
+# Docker Desktop on macOS may only create the per-user socket
+USER_SOCKET = Path.home() / ".docker" / "run" / "docker.sock"
+RESOLUTION = 5
+POINTS = 120  # 10 minutes at 5 second resolution
+RETRY_INTERVAL = 10
+SPARK = "▁▂▃▄▅▆▇█"
+
+# metric -> (limit, consecutive points over it before alerting)
+THRESHOLDS = {
+    "cpu": (90.0, 6),
+    "memory_percent": (90.0, 3),
+}
+
+ANSI = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+SIZE = re.compile(r"([\d.]+)\s*([kKMGT]?i?B)")
+UNITS = {
+    "B": 1,
+    "kB": 1e3,
+    "KB": 1e3,
+    "MB": 1e6,
+    "GB": 1e9,
+    "TB": 1e12,
+    "KiB": 1024,
+    "MiB": 1024**2,
+    "GiB": 1024**3,
+    "TiB": 1024**4,
+}
+
+
+class Series:
+    """
+    Fixed-size ring of averages over `resolution` seconds. Raw samples
+    are folded into the current bucket, so memory stays at `points`
+    floats however long the collector runs.
+    """
+
+    def __init__(self, points=POINTS, resolution=RESOLUTION):
+        self.resolution = resolution
+        self.points = collections.deque(maxlen=points)
+        self.bucket = None
+        self.total = 0.0
+        self.count = 0
+
+    def add(self, t, value):
+        bucket = int(t // self.resolution)
+        if self.bucket is not None and bucket != self.bucket and self.count:
+            self.points.append(self.total / self.count)
+            self.total, self.count = 0.0, 0
+        self.bucket = bucket
+        self.total += value
+        self.count += 1
+
+    def values(self):
+        return list(self.points)
+
+    def latest(self):
+        if self.count:
+            return self.total / self.count
+        return self.points[-1] if self.points else None
+
+
+def sparkline(values, width=24, top=None):
+    values = values[-width:]
+    if not values:
+        return ""
+    top = top or max(values) or 1
+    return "".join(
+        SPARK[min(len(SPARK) - 1, int(v / top * len(SPARK)))] for v in values
+    )
+
+
+def human_bytes(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+
+
+def parse_size(text):
+    match = SIZE.search(text)
+    if not match:
+        return 0.0
+    return float(match.group(1)) * UNITS.get(match.group(2), 1)
+
+
+def engine_sample(stat):
+    """Reduce one Docker Engine stats object to absolute values and counters."""
+    cpu, precpu = stat.get("cpu_stats", {}), stat.get("precpu_stats", {})
+    cpu_delta = cpu.get("cpu_usage", {}).get("total_usage", 0) - precpu.get(
+        "cpu_usage", {}
+    ).get("total_usage", 0)
+    system_delta = cpu.get("system_cpu_usage", 0) - precpu.get("system_cpu_usage", 0)
+    cpus = cpu.get("online_cpus") or len(
+        cpu.get("cpu_usage", {}).get("percpu_usage") or [1]
+    )
+    cpu_percent = cpu_delta / system_delta * cpus * 100 if system_delta > 0 else 0.0
+
+    memory = stat.get("memory_stats", {})
+    mem_stats = memory.get("stats", {})
+    # Page cache is reclaimable; `docker stats` leaves it out too
+    cache = mem_stats.get("inactive_file", mem_stats.get("total_inactive_file", 0))
+    used = max(0, memory.get("usage", 0) - cache)
+    limit = memory.get("limit") or 0
+
+    networks = stat.get("networks") or {}
+    blkio = (stat.get("blkio_stats") or {}).get("io_service_bytes_recursive") or []
+
+    return {
+        "cpu": cpu_percent,
+        "memory": used,
+        "memory_limit": limit,
+        "memory_percent": used / limit * 100 if limit else 0.0,
+        "net_rx": sum(n.get("rx_bytes", 0) for n in networks.values()),
+        "net_tx": sum(n.get("tx_bytes", 0) for n in networks.values()),
+        "disk_read": sum(
+            e["value"] for e in blkio if e.get("op", "").lower() == "read"
+        ),
+        "disk_write": sum(
+            e["value"] for e in blkio if e.get("op", "").lower() == "write"
+        ),
+    }
+
+
+def cli_sample(row):
+    """Same as engine_sample for one `docker stats --format '{{json .}}'` row."""
+    used, _, limit = row.get("MemUsage", "").partition("/")
+    rx, _, tx = row.get("NetIO", "").partition("/")
+    read, _, write = row.get("BlockIO", "").partition("/")
+    return {
+        "cpu": float(row.get("CPUPerc", "0").rstrip("%") or 0),
+        "memory": parse_size(used),
+        "memory_limit": parse_size(limit),
+        "memory_percent": float(row.get("MemPerc", "0").rstrip("%") or 0),
+        "net_rx": parse_size(rx),
+        "net_tx": parse_size(tx),
+        "disk_read": parse_size(read),
+        "disk_write": parse_size(write),
+    }
+
+
+def docker_socket():
+    host = os.environ.get("DOCKER_HOST", "")
+    if host.startswith("unix://"):
+        return host[len("unix://") :]
+    if not os.path.exists(DOCKER_SOCKET) and USER_SOCKET.exists():
+        return str(USER_SOCKET)
+    return DOCKER_SOCKET
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout=30):
+        super().__init__("localhost", timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+def engine_stream(container, socket_path):
+    """One streaming /stats request to the Docker Engine; yields samples."""
+    connection = UnixHTTPConnection(socket_path)
+    try:
+        connection.request("GET", f"/containers/{quote(container)}/stats?stream=true")
+        response = connection.getresponse()
+        if response.status != 200:
+            raise RuntimeError(f"Docker stats: HTTP {response.status}")
+        # http.client undoes the chunked encoding; one JSON object per line
+        for line in response:
+            if line.strip():
+                yield engine_sample(json.loads(line))
+    finally:
+        connection.close()
+
+
+def cli_stream(container, env=None, processes=None):
+    """A single long-running `docker stats` process, for hosts without the socket."""
+    process = subprocess.Popen(
+        ["docker", "stats", "--format", "{{json .}}", container],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        text=True,
+    )
+    if processes is not None:
+        processes.append(process)
+    try:
+        for line in process.stdout:
+            # Each refresh starts with terminal clear-screen codes
+            line = ANSI.sub("", line).strip()
+            if line.startswith("{"):
+                yield cli_sample(json.loads(line))
+    finally:
+        process.kill()
+        process.wait()
+
+
+class StatsCollector:
+    """
+    Follows resource usage of one container on a background thread,
+    keeping CPU, memory, network and disk rates in fixed-size Series.
+    `on_update(collector)` is called once per `resolution` seconds.
+    """
+
+    METRICS = (
+        "cpu",
+        "memory",
+        "memory_percent",
+        "net_rx",
+        "net_tx",
+        "disk_read",
+        "disk_write",
+    )
+    COUNTERS = ("net_rx", "net_tx", "disk_read", "disk_write")
+
+    def __init__(
+        self,
+        container,
+        on_update=None,
+        env=None,
+        socket_path=None,
+        points=POINTS,
+        resolution=RESOLUTION,
+        thresholds=None,
+        clock=time.monotonic,
+    ):
+        self.container = container
+        self.on_update = on_update
+        self.env = env
+        self.socket_path = socket_path or docker_socket()
+        self.resolution = resolution
+        self.thresholds = THRESHOLDS if thresholds is None else thresholds
+        self.clock = clock
+
+        self.series = {m: Series(points, resolution) for m in self.METRICS}
+        self.memory_limit = 0
+        self.previous = None
+        self.last_update = None
+
+        self.thread = None
+        self.stopping = threading.Event()
+        self.processes = []
+
+    def record(self, sample, t=None):
+        t = self.clock() if t is None else t
+        previous, self.previous = self.previous, (t, sample)
+        self.memory_limit = sample["memory_limit"] or self.memory_limit
+
+        for metric in ("cpu", "memory", "memory_percent"):
+            self.series[metric].add(t, sample[metric])
+        # Network and disk figures are totals; store them as per-second rates
+        if previous:
+            elapsed = t - previous[0]
+            for metric in self.COUNTERS:
+                delta = sample[metric] - previous[1][metric]
+                if elapsed > 0 and delta >= 0:
+                    self.series[metric].add(t, delta / elapsed)
+
+        if self.last_update is None or t - self.last_update >= self.resolution:
+            self.last_update = t
+            if self.on_update:
+                self.on_update(self)
+
+    def alerts(self):
+        found = []
+        for metric, (limit, points) in self.thresholds.items():
+            values = self.series[metric].values()[-points:]
+            if len(values) == points and min(values) > limit:
+                found.append(f"{metric.replace('_', ' ')} above {limit:g}%")
+        return found
+
+    def summary(self):
+        """Four text lines: a sparkline and the latest value per resource."""
+        s = self.series
+        latest = {m: s[m].latest() or 0 for m in self.METRICS}
+        memory = human_bytes(latest["memory"])
+        if self.memory_limit:
+            memory += f" / {human_bytes(self.memory_limit)}"
+        rows = [
+            ("CPU", s["cpu"].values(), 100, f"{latest['cpu']:.1f}%"),
+            ("Mem", s["memory"].values(), self.memory_limit or None, memory),
+            (
+                "Net",
+                s["net_rx"].values(),
+                None,
+                f"↓{human_bytes(latest['net_rx'])}/s "
+                f"↑{human_bytes(latest['net_tx'])}/s",
+            ),
+            (
+                "Disk",
+                s["disk_write"].values(),
+                None,
+                f"r {human_bytes(latest['disk_read'])}/s "
+                f"w {human_bytes(latest['disk_write'])}/s",
+            ),
+        ]
+        return "\n".join(
+            f"{name:<5}{sparkline(values, top=top):<24} {text}"
+            for name, values, top, text in rows
+        )
+
+    # ---------- thread ----------
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.stopping.clear()
+        self.thread = threading.Thread(
+            target=self.run, name="riamumail-stats", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        for process in self.processes:
+            if process.poll() is None:
+                process.kill()
+
+    def stream(self):
+        if sys.platform != "win32":
+            try:
+                yield from engine_stream(self.container, self.socket_path)
+                return
+            except (FileNotFoundError, PermissionError, ConnectionRefusedError):
+                log.info("Docker socket unavailable; using `docker stats`")
+        self.processes = []
+        yield from cli_stream(self.container, self.env, self.processes)
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                for sample in self.stream():
+                    if self.stopping.is_set():
+                        return
+                    self.record(sample)
+            except Exception:
+                log.debug("Stats stream ended", exc_info=True)
+            self.previous = None
+            # The stream ends when the container stops
+            self.stopping.wait(RETRY_INTERVAL)
@@ -0,0 +1,216 @@
+import logging
+import subprocess
+
+log = logging.getLogger("riamumail.storage")
+
+MAILDIR = "maildir"
+SDBOX = "sdbox"
+MDBOX = "mdbox"
+FORMATS = [MAILDIR, SDBOX, MDBOX]
+DEFAULT_FORMAT = MAILDIR
+
+NONE = "none"
+COMPRESSIONS = [NONE, "zlib", "zstd"]
+DEFAULT_COMPRESSION = NONE
+COMPRESSION_LEVEL = {"zlib": 6, "zstd": 3}
+# Dovecot's zlib_save names; "zlib" is offered as the familiar name for gzip
+ZLIB_SAVE = {"zlib": "gz", "zstd": "zstd"}
+
+# Directory under the user's home holding each format
+DIRECTORIES = {MAILDIR: "Maildir", SDBOX: "sdbox", MDBOX: "mdbox"}
+MDBOX_ROTATE_SIZE = "16M"
+
+SCRIPT = "/usr/local/bin/riamumail-storage"
+# Left in ~/Maildir by `export` so the copy is never imported back
+EXPORT_MARKER = ".riamumail-export"
+# doveadm -u looks users up through Dovecot's auth service
+AUTH_WAIT = 30
+
+
+def settings(config):
+    """(format, compression) from an instance config, with defaults."""
+    fmt = config.get("mail_format", DEFAULT_FORMAT)
+    compression = config.get("mail_compression", DEFAULT_COMPRESSION)
+    if fmt not in FORMATS:
+        log.warning(f"Unknown mail format {fmt!r}; using {DEFAULT_FORMAT}")
+        fmt = DEFAULT_FORMAT
+    if compression not in COMPRESSIONS:
+        log.warning(f"Unknown compression {compression!r}; using none")
+        compression = NONE
+    return fmt, compression
+
+
+def describe(fmt, compression):
+    return fmt if compression == NONE else f"{fmt} + {compression}"
+
+
+def mail_location(fmt):
+    return f"{fmt}:~/{DIRECTORIES[fmt]}"
+
+
+def dovecot_config(fmt, compression):
+    """Dovecot settings for the mailbox format, included from dovecot.conf."""
+    lines = [
+        f"# Generated by Riamu Mail: {describe(fmt, compression)}",
+        f"mail_location = {mail_location(fmt)}",
+    ]
+    if fmt == MDBOX:
+        # Many messages per file; expunged space is reclaimed by `doveadm purge`
+        lines.append(f"mdbox_rotate_size = {MDBOX_ROTATE_SIZE}")
+    if compression != NONE:
+        # New mail is stored compressed; reading handles both
+        lines += [
+            "mail_plugins = $mail_plugins zlib",
+            "plugin {",
+            f"  zlib_save = {ZLIB_SAVE[compression]}",
+            f"  zlib_save_level = {COMPRESSION_LEVEL[compression]}",
+            "}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def storage_script(user, fmt, home=None):
+    """
+    Shell script installed in the image as SCRIPT.
+
+    migrate: mail found in another format's directory (an older image, or
+      a restore/import written to ~/Maildir) is synced into the configured
+      format with `doveadm sync`. Once the message counts show everything
+      arrived the old directory is deleted; otherwise it is moved aside to
+      <dir>.migrated. Dovecot must be running; it waits up to AUTH_WAIT
+      seconds for it.
+    export:  for dbox formats, mirror the mailbox into ~/Maildir so the
+      Maildir-based backup can read it. The mirror is kept and updated in
+      place, so file names stay stable and only changes are written.
+    prepare: drop the export before files are written into ~/Maildir.
+    list:    "mailbox-guid uid mailbox" of every message, tab separated
+      after a header line, for reading dbox mail without the mirror.
+    fetch:   for each "mailbox-guid uid" line on stdin, export just that
+      message into a temporary directory, write it to stdout as a tar
+      stream and remove it.
+    """
+    home = home or f"/home/{user}"
+    target = DIRECTORIES[fmt]
+    others = " ".join(f"{f}:{d}" for f, d in DIRECTORIES.items() if f != fmt)
+    return f"""#!/bin/sh
+# Generated by Riamu Mail: mailbox storage is {fmt}
+set -e
+HOME_DIR={home}
+USER_NAME={user}
+
+wait_for_auth() {{
+    tries=0
+    until doveadm user "$USER_NAME" >/dev/null 2>&1; do
+        tries=$((tries + 1))
+        if [ "$tries" -ge {AUTH_WAIT} ]; then
+            echo "Dovecot is not answering; not migrating" >&2
+            return 1
+        fi
+        sleep 1
+    done
+}}
+
+# Messages in every mailbox; of the location in $1 if given
+count_messages() {{
+    if [ -n "$1" ]; then
+        set -- -o "mail_location=$1"
+    fi
+    doveadm "$@" mailbox status -u "$USER_NAME" -t messages '*' | sed -n 's/^messages=//p'
+}}
+
+migrate() {{
+    for entry in {others}; do
+        format=${{entry%%:*}}
+        dir=${{entry#*:}}
+        # The export mirror is a copy of the mailbox, not mail to convert
+        [ -f "$HOME_DIR/$dir/{EXPORT_MARKER}" ] && continue
+        if [ -n "$(find "$HOME_DIR/$dir" -type f 2>/dev/null | head -n 1)" ]; then
+            wait_for_auth || return 0
+            echo "Migrating $dir to {fmt}"
+            # On failure the old copy stays put and is retried next start
+            if doveadm sync -u "$USER_NAME" "$format:$HOME_DIR/$dir"; then
+                old=$(count_messages "$format:$HOME_DIR/$dir")
+                new=$(count_messages)
+                if [ -n "$old" ] && [ "${{new:-0}}" -ge "$old" ]; then
+                    echo "Migrated $old messages from $dir"
+                    rm -rf "$HOME_DIR/$dir"
+                else
+                    echo "Could not verify $dir; keeping it as $dir.migrated" >&2
+                    rm -rf "$HOME_DIR/$dir.migrated"
+                    mv "$HOME_DIR/$dir" "$HOME_DIR/$dir.migrated"
+                fi
+            else
+                echo "Migrating $dir failed" >&2
+            fi
+        fi
+    done
+    mkdir -p "$HOME_DIR/{target}"
+    chown -R "$USER_NAME:$USER_NAME" "$HOME_DIR/{target}"
+}}
+
+export_maildir() {{
+    [ "{fmt}" = "{MAILDIR}" ] && return 0
+    # Mail written to ~/Maildir and not converted yet goes in first;
+    # `doveadm backup` would otherwise delete it from the mirror
+    if [ -d "$HOME_DIR/Maildir" ] && [ ! -f "$HOME_DIR/Maildir/{EXPORT_MARKER}" ]; then
+        migrate
+    fi
+    doveadm backup -u "$USER_NAME" "maildir:$HOME_DIR/Maildir"
+    mkdir -p "$HOME_DIR/Maildir"
+    touch "$HOME_DIR/Maildir/{EXPORT_MARKER}"
+}}
+
+prepare() {{
+    if [ -f "$HOME_DIR/Maildir/{EXPORT_MARKER}" ]; then
+        rm -rf "$HOME_DIR/Maildir"
+    fi
+}}
+
+list_messages() {{
+    doveadm -f tab fetch -u "$USER_NAME" "mailbox-guid uid mailbox" ALL
+}}
+
+fetch_messages() {{
+    dir=$(mktemp -d)
+    trap 'rm -rf "$dir"' EXIT
+    ff=$(printf '\\f')
+    while read -r guid uid; do
+        # The pager format adds a "text:" line and a form feed after it
+        doveadm -f pager fetch -u "$USER_NAME" text mailbox-guid "$guid" uid "$uid" \\
+            </dev/null | sed "1d; \\${{/^$ff\\$/d;}}" > "$dir/$guid-$uid" || true
+        # Expunged since it was listed
+        [ -s "$dir/$guid-$uid" ] || rm -f "$dir/$guid-$uid"
+    done
+    tar -C "$dir" -cf - .
+}}
+
+case "$1" in
+    migrate) migrate ;;
+    export) export_maildir ;;
+    prepare) prepare ;;
+    list) list_messages ;;
+    fetch) fetch_messages ;;
+    *) echo "usage: $0 migrate|export|prepare|list|fetch" >&2; exit 2 ;;
+esac
+"""
+
+
+def container_hook(container, action, env=None):
+    """
+    Run the storage script's `action` in `container`. Images built before
+    the script existed are Maildir-only, so it is skipped there.
+    """
+    command = f"if [ -x {SCRIPT} ]; then {SCRIPT} {action}; fi"
+    subprocess.check_call(
+        ["docker", "exec", container, "sh", "-c", command],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def disk_usage(container, user, env=None):
+    """Bytes used by the user's home directory in the container."""
+    output = subprocess.check_output(
+        ["docker", "exec", container, "du", "-sk", f"/home/{user}"], env=env
+    ).decode()
+    return int(output.split()[0]) * 1024
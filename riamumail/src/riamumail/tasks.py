@@ -0,0 +1,248 @@
+import time
+import logging
+import threading
+import collections
+import concurrent.futures
+
+log = logging.getLogger("riamumail.tasks")
+
+MAX_WORKERS = 8
+# Kinds that must not overlap, e.g. two docker mutations at once
+KIND_LIMITS = {"docker": 1}
+SHUTDOWN_TIMEOUT = 5
+
+_current = threading.local()
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+def current():
+    """The Task running on this thread, or None outside the executor."""
+    return getattr(_current, "task", None)
+
+
+def cancelled():
+    """True if the task running on this thread was cancelled."""
+    task = current()
+    return task is not None and task.cancelled.is_set()
+
+
+def check_cancelled():
+    """Raise TaskCancelled if the task running on this thread was cancelled."""
+    if cancelled():
+        raise TaskCancelled(current().name)
+
+
+def format_counts(counts):
+    """One line summary of `TaskExecutor.counts()` for the diagnostics pane."""
+    text = f"Tasks: {counts['running']} running, {counts['queued']} queued"
+    kinds = [
+        f"{kind} {c['running']}+{c['waiting']}"
+        for kind, c in sorted(counts["by_kind"].items())
+    ]
+    return f"{text} ({', '.join(kinds)})" if kinds else text
+
+
+class Task:
+    def __init__(self, name, kind, fn, args, kwargs):
+        self.name = name
+        self.kind = kind
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = concurrent.futures.Future()
+        self.cancelled = threading.Event()
+        self.processes = set()
+        self.lock = threading.Lock()
+        self.queued_at = time.monotonic()
+        self.started_at = None
+
+    def __repr__(self):
+        return f"<Task {self.name} kind={self.kind}>"
+
+    def cancel(self):
+        """Ask the task to stop and terminate any subprocess it started."""
+        self.cancelled.set()
+        self.future.cancel()
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
+    def kill(self):
+        with self.lock:
+            processes = list(self.processes)
+        for process in processes:
+            if process.poll() is None:
+                process.kill()
+
+    def track(self, process):
+        with self.lock:
+            self.processes.add(process)
+        if self.cancelled.is_set():
+            process.terminate()
+
+    def untrack(self, process):
+        with self.lock:
+            self.processes.discard(process)
+
+
+class TaskExecutor:
+    """
+    Bounded pool for the app's background work.
+
+    Every task has a name (used for its thread and in the logs) and an
+    optional kind; at most `limits[kind]` tasks of one kind run at once
+    and the rest wait their turn without holding a pool worker. A kind
+    like "docker:<instance>" is limited separately per instance. Tasks
+    cancel cooperatively through `check_cancelled()`, and subprocesses
+    started through `track` are terminated on cancel or shutdown.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS, limits=None):
+        self.pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers, thread_name_prefix="riamumail-task"
+        )
+        self.limits = dict(KIND_LIMITS if limits is None else limits)
+        self.running = {}  # kind -> set of tasks
+        self.waiting = collections.defaultdict(collections.deque)
+        self.queued = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+    def submit(self, name, fn, *args, kind=None, replace=False, **kwargs):
+        """
+        Run `fn(*args, **kwargs)` as a task. With `replace`, tasks of the
+        same kind still waiting for a slot are dropped in its favour, so
+        repeated requests (a re-check, a re-typed domain) coalesce into the
+        latest one instead of piling up behind the running one.
+        """
+        task = Task(name, kind, fn, args, kwargs)
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("Task executor is shut down")
+            self.queued += 1
+            limit = self.limit(kind)
+            if limit is not None and len(self.running.get(kind, ())) >= limit:
+                waiting = self.waiting[kind]
+                superseded = list(waiting) if replace else []
+                if superseded:
+                    waiting.clear()
+                    self.queued -= len(superseded)
+                log.debug(f"{name} waiting for a {kind} slot")
+                waiting.append(task)
+            else:
+                superseded = None
+                self.running.setdefault(kind, set()).add(task)
+        if superseded is None:
+            self.pool.submit(self.run, task)
+            return task
+        for old in superseded:
+            log.debug(f"{old.name} superseded by {name}")
+            old.cancel()
+        return task
+
+    def limit(self, kind):
+        """Limit for `kind`; "docker:<name>" kinds each get the "docker" limit."""
+        if kind in self.limits:
+            return self.limits[kind]
+        if isinstance(kind, str):
+            return self.limits.get(kind.partition(":")[0])
+        return None
+
+    def run(self, task):
+        with self.lock:
+            self.queued -= 1
+        thread = threading.current_thread()
+        original_name = thread.name
+        thread.name = f"riamumail-{task.name}"
+        _current.task = task
+        task.started_at = time.monotonic()
+        try:
+            if not task.future.set_running_or_notify_cancel():
+                return
+            try:
+                check_cancelled()
+                result = task.fn(*task.args, **task.kwargs)
+            except TaskCancelled as e:
+                log.info(f"Task {task.name} cancelled")
+                task.future.set_exception(e)
+            except BaseException as e:
+                log.exception(f"Task {task.name} failed")
+                task.future.set_exception(e)
+            else:
+                task.future.set_result(result)
+        finally:
+            _current.task = None
+            thread.name = original_name
+            log.debug(
+                f"Task {task.name} finished in "
+                f"{time.monotonic() - task.started_at:.2f}s"
+            )
+            self.finished(task)
+
+    def finished(self, task):
+        with self.lock:
+            self.running.get(task.kind, set()).discard(task)
+            waiting = self.waiting.get(task.kind)
+            successor = waiting.popleft() if waiting and not self.closed else None
+            if successor:
+                self.running[task.kind].add(successor)
+        if successor:
+            self.pool.submit(self.run, successor)
+
+    def tasks(self):
+        with self.lock:
+            running = [t for tasks in self.running.values() for t in tasks]
+            waiting = [t for tasks in self.waiting.values() for t in tasks]
+        return running + waiting
+
+    def cancel(self, name):
+        for task in self.tasks():
+            if task.name == name:
+                task.cancel()
+
+    def counts(self):
+        """Live running and queued task counts, overall and per kind."""
+        with self.lock:
+            running = sum(
+                1 for tasks in self.running.values() for t in tasks if t.started_at
+            )
+            by_kind = {
+                str(kind): {
+                    "running": sum(1 for t in tasks if t.started_at),
+                    "waiting": len(self.waiting.get(kind, ())),
+                }
+                for kind, tasks in self.running.items()
+                if tasks or self.waiting.get(kind)
+            }
+            return {"running": running, "queued": self.queued, "by_kind": by_kind}
+
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """
+        Stop accepting work, drop tasks that have not started, cancel the
+        running ones and wait up to `timeout` seconds for them before
+        killing whatever subprocesses are still alive.
+        """
+        with self.lock:
+            self.closed = True
+            waiting = [t for tasks in self.waiting.values() for t in tasks]
+            self.waiting.clear()
+            self.queued -= len(waiting)
+        for task in waiting:
+            task.cancel()
+
+        running = self.tasks()
+        for task in running:
+            task.cancel()
+
+        futures = [t.future for t in running]
+        _, alive = concurrent.futures.wait(futures, timeout=timeout)
+        if alive:
+            log.warning(f"{len(alive)} tasks still running at shutdown; killing")
+            for task in running:
+                task.kill()
+        self.pool.shutdown(wait=False, cancel_futures=True)
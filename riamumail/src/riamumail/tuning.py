@@ -0,0 +1,247 @@
+import os
+import sys
+import ctypes
+import logging
+import subprocess
+from pathlib import Path
+
+log = logging.getLogger("riamumail.tuning")
+
+AUTO = "auto"
+
+# Per-preset knobs; process counts scale with cores and are capped by RAM.
+PRESETS = {
+    "desktop": {
+        "smtpd_per_core": 4,
+        "smtpd_max": 20,
+        "imap_per_core": 8,
+        "imap_max": 64,
+        "lmtp_per_core": 1,
+        "lmtp_max": 4,
+        "client_limit": 200,
+        "active_limit": 2000,
+        "login_min_avail": 0,
+        "high_performance_login": False,
+    },
+    "small-team": {
+        "smtpd_per_core": 10,
+        "smtpd_max": 100,
+        "imap_per_core": 32,
+        "imap_max": 512,
+        "lmtp_per_core": 2,
+        "lmtp_max": 16,
+        "client_limit": 1000,
+        "active_limit": 10000,
+        "login_min_avail": 0.5,
+        "high_performance_login": True,
+    },
+    "high-volume": {
+        "smtpd_per_core": 25,
+        "smtpd_max": 500,
+        "imap_per_core": 64,
+        "imap_max": 4096,
+        "lmtp_per_core": 4,
+        "lmtp_max": 64,
+        "client_limit": 5000,
+        "active_limit": 40000,
+        "login_min_avail": 1,
+        "high_performance_login": True,
+    },
+}
+
+PRESET_NAMES = [AUTO] + list(PRESETS)
+
+# Rough resident size of one process, used to keep limits within RAM
+SMTPD_MB = 8
+IMAP_MB = 6
+LMTP_MB = 10
+MEMORY_SHARE = 0.4
+
+
+def memory_mb():
+    try:
+        if sys.platform == "win32":
+
+            class MemoryStatus(ctypes.Structure):
+                _fields_ = [
+                    ("dwLength", ctypes.c_ulong),
+                    ("dwMemoryLoad", ctypes.c_ulong),
+                    ("ullTotalPhys", ctypes.c_ulonglong),
+                    ("ullAvailPhys", ctypes.c_ulonglong),
+                    ("ullTotalPageFile", ctypes.c_ulonglong),
+                    ("ullAvailPageFile", ctypes.c_ulonglong),
+                    ("ullTotalVirtual", ctypes.c_ulonglong),
+                    ("ullAvailVirtual", ctypes.c_ulonglong),
+                    ("ullAvailExtendedVirtual", ctypes.c_ulonglong),
+                ]
+
+            status = MemoryStatus()
+            status.dwLength = ctypes.sizeof(MemoryStatus)
+            ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+            return status.ullTotalPhys // (1024 * 1024)
+
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except Exception:
+        log.exception("Could not read total memory")
+        return 4096
+
+
+def disk_type(path=None):
+    """Return "ssd" or "hdd" for the disk holding `path` (only detected on Linux)."""
+    if not sys.platform.startswith("linux"):
+        return "ssd"
+    try:
+        dev = os.stat(path or Path.home()).st_dev
+        block = Path(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}").resolve()
+        # Partitions have no queue/ directory; their parent device does
+        for candidate in (block, block.parent):
+            rotational = candidate / "queue" / "rotational"
+            if rotational.exists():
+                return "hdd" if rotational.read_text().strip() == "1" else "ssd"
+    except Exception:
+        log.debug("Could not determine disk type", exc_info=True)
+    return "ssd"
+
+
+def docker_resources(env=None, timeout=10):
+    """
+    Cores and memory Docker can give containers, or None if `docker info`
+    fails. With Docker Desktop that is its VM, often far smaller than
+    the machine itself.
+    """
+    try:
+        output = subprocess.check_output(
+            ["docker", "info", "--format", "{{.NCPU}} {{.MemTotal}}"],
+            env=env,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+        cores, memory = (int(v) for v in output.split())
+    except Exception:
+        log.debug("Could not read Docker's resources", exc_info=True)
+        return None
+    if cores <= 0 or memory <= 0:
+        return None
+    return {"cores": cores, "memory_mb": memory // (1024 * 1024)}
+
+
+def detect_host(docker=None):
+    """
+    The machine's cores, memory and disk; `docker` (from
+    docker_resources) replaces cores and memory when given.
+    """
+    host = {
+        "cores": os.cpu_count() or 2,
+        "memory_mb": memory_mb(),
+        "disk": disk_type(),
+    }
+    if docker:
+        host.update(docker, source="docker")
+    return host
+
+
+def auto_preset(host):
+    if host["cores"] <= 4 or host["memory_mb"] < 8 * 1024:
+        return "desktop"
+    if host["cores"] <= 16:
+        return "small-team"
+    return "high-volume"
+
+
+def build_profile(preset=AUTO, host=None):
+    """
+    Resolve a preset against the host and return the profile: the chosen
+    preset, the host it was computed for and the concrete limits.
+    """
+    host = host or detect_host()
+    if preset not in PRESETS:
+        preset = auto_preset(host)
+    knobs = PRESETS[preset]
+    cores = host["cores"]
+    budget = host["memory_mb"] * MEMORY_SHARE
+
+    smtpd = min(knobs["smtpd_per_core"] * cores, knobs["smtpd_max"])
+    smtpd = max(2, min(smtpd, int(budget / 2 / SMTPD_MB)))
+    imap = min(knobs["imap_per_core"] * cores, knobs["imap_max"])
+    imap = max(4, min(imap, int(budget / 2 / IMAP_MB)))
+
+    ssd = host["disk"] == "ssd"
+    # Each delivery writes the message and updates the indexes; spinning
+    # disks take fewer of them at once
+    lmtp = min(knobs["lmtp_per_core"] * cores, knobs["lmtp_max"])
+    lmtp = max(2, min(lmtp if ssd else lmtp // 2, int(budget / 4 / LMTP_MB)))
+
+    return {
+        "preset": preset,
+        "host": host,
+        "smtpd_processes": smtpd,
+        "imap_processes": imap,
+        "lmtp_processes": lmtp,
+        "client_limit": knobs["client_limit"],
+        "active_limit": knobs["active_limit"] if ssd else knobs["active_limit"] // 2,
+        "destination_concurrency": 20 if ssd else 10,
+        "login_processes": max(1, int(cores * knobs["login_min_avail"])),
+        "high_performance_login": knobs["high_performance_login"],
+        "disk": host["disk"],
+    }
+
+
+def describe(profile):
+    host = profile["host"]
+    docker = " (Docker)" if host.get("source") == "docker" else ""
+    return (
+        f"{profile['preset']} · {host['cores']} cores · "
+        f"{host['memory_mb'] / 1024:.0f} GB RAM{docker} · {host['disk'].upper()}"
+    )
+
+
+def postfix_settings(profile):
+    """main.cf parameters."""
+    return {
+        "default_process_limit": profile["smtpd_processes"] + 20,
+        "smtpd_client_connection_count_limit": max(10, profile["smtpd_processes"] // 2),
+        "qmgr_message_active_limit": profile["active_limit"],
+        "default_destination_concurrency_limit": profile["destination_concurrency"],
+        "in_flow_delay": "1s" if profile["disk"] == "hdd" else "0s",
+    }
+
+
+def postfix_master_settings(profile):
+    """master.cf fields, as service/type/field -> value."""
+    return {
+        "smtp/inet/maxproc": profile["smtpd_processes"],
+    }
+
+
+def postconf_commands(profile):
+    main = " ".join(f"'{k}={v}'" for k, v in postfix_settings(profile).items())
+    master = " ".join(f"'{k}={v}'" for k, v in postfix_master_settings(profile).items())
+    return [f"postconf -e {main}", f"postconf -F {master}"]
+
+
+def dovecot_config(profile):
+    """Dovecot settings included from dovecot.conf."""
+    login = (
+        # One long-lived login process per core instead of one per connection
+        f"""  service_count = 0
+  process_min_avail = {profile["login_processes"]}
+  client_limit = {profile["client_limit"]}
+"""
+        if profile["high_performance_login"]
+        else "  service_count = 1\n"
+    )
+    return f"""# Generated by Riamu Mail: {describe(profile)}
+default_process_limit = {profile["imap_processes"]}
+default_client_limit = {profile["client_limit"] * 2}
+
+mmap_disable = no
+mail_fsync = optimized
+mail_max_userip_connections = {max(10, profile["imap_processes"] // 4)}
+
+service imap-login {{
+{login}}}
+
+service imap {{
+  process_limit = {profile["imap_processes"]}
+}}
+"""
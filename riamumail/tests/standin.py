@@ -0,0 +1,210 @@
+"""
+Minimal local SMTP and IMAP servers sharing one mailbox, standing in for
+the mailexp container in tests.
+"""
+
+import re
+import time
+import threading
+import socketserver
+
+TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|(\([^)]*\))|(\S+)')
+
+
+class Mailbox:
+    def __init__(self, delivery_delay=0):
+        self.messages = []  # [bytes, set(flags)]
+        self.delivery_delay = delivery_delay
+        self.lock = threading.Lock()
+
+    def deliver(self, data):
+        def store():
+            with self.lock:
+                self.messages.append([data, set()])
+
+        if self.delivery_delay:
+            threading.Timer(self.delivery_delay, store).start()
+        else:
+            store()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.messages)
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+    def send(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.send("220 standin ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode(errors="replace").strip().split(" ", 1)[0].upper()
+
+            if cmd == "EHLO":
+                self.send("250-standin")
+                self.send("250 SIZE 52428800")
+            elif cmd in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                self.send("250 OK")
+            elif cmd == "DATA":
+                self.send("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b".\n", b""):
+                        break
+                    lines.append(data[1:] if data.startswith(b"..") else data)
+                self.server.mailbox.deliver(b"".join(lines))
+                self.send("250 OK queued")
+            elif cmd == "QUIT":
+                self.send("221 Bye")
+                return
+            else:
+                self.send("502 Command not implemented")
+
+
+def parse_set(spec, count):
+    seqs = set()
+    for part in spec.split(","):
+        lo, _, hi = part.partition(":")
+        lo = count if lo == "*" else int(lo)
+        hi = lo if not hi else (count if hi == "*" else int(hi))
+        seqs.update(range(min(lo, hi), max(lo, hi) + 1))
+    return sorted(s for s in seqs if 1 <= s <= count)
+
+
+class IMAPHandler(socketserver.StreamRequestHandler):
+    def send(self, data):
+        self.wfile.write((data.encode() if isinstance(data, str) else data) + b"\r\n")
+
+    def handle(self):
+        mailbox = self.server.mailbox
+        self.send("* OK standin IMAP4rev1 ready")
+        authed = False
+
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tokens = [
+                next(g for g in m if g) if any(m) else ""
+                for m in TOKEN.findall(line.decode(errors="replace").strip())
+            ]
+            if len(tokens) < 2:
+                continue
+            tag, cmd, args = tokens[0], tokens[1].upper(), tokens[2:]
+
+            if cmd == "UID" and args:
+                cmd, args = args[0].upper(), args[1:]
+
+            if cmd == "CAPABILITY":
+                self.send("* CAPABILITY IMAP4rev1")
+            elif cmd == "LOGIN":
+                if args[:2] != [self.server.user, self.server.password]:
+                    self.send(f"{tag} NO [AUTHENTICATIONFAILED] Authentication failed")
+                    continue
+                authed = True
+            elif cmd == "LOGOUT":
+                self.send("* BYE")
+                self.send(f"{tag} OK LOGOUT completed")
+                return
+            elif cmd == "NOOP":
+                pass
+            elif not authed:
+                self.send(f"{tag} NO not authenticated")
+                continue
+            elif cmd in ("SELECT", "EXAMINE"):
+                self.send(f"* {len(mailbox)} EXISTS")
+                self.send("* 0 RECENT")
+            elif cmd == "LIST":
+                self.send('* LIST () "/" INBOX')
+            elif cmd == "STATUS":
+                self.send(f"* STATUS INBOX (MESSAGES {len(mailbox)})")
+            elif cmd == "SEARCH":
+                self.send("* SEARCH " + " ".join(map(str, self.search(args))))
+            elif cmd == "FETCH":
+                with mailbox.lock:
+                    for seq in parse_set(args[0], len(mailbox.messages)):
+                        data = mailbox.messages[seq - 1][0]
+                        if "HEADER" in args[1].upper():
+                            item = "RFC822.HEADER"
+                            data = data.split(b"\r\n\r\n", 1)[0] + b"\r\n\r\n"
+                        else:
+                            item = "RFC822"
+                        self.send(f"* {seq} FETCH ({item} {{{len(data)}}}".encode())
+                        self.wfile.write(data + b")\r\n")
+            elif cmd == "STORE":
+                with mailbox.lock:
+                    for seq in parse_set(args[0], len(mailbox.messages)):
+                        mailbox.messages[seq - 1][1].update(args[2].strip("()").split())
+            elif cmd in ("EXPUNGE", "CLOSE"):
+                with mailbox.lock:
+                    for seq in range(len(mailbox.messages), 0, -1):
+                        if "\\Deleted" in mailbox.messages[seq - 1][1]:
+                            del mailbox.messages[seq - 1]
+                            if cmd == "EXPUNGE":
+                                self.send(f"* {seq} EXPUNGE")
+            else:
+                self.send(f"{tag} BAD unknown command")
+                continue
+
+            self.send(f"{tag} OK {cmd} completed")
+
+    def search(self, args):
+        mailbox = self.server.mailbox
+        with mailbox.lock:
+            if len(args) >= 3 and args[0].upper() == "HEADER":
+                needle = f"{args[1]}: {args[2]}".lower().encode()
+                return [
+                    i + 1
+                    for i, (data, _) in enumerate(mailbox.messages)
+                    if needle in data.split(b"\r\n\r\n", 1)[0].lower()
+                ]
+            return list(range(1, len(mailbox.messages) + 1))
+
+
+class Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class StandinMailServer:
+    """SMTP + IMAP on ephemeral localhost ports, as a context manager."""
+
+    def __init__(self, user="test", password="secret", delivery_delay=0):
+        self.mailbox = Mailbox(delivery_delay)
+        self.user = user
+        self.password = password
+        self.servers = []
+
+    def __enter__(self):
+        for handler in (SMTPHandler, IMAPHandler):
+            server = Server(("127.0.0.1", 0), handler)
+            server.mailbox = self.mailbox
+            server.user = self.user
+            server.password = self.password
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            self.servers.append(server)
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers:
+            server.shutdown()
+            server.server_close()
+
+    @property
+    def smtp_port(self):
+        return self.servers[0].server_address[1]
+
+    @property
+    def imap_port(self):
+        return self.servers[1].server_address[1]
+
+    def wait_for(self, count, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.mailbox) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.mailbox)
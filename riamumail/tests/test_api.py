@@ -0,0 +1,164 @@
+import json
+import time
+
+import pytest
+import requests
+
+from riamumail.api import APIError, CircuitBreaker, CircuitOpenError, RiamuAPI
+
+
+class Response:
+    def __init__(self, status=200, data=None):
+        self.status_code = status
+        self.data = data or {}
+        self.content = json.dumps(self.data).encode()
+
+    def json(self):
+        return self.data
+
+
+class Session:
+    """Stand-in for requests.Session replaying scripted answers."""
+
+    def __init__(self, answers):
+        self.answers = list(answers)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append((method, url, kwargs.get("json") or kwargs.get("params")))
+        answer = self.answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def make_api(tmp_path, answers, **kwargs):
+    session = Session(answers)
+    api = RiamuAPI(
+        tmp_path / "outbox.json",
+        base="https://api.test",
+        session=session,
+        sleep=lambda s: None,
+        **kwargs,
+    )
+    return api, session
+
+
+def test_idempotent_calls_retry(tmp_path):
+    """GETs are retried on connection errors and 5xx."""
+    api, session = make_api(
+        tmp_path,
+        [
+            requests.ConnectionError("reset"),
+            Response(503),
+            Response(data={"available": 1}),
+        ],
+    )
+    assert api.check_domain("me.riamumail.com") == 1
+    assert len(session.calls) == 3
+
+
+def test_circuit_breaker_fails_fast(tmp_path):
+    """After repeated failures calls are rejected without touching the network."""
+    now = [0]
+    breaker = CircuitBreaker(
+        failure_threshold=2, reset_timeout=30, clock=lambda: now[0]
+    )
+    api, session = make_api(
+        tmp_path,
+        [Response(500), Response(500), Response(data={"available": 0})],
+        breaker=breaker,
+        retries=0,
+    )
+    for _ in range(2):
+        with pytest.raises(APIError):
+            api.check_domain("a")
+    with pytest.raises(CircuitOpenError):
+        api.check_domain("a")
+    assert len(session.calls) == 2
+
+    now[0] = 31
+    assert api.check_domain("a") == 0
+    assert breaker.state == "closed"
+
+
+def test_outbox_failure_does_not_block_other_domains(tmp_path):
+    """A release that keeps failing doesn't hold up a reserve for another domain."""
+    api, session = make_api(
+        tmp_path,
+        [
+            requests.ConnectionError("down"),
+            requests.ConnectionError("down"),
+            Response(),
+        ],
+    )
+    assert api.release_domain("old.riamumail.com") is False
+    assert api.reserve_domain("new.riamumail.com", "8.8.8.8") is True
+    assert [c[1] for c in session.calls] == [
+        "https://api.test/domain/release",
+        "https://api.test/domain/release",
+        "https://api.test/domain/reserve",
+    ]
+    (pending,) = api.outbox.pending()
+    assert (pending["op"], pending["attempts"]) == ("release", 2)
+
+    restarted, session = make_api(tmp_path, [Response()])
+    assert restarted.flush() is True
+    assert restarted.outbox.pending() == []
+
+
+def test_outbox_keeps_latest_intent_per_domain(tmp_path):
+    api, session = make_api(tmp_path, [requests.ConnectionError("down")] * 3)
+    api.reserve_domain("me.riamumail.com", "8.8.8.8")
+    api.reserve_domain("me.riamumail.com", "8.8.4.4")
+    api.release_domain("me.riamumail.com")
+    assert [(o["op"], o["payload"]) for o in api.outbox.pending()] == [
+        ("release", {"domain": "me.riamumail.com"})
+    ]
+
+
+def test_outbox_replayed_in_background(tmp_path):
+    api, session = make_api(
+        tmp_path,
+        [requests.ConnectionError("down"), Response()],
+        replay_interval=0.01,
+    )
+    assert api.release_domain("old.riamumail.com") is False
+    api.start()
+    try:
+        deadline = time.monotonic() + 5
+        while api.outbox.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        api.stop()
+    assert api.outbox.pending() == []
+    assert len(session.calls) == 2
+
+
+def test_requests_are_measured(tmp_path):
+    from riamumail import metrics
+
+    errors = metrics.API_ERRORS.get(method="GET", path="/domain/check", status=503)
+    count = metrics.API_DURATION.count(method="GET", path="/domain/check")
+    api, _ = make_api(tmp_path, [Response(503), Response(data={"available": 1})])
+    api.check_domain("me.riamumail.com")
+    assert (
+        metrics.API_ERRORS.get(method="GET", path="/domain/check", status=503)
+        == errors + 1
+    )
+    assert metrics.API_DURATION.count(method="GET", path="/domain/check") == count + 2
+
+
+def test_replayed_operations_are_reported(tmp_path):
+    """Only outcomes the caller did not wait for reach the listeners."""
+    api, session = make_api(
+        tmp_path, [requests.ConnectionError("down"), Response(), Response()]
+    )
+    results = []
+    api.on_result(lambda op, payload, delivered: results.append((op, delivered)))
+
+    assert api.reserve_domain("me.riamumail.com", "9.9.9.9") is False
+    assert api.queued("me.riamumail.com")
+    assert api.release_domain("old.riamumail.com") is True
+    assert results == [("reserve", True)]
+    assert not api.queued("me.riamumail.com")
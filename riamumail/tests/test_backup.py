@@ -0,0 +1,60 @@
+from riamumail.backup import ChunkStore, backup, restore
+from riamumail.maildir import LocalMaildir, unique_name
+
+
+def make_maildir(home, messages):
+    for path, body in messages.items():
+        (home / path).parent.mkdir(parents=True, exist_ok=True)
+        (home / path).write_bytes(body)
+    return LocalMaildir(home)
+
+
+class CountingMaildir(LocalMaildir):
+    def __init__(self, home):
+        super().__init__(home)
+        self.read = []
+
+    def read_files(self, paths):
+        self.read.extend(paths)
+        return super().read_files(paths)
+
+
+def test_unique_name_ignores_flags():
+    """Flag changes and new/ -> cur/ moves keep the unique part."""
+    assert unique_name("Maildir/new/123.host") == "123.host"
+    assert unique_name("Maildir/cur/123.host:2,RS") == "123.host"
+
+
+def test_incremental_backup_and_restore(tmp_path):
+    """Only new messages are read; renamed ones are carried over."""
+    home = tmp_path / "home"
+    make_maildir(
+        home,
+        {
+            "Maildir/new/1.host": b"Subject: one\r\n\r\nhello",
+            "Maildir/cur/2.host:2,S": b"Subject: two\r\n\r\n" + b"x" * 3_000_000,
+            "Maildir/dovecot.index.cache": b"rebuildable",
+            "Maildir/tmp/3.host": b"half written",
+        },
+    )
+    store = ChunkStore(tmp_path / "backups")
+    source = CountingMaildir(home)
+
+    first = backup(source, store)
+    assert first["files"] == 2 and first["new"] == 2
+    assert first["bytes_stored"] < first["bytes_read"]
+
+    # Message 1 was read by a client and flagged; message 4 arrived
+    (home / "Maildir/new/1.host").rename(home / "Maildir/cur/1.host:2,S")
+    (home / "Maildir/new/4.host").write_bytes(b"Subject: four\r\n\r\nnew")
+    source.read = []
+
+    second = backup(source, store)
+    assert source.read == ["Maildir/new/4.host"]
+    assert second["files"] == 3 and second["new"] == 1
+    assert len(store.list_snapshots()) == 2
+
+    target = tmp_path / "restored"
+    assert restore(store, LocalMaildir(target)) == 3
+    assert (target / "Maildir/cur/1.host:2,S").read_bytes().endswith(b"hello")
+    assert (target / "Maildir/cur/2.host:2,S").stat().st_size == 3_000_000 + 16
@@ -0,0 +1,53 @@
+from riamumail.canary import Canary, LatencyHistory
+
+from .standin import StandinMailServer
+
+
+def make_canary(server, **kwargs):
+    return Canary(
+        "test",
+        "secret",
+        "test@example.com",
+        smtp_port=server.smtp_port,
+        imap_port=server.imap_port,
+        **kwargs,
+    )
+
+
+def test_probe_measures_delivery_and_cleans_up():
+    with StandinMailServer(delivery_delay=0.3) as server:
+        latency = make_canary(server, poll=0.05).probe()
+        assert 0.3 <= latency < 2
+        assert len(server.mailbox) == 0
+
+
+def test_probe_times_out_when_mail_never_arrives():
+    with StandinMailServer(delivery_delay=5) as server:
+        assert make_canary(server, timeout=0.3, poll=0.05).probe() is None
+
+
+def test_history_flags_degraded_p95():
+    history = LatencyHistory(recent=4, floor=1.0)
+    for _ in range(8):
+        history.record(0.4)
+    assert not history.degraded()
+    assert history.histogram()["≤0.5s"] == 8
+
+    for _ in range(4):
+        history.record(12)
+    assert history.degraded()
+    assert history.histogram()["≤30s"] == 4
+    assert history.sparkline() == "≤0.5s █····▅·· >60s"
+
+    history.record(None)
+    assert history.degraded()
+    assert history.describe() == "not delivered (1 failed) · ≤0.5s █····▅·· >60s"
+    assert LatencyHistory().describe() == "not delivered (0 failed)"
+
+
+def test_late_canaries_are_cleaned_up_next_time():
+    with StandinMailServer(delivery_delay=0.4) as server:
+        assert make_canary(server, timeout=0.1, poll=0.05).probe() is None
+        server.wait_for(1)
+        assert make_canary(server, poll=0.05).probe() is not None
+        assert len(server.mailbox) == 0
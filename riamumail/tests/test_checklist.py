@@ -0,0 +1,107 @@
+import threading
+
+from riamumail.checklist import Checklist
+
+
+class Loop:
+    """Records scheduled callbacks instead of running an event loop."""
+
+    def __init__(self):
+        self.soon = []
+        self.later = []
+
+    def call_soon_threadsafe(self, fn, *args):
+        self.soon.append((fn, args))
+
+    def call_later(self, delay, fn, *args):
+        handle = Handle(fn, args)
+        self.later.append(handle)
+        return handle
+
+    def run(self):
+        while self.soon:
+            fn, args = self.soon.pop(0)
+            fn(*args)
+        later, self.later = self.later, []
+        for handle in later:
+            if not handle.cancelled:
+                handle.fn(*handle.args)
+
+
+class Handle:
+    def __init__(self, fn, args):
+        self.fn, self.args = fn, args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def make_checklist():
+    renders = []
+    loop = Loop()
+    checklist = Checklist(loop, lambda *row: renders.append(row))
+    return checklist, loop, renders
+
+
+def test_updates_batch_into_one_flush():
+    """Many updates from workers cost one wakeup; the latest state wins."""
+    checklist, loop, renders = make_checklist()
+    threads = [
+        threading.Thread(target=checklist.update, args=(f"row {i % 3}", True))
+        for i in range(30)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    checklist.update("row 0", False, "broken")
+
+    assert len(loop.soon) == 1
+    loop.run()
+    assert sorted(r[0] for r in renders) == ["row 0", "row 1", "row 2"]
+    assert ("row 0", "✗ row 0: broken", "red") in renders
+
+
+def test_unchanged_rows_are_not_redrawn():
+    checklist, loop, renders = make_checklist()
+    checklist.update("Git", True)
+    loop.run()
+    checklist.update("Git", True)
+    loop.run()
+    assert renders == [("Git", "✓ Git", "green")]
+
+
+def test_spinner_runs_only_while_pending():
+    checklist, loop, renders = make_checklist()
+    checklist.update("Docker", None)
+    loop.run()
+    assert checklist.spinner_handle is not None
+
+    loop.run()  # one spinner tick redraws the pending row
+    assert renders[-1][0] == "Docker" and renders[-1][1].endswith("Docker…")
+
+    checklist.update("Docker", True)
+    loop.run()
+    loop.run()
+    assert checklist.spinner_handle is None
+    assert loop.later == []
+
+
+def test_remove_row():
+    checklist, loop, renders = make_checklist()
+    checklist.update("Import mail", True)
+    checklist.remove("Import mail")
+    loop.run()
+    assert renders == []
+    assert checklist.rows == {}
+
+
+def test_skipped_row_replaces_stale_result():
+    checklist, loop, renders = make_checklist()
+    checklist.update("SMTP ready", True)
+    loop.run()
+    checklist.skip("SMTP ready")
+    loop.run()
+    assert renders[-1] == ("SMTP ready", "– SMTP ready: not checked", "gray")
+    assert checklist.spinner_handle is None
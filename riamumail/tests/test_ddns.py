@@ -0,0 +1,140 @@
+import json
+
+from riamumail.ddns import DynamicDNSUpdater
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def make_updater(tmp_path, results, clock):
+    pushes = []
+
+    def push(domain, ip):
+        pushes.append((domain, ip))
+        return results.pop(0) if results else True
+
+    updater = DynamicDNSUpdater(
+        push,
+        tmp_path / "ddns.json",
+        min_interval=60,
+        retry_base=5,
+        clock=clock,
+        rng=lambda: 0.5,
+    )
+    return updater, pushes
+
+
+def test_pushes_only_on_change(tmp_path):
+    """Unchanged addresses never reach the API, even across restarts."""
+    clock = Clock()
+    updater, pushes = make_updater(tmp_path, [], clock)
+    updater.mark_pushed("me.riamumail.com", "8.8.8.8")
+
+    updater.observe("8.8.8.8")
+    updater.step()
+    assert pushes == []
+
+    clock.now = 100
+    updater.observe("9.9.9.9")
+    updater.step()
+    updater.step()
+    assert pushes == [("me.riamumail.com", "9.9.9.9")]
+    assert json.loads((tmp_path / "ddns.json").read_text())["ip"] == "9.9.9.9"
+
+    restarted, pushes = make_updater(tmp_path, [], clock)
+    restarted.observe("9.9.9.9")
+    restarted.step()
+    assert pushes == []
+
+
+def test_rate_limit_and_retry_backoff(tmp_path):
+    """Failures back off exponentially and pushes stay min_interval apart."""
+    clock = Clock()
+    updater, pushes = make_updater(tmp_path, [False, False], clock)
+    updater.mark_pushed("me.riamumail.com", "8.8.8.8")
+
+    clock.now = 10
+    updater.observe("9.9.9.9")
+    assert updater.step() == 50  # rate limited until 60
+
+    clock.now = 60
+    assert updater.step() == 5  # first failure
+    clock.now = 65
+    assert updater.step() == 10  # second failure
+    clock.now = 75
+    assert updater.step() is None  # success
+    assert pushes == [("me.riamumail.com", "9.9.9.9")] * 3
+    assert list(updater.stale_history) == [65]
+
+    updater.observe("1.1.1.1")
+    assert updater.step() == 60
+
+
+def test_adopted_domain_is_pushed_and_staleness_recorded(tmp_path):
+    """A domain reserved before ddns.json existed follows the IP too."""
+    clock = Clock()
+    updater, pushes = make_updater(tmp_path, [], clock)
+    updater.observe("9.9.9.9")
+    updater.adopt("me.riamumail.com")
+
+    clock.now = 30
+    updater.step()
+    assert pushes == [("me.riamumail.com", "9.9.9.9")]
+    assert list(updater.stale_history) == [30]
+    assert json.loads((tmp_path / "ddns.json").read_text()) == {
+        "domain": "me.riamumail.com",
+        "ip": "9.9.9.9",
+    }
+
+    updater.adopt("other.riamumail.com")
+    assert updater.domain == "me.riamumail.com"
+
+
+def test_queued_update_is_left_to_the_outbox(tmp_path):
+    """A push queued in the outbox is not retried until it is dropped."""
+    clock = Clock()
+    updater, pushes = make_updater(tmp_path, [None, None], clock)
+    updater.mark_pushed("me.riamumail.com", "8.8.8.8")
+
+    clock.now = 60
+    updater.observe("9.9.9.9")
+    assert updater.step() is None
+    clock.now = 600
+    updater.step()
+    assert pushes == [("me.riamumail.com", "9.9.9.9")]
+
+    updater.delivered("me.riamumail.com", "9.9.9.9")
+    assert json.loads((tmp_path / "ddns.json").read_text())["ip"] == "9.9.9.9"
+    assert not updater.is_stale()
+
+    updater.observe("1.1.1.1")
+    updater.step()
+    updater.dropped("me.riamumail.com", "1.1.1.1")
+    assert updater.step() == 5  # backs off like a failed push
+    clock.now = 605
+    updater.step()
+    assert pushes[-2:] == [("me.riamumail.com", "1.1.1.1")] * 2
+    assert updater.pushed_ip == "1.1.1.1"
+
+
+def test_cleared_domain_is_not_pushed_until_restored(tmp_path):
+    clock = Clock()
+    updater, pushes = make_updater(tmp_path, [], clock)
+    updater.mark_pushed("old.riamumail.com", "8.8.8.8")
+
+    previous = updater.clear("old.riamumail.com")
+    assert updater.clear("other.riamumail.com") is None
+    clock.now = 100
+    updater.observe("9.9.9.9")
+    updater.step()
+    assert pushes == []
+
+    updater.restore(previous)
+    clock.now = 200
+    updater.step()
+    assert pushes == [("old.riamumail.com", "9.9.9.9")]
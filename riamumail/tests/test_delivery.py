@@ -0,0 +1,27 @@
+from riamumail import delivery, tuning
+
+LAPTOP = {"cores": 2, "memory_mb": 4096, "disk": "ssd"}
+SERVER = {"cores": 32, "memory_mb": 128 * 1024, "disk": "hdd"}
+
+
+def test_lmtp_concurrency_follows_tuning_profile():
+    """LMTP processes and Postfix's delivery concurrency come from the profile."""
+    laptop = tuning.build_profile("desktop", LAPTOP)
+    server = tuning.build_profile("high-volume", SERVER)
+    assert 2 <= laptop["lmtp_processes"] < server["lmtp_processes"]
+    # Spinning disk: half the preset's processes
+    assert server["lmtp_processes"] == tuning.PRESETS["high-volume"]["lmtp_max"] // 2
+
+    settings = delivery.postfix_settings(server)
+    assert settings["mailbox_transport"] == "lmtp:unix:private/dovecot-lmtp"
+    assert settings["lmtp_destination_concurrency_limit"] == server["lmtp_processes"]
+    assert delivery.postconf_command(server).startswith(
+        "postconf -e 'mailbox_transport=lmtp:unix:private/dovecot-lmtp'"
+    )
+
+
+def test_dovecot_listens_in_postfix_queue_directory():
+    conf = delivery.dovecot_config(tuning.build_profile("desktop", LAPTOP))
+    assert "protocols = $protocols lmtp" in conf
+    assert "unix_listener /var/spool/postfix/private/dovecot-lmtp {" in conf
+    assert "auth_username_format = %Ln" in conf
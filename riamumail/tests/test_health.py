@@ -0,0 +1,63 @@
+import socket
+import asyncio
+import threading
+
+from riamumail.health import AdaptiveSchedule, HealthMonitor, port_ready
+
+
+def test_schedule_backs_off_and_resets():
+    """Stable results back off exponentially, changes reset the interval."""
+    schedule = AdaptiveSchedule(
+        min_interval=10, max_interval=80, failing_max_interval=20, jitter=0
+    )
+    assert [schedule.update(False, False) for _ in range(4)] == [20, 40, 80, 80]
+    assert schedule.update(True, False) == 10
+    assert [schedule.update(False, True) for _ in range(3)] == [20, 20, 20]
+    assert schedule.next_delay() == 20
+
+
+def test_monitor_reports_changes():
+    """Results are delivered on the loop with the set of changed probes."""
+    loop = asyncio.new_event_loop()
+    values = iter([{"a": True, "b": None}, {"a": True, "b": False}])
+    seen = []
+
+    def on_result(results, changed):
+        seen.append((results, changed))
+        if len(seen) == 2:
+            loop.stop()
+
+    monitor = HealthMonitor(
+        loop,
+        lambda: (),
+        lambda: next(values),
+        on_result,
+        schedule=AdaptiveSchedule(min_interval=0.01, jitter=0),
+    )
+    monitor.start(delay=0)
+    loop.call_later(5, loop.stop)
+    loop.run_forever()
+    monitor.stop()
+    loop.close()
+
+    assert seen == [
+        ({"a": True, "b": None}, {"a"}),
+        ({"a": True, "b": False}, {"b"}),
+    ]
+
+
+def test_port_ready_checks_greeting():
+    """A listener only counts as ready once it sends the expected banner."""
+    server = socket.create_server(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+
+    def serve():
+        for _ in range(2):
+            conn, _ = server.accept()
+            conn.sendall(b"220 ready\r\n")
+            conn.close()
+
+    threading.Thread(target=serve, daemon=True).start()
+    assert port_ready(port, b"220")
+    assert not port_ready(port, b"* OK")
+    server.close()
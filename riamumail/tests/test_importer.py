@@ -0,0 +1,87 @@
+from riamumail.importer import (
+    ImportIndex,
+    Importer,
+    import_mail,
+    open_source,
+    percent_read,
+    read_mbox,
+)
+from riamumail.maildir import LocalMaildir
+
+MBOX = (
+    b"From alice@example.com Mon Jan  1 00:00:00 2024\n"
+    b"Message-ID: <one@example.com>\n"
+    b"Status: RO\n"
+    b"Subject: one\n"
+    b"\n"
+    b">From the desk of Alice\n"
+    b"\n"
+    b"From bob@example.com Mon Jan  1 00:00:01 2024\n"
+    b"Message-ID: <two@example.com>\n"
+    b"Subject: two\n"
+    b"\n"
+    b"body two\n"
+)
+
+
+def messages(home):
+    return sorted((home / "Maildir").rglob("*:2,*"))
+
+
+def test_read_mbox_splits_and_unquotes(tmp_path):
+    """Messages split on "From " lines; >From lines lose one quote."""
+    path = tmp_path / "inbox.mbox"
+    path.write_bytes(MBOX)
+
+    first, second = list(read_mbox(path))
+
+    assert first[1] == "S"
+    assert first[2].endswith(b"\n\nFrom the desk of Alice\n")
+    assert second[1] == ""
+    assert b"Subject: two" in second[2]
+
+
+def test_import_skips_duplicates_across_runs(tmp_path):
+    """Re-importing the same archive adds nothing; known IDs are skipped."""
+    source = tmp_path / "inbox.mbox"
+    source.write_bytes(MBOX)
+    home = tmp_path / "home"
+    index = tmp_path / "index.sqlite"
+
+    stats = import_mail(source, LocalMaildir(home), index)
+    assert (stats["imported"], stats["duplicates"]) == (2, 0)
+
+    reports = []
+    stats = import_mail(
+        source, LocalMaildir(home), index, progress=lambda *r: reports.append(r)
+    )
+    assert (stats["imported"], stats["duplicates"]) == (0, 2)
+    assert len(messages(home)) == 2
+    # Progress follows what was read, even when nothing is written; the
+    # mbox "From " lines are not part of any message
+    assert reports[-1][0]["read"] == stats["read"] > 0
+    assert percent_read(*reports[-1]) > 50
+
+
+def test_import_maildir_keeps_folders_and_flags(tmp_path):
+    """Maildir++ folders and flags survive; identical bodies import once."""
+    source = tmp_path / "old"
+    for path, body in {
+        "cur/1.host:2,RS": b"Subject: a\n\nsame",
+        "new/2.host": b"Subject: a\n\nsame",
+        ".Sent/cur/3.host:2,S": b"Message-ID: <s@x>\n\nsent",
+    }.items():
+        (source / path).parent.mkdir(parents=True, exist_ok=True)
+        (source / path).write_bytes(body)
+    home = tmp_path / "home"
+
+    index = ImportIndex(tmp_path / "index.sqlite")
+    importer = Importer(LocalMaildir(home), index, workers=2, batch_messages=1)
+
+    stats = importer.run(open_source(source))
+    index.close()
+
+    assert (stats["imported"], stats["duplicates"], stats["failed"]) == (2, 1, 0)
+    names = [str(p.relative_to(home)) for p in messages(home)]
+    assert any(n.startswith("Maildir/.Sent/cur/") and n.endswith(":2,S") for n in names)
+    assert any(n.startswith("Maildir/cur/") and n.endswith(":2,RS") for n in names)
@@ -0,0 +1,114 @@
+import pytest
+
+from riamumail import instances, journal
+from riamumail.tasks import TaskExecutor
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch):
+    monkeypatch.setattr(instances, "CONFIG_PATH", tmp_path)
+    monkeypatch.setattr(instances, "CONFIG_FILE", tmp_path / "config.json")
+    monkeypatch.setattr(instances, "INSTANCES_PATH", tmp_path / "instances")
+    monkeypatch.setattr(instances, "STATE_FILE", tmp_path / "state.json")
+    return tmp_path
+
+
+def test_default_instance_keeps_original_names(home):
+    instance = instances.get()
+    assert instance.config_file == home / "config.json"
+    assert instance.container == "mailexp"
+    assert instance.image == "mailexp:latest"
+    assert (instance.smtp_port, instance.imap_port) == (36245, 10143)
+    assert "-v" not in instance.docker_run_args("a.example.com")
+
+
+def test_create_instance_allocates_ports(home):
+    """New domains get their own names, volume and unused host ports."""
+    instances.get().save_config({"domain": "a.example.com", "username": "me"})
+    busy = {36246}
+
+    b = instances.create_instance(
+        "b.example.com", {"username": "me"}, is_free=lambda p: p not in busy
+    )
+    c = instances.create_instance("C.example.com", is_free=lambda p: True)
+
+    assert b.slug == "b-example-com"
+    assert b.container == "mailexp-b-example-com"
+    assert (b.smtp_port, b.imap_port) == (36247, 10144)
+    assert (c.smtp_port, c.imap_port) == (36246, 10145)
+    assert b.load_config()["username"] == "me"
+    assert "mailexp-b-example-com-data:/home" in b.docker_run_args("b.example.com")
+    assert [i.slug for i in instances.list_instances()] == [
+        "default",
+        "b-example-com",
+        "c-example-com",
+    ]
+
+    with pytest.raises(ValueError):
+        instances.create_instance("b.example.com")
+
+
+def test_docker_tasks_are_limited_per_instance():
+    """Docker work on different instances runs side by side."""
+    executor = TaskExecutor(max_workers=4, limits={"docker": 1})
+    assert executor.limit("docker:a") == 1
+    assert executor.limit("docker:b") == 1
+    assert executor.limit("checks") is None
+    executor.shutdown()
+
+
+def test_selected_instance_is_app_state(home):
+    """Switching never creates the default instance's config."""
+    b = instances.create_instance("b.example.com", is_free=lambda p: True)
+    instances.set_current(b)
+
+    assert instances.current() == b
+    assert not instances.get().exists()
+    assert [i.slug for i in instances.list_instances()] == ["b-example-com"]
+
+
+def test_legacy_selection_moves_to_app_state(home):
+    b = instances.create_instance("b.example.com", is_free=lambda p: True)
+    instances.get().save_config({"current_instance": b.slug})
+
+    assert instances.current() == b
+    assert not instances.get().exists()
+    assert instances.current() == b
+
+
+def test_rebuilt_image_recreates_stopped_container(home, tmp_path):
+    """A stopped container is only restarted while its start inputs match."""
+    instance = instances.create_instance("b.example.com", is_free=lambda p: True)
+    steps = journal.Journal(tmp_path / "journal.json")
+    steps.complete("build", "image-1")
+    steps.complete("start", instances.start_digest(instance, steps.steps))
+
+    started = steps.done("start", instances.start_digest(instance, steps.steps))
+    assert instances.container_action("exited", started) == "start"
+
+    steps.complete("build", "image-2")
+    started = steps.done("start", instances.start_digest(instance, steps.steps))
+    assert instances.container_action("exited", started) == "recreate"
+    assert instances.container_action("created", started) == "remove"
+    assert instances.container_action(None, started) is None
+
+
+def test_new_instance_starts_from_shared_settings(home):
+    """Only user settings carry over; app state and build results don't."""
+    settings = {
+        "username": "me",
+        "password": "secret",
+        "current_instance": "other",
+        "tuning_profile": {"summary": "8 GB"},
+        "relay": {"host": "smtp.example.com"},
+    }
+    instance = instances.create_instance(
+        "b.example.com", settings, is_free=lambda p: True, reserved=False
+    )
+    config = instance.load_config()
+    assert set(config) == {"username", "password", "domain", "ports", "reserve_pending"}
+
+    assert instances.pending_reservations() == [instance]
+    instances.mark_reserved(instance)
+    assert instances.pending_reservations() == []
+    assert "reserve_pending" not in instance.load_config()
@@ -0,0 +1,100 @@
+import pytest
+
+from riamumail.journal import Journal, download, input_hash, tree_hash
+
+
+def test_completed_steps_are_skipped_after_restart(tmp_path):
+    ran = []
+    journal = Journal(tmp_path / "journal.json")
+    journal.step("clone", input_hash("repo"), lambda: ran.append("clone"))
+
+    def build():
+        ran.append("build")
+        raise RuntimeError("docker build failed")
+
+    with pytest.raises(RuntimeError):
+        journal.step("build", input_hash("v1"), build)
+
+    resumed = Journal(tmp_path / "journal.json")
+    assert not resumed.step("clone", input_hash("repo"), lambda: ran.append("clone"))
+    assert resumed.step("build", input_hash("v1"), lambda: ran.append("build"))
+    assert ran == ["clone", "build", "build"]
+
+
+def test_steps_rerun_when_inputs_change_or_output_is_gone(tmp_path):
+    journal = Journal(tmp_path / "journal.json")
+    journal.step("build", input_hash("v1"), lambda: None)
+
+    assert journal.step("build", input_hash("v2"), lambda: None)
+    assert journal.step("build", input_hash("v2"), lambda: None, lambda: False)
+    assert not journal.step("build", input_hash("v2"), lambda: None, lambda: True)
+
+
+def test_tree_hash_follows_contents(tmp_path):
+    (tmp_path / "postfix").mkdir()
+    (tmp_path / "postfix" / "main.cf").write_text("a")
+    before = tree_hash(tmp_path)
+    assert tree_hash(tmp_path) == before
+    (tmp_path / "postfix" / "main.cf").write_text("b")
+    assert tree_hash(tmp_path) != before
+
+
+class Response:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(self.status_code)
+
+    def iter_content(self, chunk_size):
+        yield self.body
+
+
+class Session:
+    def __init__(self, data, fail_after=None):
+        self.data = data
+        self.fail_after = fail_after
+        self.ranges = []
+
+    def get(self, url, stream, timeout, headers):
+        offset = int(headers["Range"][6:-1]) if "Range" in headers else 0
+        self.ranges.append(offset)
+        body = self.data[offset:]
+        response = Response(206 if offset else 200, body)
+        if self.fail_after is not None:
+            fail_after, self.fail_after = self.fail_after, None
+
+            def dropped(chunk_size):
+                yield body[:fail_after]
+                raise ConnectionError("connection reset")
+
+            response.iter_content = dropped
+        return response
+
+
+def test_download_resumes_after_network_drop(tmp_path):
+    data = bytes(range(256)) * 100
+    url = "https://example.com/Docker.dmg?x=1"
+    session = Session(data, fail_after=1000)
+    journal = Journal(tmp_path / "journal.json")
+
+    with pytest.raises(ConnectionError):
+        download(url, tmp_path, journal, session=session)
+    path = download(url, tmp_path, journal, session=session)
+
+    assert session.ranges == [0, 1000]
+    assert path.endswith("-Docker.dmg")
+    with open(path, "rb") as f:
+        assert f.read() == data
+
+    # A finished download is reused without another request
+    assert download(url, tmp_path, journal, session=session) == path
+    assert session.ranges == [0, 1000]
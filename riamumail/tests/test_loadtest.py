@@ -0,0 +1,119 @@
+from riamumail.loadtest import (
+    LoadTest,
+    format_ingest_report,
+    format_report,
+    parse_mix,
+    parse_sizes,
+    percentile,
+)
+
+from .standin import StandinMailServer
+
+
+def test_parse_sizes_and_percentile():
+    """Size specs accept k/m suffixes; percentiles interpolate."""
+    assert parse_sizes("2k:70,1m:5,100") == [(2048, 70), (1048576, 5), (100, 1)]
+    assert percentile([1, 2, 3, 4], 50) == 2.5
+    assert percentile([], 95) == 0.0
+
+
+def test_load_against_standin_server():
+    """SMTP and IMAP load is measured per concurrency level."""
+    with StandinMailServer() as server:
+        test = LoadTest(
+            "test",
+            "secret",
+            "test@example.com",
+            smtp_port=server.smtp_port,
+            imap_port=server.imap_port,
+            sizes=[(512, 1), (4096, 1)],
+            ops_per_worker=10,
+            seed=1,
+        )
+        results = test.run([1, 3])
+        sent = sum(len(r.latencies["smtp"]) for r in results)
+        assert server.wait_for(sent) == sent
+
+    assert [r.concurrency for r in results] == [1, 3]
+    for r in results:
+        assert r.errors == {"smtp": 0, "imap": 0}
+        assert sum(len(v) for v in r.latencies.values()) == 10 * r.concurrency
+        assert r.summary()["latency_ms"]["smtp"]["p95"] >= 0
+
+    report = format_report(results)
+    assert report.splitlines()[0].split()[0] == "conc"
+    assert len(report.splitlines()) == 3
+
+
+def test_errors_are_counted():
+    """Rejected IMAP logins show up as errors, not crashes."""
+    with StandinMailServer() as server:
+        test = LoadTest(
+            "test",
+            "wrong",
+            "test@example.com",
+            smtp_port=server.smtp_port,
+            imap_port=server.imap_port,
+            mix={"imap": 1},
+            ops_per_worker=3,
+        )
+        (result,) = test.run([2])
+
+    assert result.errors["imap"] == 6
+
+
+def test_folder_listing_is_timed():
+    with StandinMailServer() as server:
+        test = LoadTest(
+            "test",
+            "secret",
+            "test@example.com",
+            smtp_port=server.smtp_port,
+            imap_port=server.imap_port,
+            mix=parse_mix("list:1"),
+            ops_per_worker=3,
+        )
+        (result,) = test.run([2])
+
+    assert result.errors.get("list", 0) == 0
+    assert len(result.latencies["list"]) == 6
+    assert "list p50/p95/p99 ms" in format_report([result])
+
+
+def test_ingest_waits_for_delivery():
+    """Ingest is timed until every accepted message shows up over IMAP."""
+    with StandinMailServer(delivery_delay=0.2) as server:
+        test = LoadTest(
+            "test",
+            "secret",
+            "test@example.com",
+            smtp_port=server.smtp_port,
+            imap_port=server.imap_port,
+        )
+        result = test.ingest(messages=10, concurrency=3, size=512, wait=5)
+
+    summary = result.summary()
+    assert (summary["accepted"], summary["delivered"], summary["errors"]) == (10, 10, 0)
+    assert summary["deliver_seconds"] >= 0.2
+    assert summary["open_ms"] is not None
+    assert "10 messages over 3 sessions" in format_ingest_report(result)
+
+
+def test_cleanup_removes_only_test_messages():
+    with StandinMailServer() as server:
+        server.mailbox.deliver(b"From: a@example.com\r\nSubject: keep\r\n\r\nhi\r\n")
+        test = LoadTest(
+            "test",
+            "secret",
+            "test@example.com",
+            smtp_port=server.smtp_port,
+            imap_port=server.imap_port,
+            mix={"smtp": 1},
+            ops_per_worker=3,
+        )
+        test.run([2])
+        assert server.wait_for(7) == 7
+
+        assert test.cleanup() == 6
+        assert len(server.mailbox) == 1
+        assert b"Subject: keep" in server.mailbox.messages[0][0]
@@ -0,0 +1,67 @@
+import gzip
+import queue
+import logging
+
+from riamumail import logs
+
+
+def test_rotation_compresses_and_prunes(tmp_path):
+    """Rotated segments are gzipped and only backup_count are kept."""
+    writer = logs.RotatingLogWriter(
+        tmp_path / "app.log", max_bytes=100, interval=0, backup_count=2
+    )
+    for i in range(5):
+        writer.write(f"line {i} " + "x" * 100 + "\n")
+    writer.close()
+
+    segments = writer.segments()
+    assert len(segments) == 2
+    with gzip.open(segments[-1], "rt") as f:
+        assert f.read().startswith("line 3")
+    assert (tmp_path / "app.log").read_text().startswith("line 4")
+
+
+def test_age_survives_restart(tmp_path, monkeypatch):
+    """A restart does not reset the age of a file written to since."""
+    now = [1000.0]
+    monkeypatch.setattr(logs.time, "time", lambda: now[0])
+    path = tmp_path / "app.log"
+
+    writer = logs.RotatingLogWriter(path, interval=100)
+    writer.write("started\n")
+    now[0] = 1090
+    writer.write("still going\n")
+    writer.close()
+
+    restarted = logs.RotatingLogWriter(path, interval=100)
+    assert restarted.opened_at == 1000
+    now[0] = 1100
+    restarted.write("after restart\n")
+    restarted.close()
+    assert len(restarted.segments()) == 1
+    assert path.read_text() == "after restart\n"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """Producers never block when the writer falls behind."""
+    handler = logs.DroppingQueueHandler(queue.Queue(maxsize=1))
+    record = logging.makeLogRecord({"msg": "hello"})
+    handler.emit(record)
+    handler.emit(record)
+    assert handler.dropped == 1
+
+
+def test_subsystem_levels(tmp_path, monkeypatch):
+    """Per-subsystem levels come from config and the environment."""
+    monkeypatch.setenv("RIAMUMAIL_LOG_LEVELS", "health=DEBUG,bogus=NOPE")
+    logs.configure(tmp_path / "app.log", levels={"subprocess": "WARNING"})
+    try:
+        logging.getLogger("riamumail.subprocess").info("noisy build output")
+        logging.getLogger("riamumail.subprocess").warning("build warning")
+        assert logging.getLogger("riamumail.health").level == logging.DEBUG
+    finally:
+        logs.shutdown()
+
+    text = (tmp_path / "app.log").read_text()
+    assert "noisy build output" not in text
+    assert "riamumail.subprocess: build warning" in text
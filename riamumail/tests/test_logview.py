@@ -0,0 +1,103 @@
+import os
+
+from riamumail.logview import LogFollower, LogView, read_backwards
+
+
+def record(n, level="INFO", name="riamumail.health", message=None):
+    message = message or f"message {n}"
+    return f"2024-05-01 12:00:{n % 60:02d},{n % 1000:03d} [{level}] {name}: {message}\n"
+
+
+def test_read_backwards_returns_tail_and_offset(tmp_path):
+    path = tmp_path / "app.log"
+    text = "".join(record(n) for n in range(5000))
+    path.write_text(text)
+
+    lines, offset, end = read_backwards(path, max_lines=10, chunk_size=256)
+
+    assert lines == text.splitlines()[-10:]
+    assert text[offset:] == "".join(line + "\n" for line in lines)
+    assert end == len(text)
+
+
+def test_load_holds_back_partial_line(tmp_path):
+    """Offsets are bytes read, so bad UTF-8 and a half-written line are safe."""
+    path = tmp_path / "app.log"
+    path.write_bytes(
+        record(1).encode()
+        + b"2024-05-01 12:00:02,002 [INFO] riamumail.health: caf\xe9\n"
+        + b"2024-05-01 12:00:03,003 [INFO] riamu"
+    )
+    view = LogView(path)
+    assert view.load() == 2
+
+    with open(path, "a") as f:
+        f.write("mail.health: message 3\n")
+    assert view.refresh() == 1
+    assert view.entries[-1].text == record(3).rstrip("\n")
+
+
+def test_follower_reads_appends_partial_lines_and_rotation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text(record(1))
+    follower = LogFollower(path, offset=path.stat().st_size)
+    assert follower.read() == []
+
+    with open(path, "a") as f:
+        f.write(record(2) + "2024-05-01 12:00:03,003 [INFO] riamu")
+    assert follower.read() == [record(2).rstrip("\n")]
+
+    with open(path, "a") as f:
+        f.write("mail.health: message 3\n")
+    assert follower.read() == [record(3).rstrip("\n")]
+
+    # Rotated: app.log is moved away and a new one started
+    os.rename(path, tmp_path / "app.log.1")
+    path.write_text(record(4))
+    assert follower.read() == [record(4).rstrip("\n")]
+
+
+def test_filter_by_level_and_subsystem(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text(
+        record(1, "INFO", "riamumail.health")
+        + record(2, "ERROR", "riamumail.api", "Request failed")
+        + "Traceback (most recent call last):\n"
+        + "ValueError: boom\n"
+        + record(3, "DEBUG", "riamumail.api")
+        + record(4, "WARNING", "root")
+    )
+    view = LogView(path)
+    view.load()
+
+    assert view.subsystems() == ["api", "app", "health"]
+    errors = list(view.filtered("WARNING"))
+    assert [e.subsystem for e in errors] == ["api", "app"]
+    assert errors[0].text.endswith("ValueError: boom")
+    assert [e.level for e in view.filtered(None, {"api"})] == ["ERROR", "DEBUG"]
+
+
+def test_failed_command_output_beyond_loaded_records(tmp_path):
+    path = tmp_path / "app.log"
+    lines = [record(0, message="Running command [cmd-7-1]: docker build .")]
+    lines += [
+        record(n, "INFO", "riamumail.subprocess", f"[cmd-7-1] step {n}")
+        for n in range(1, 50)
+    ]
+    lines += [record(50, "ERROR", "root", "Command [cmd-7-1] failed with code 1")]
+    lines += [record(n) for n in range(51, 60)]
+    path.write_text("".join(lines))
+
+    view = LogView(path, max_lines=20)
+    view.load()
+    assert view.last_failed_command() == "cmd-7-1"
+
+    output = view.command_output("cmd-7-1")
+    assert output[0].text.endswith("docker build .")
+    assert len(output) == 51
+    assert len(view.entries) == 20
+
+    with open(path, "a") as f:
+        f.write(record(60, "ERROR", "root", "Command [cmd-7-2] failed with code 2"))
+    assert view.refresh() == 1
+    assert view.last_failed_command() == "cmd-7-2"
@@ -0,0 +1,98 @@
+from riamumail.maillog import (
+    DeliveryMetrics,
+    MailLogFollower,
+    normalize_stamp,
+    parse_line,
+)
+
+LINES = [
+    "2024-05-01T10:00:00.1Z postfix/qmgr[51]: 4F2A1: from=<a@x.com>, size=812, "
+    "nrcpt=1 (queue active)",
+    "2024-05-01T10:00:00.25Z postfix/local[60]: 4F2A1: to=<me@riamuapp.com>, "
+    "relay=local, delay=0.4, delays=0.1/0/0/0.3, dsn=2.0.0, status=sent "
+    "(delivered to maildir)",
+    "2024-05-01T10:00:01.000000001Z postfix/smtp[61]: 5B3C2: to=<b@y.com>, "
+    "relay=none, delay=30, delays=0/0/30/0, dsn=4.4.1, status=deferred "
+    "(connect timed out)",
+    "2024-05-01T10:00:02Z imap-login: Disconnected (auth failed, 1 attempts in "
+    "2 secs): user=<me>, method=PLAIN, rip=10.0.0.2, lip=172.17.0.2",
+    "2024-05-01T10:00:03Z postfix/anvil[70]: statistics: max connection rate",
+]
+
+
+def test_parse_line_events():
+    """Postfix and Dovecot lines become events; noise is ignored."""
+    events = [parse_line(line.split(" ", 1)[1]) for line in LINES]
+    assert [e and e["event"] for e in events] == [
+        "accepted",
+        "sent",
+        "deferred",
+        "login_failed",
+        None,
+    ]
+    assert events[1]["delay"] == 0.4
+    assert events[0]["size"] == 812
+
+
+def test_metrics_window_and_percentiles():
+    """Recent counts expire with the window; totals don't."""
+    now = [1000.0]
+    metrics = DeliveryMetrics(window=120, bucket=60, clock=lambda: now[0])
+    metrics.add([{"event": "sent", "delay": d} for d in (1, 2, 3, 4, 10)])
+    metrics.add([{"event": "bounced"}])
+
+    summary = metrics.summary()
+    assert summary["recent"]["sent"] == 5
+    assert summary["delay_p50"] == 3
+    assert metrics.healthy(summary)
+
+    now[0] += 300
+    summary = metrics.summary()
+    assert summary["recent"]["sent"] == 0
+    assert summary["totals"]["sent"] == 5
+
+
+def test_follower_resumes_after_last_timestamp(tmp_path):
+    """Lines at or before the saved timestamp are not counted again."""
+    state = tmp_path / "maillog.json"
+    follower = MailLogFollower("mailexp", state)
+    assert len(follower.feed(LINES)) == 4
+    follower.save_state()
+
+    follower = MailLogFollower("mailexp", state)
+    assert follower.command()[-3:] == [
+        "--since",
+        normalize_stamp("2024-05-01T10:00:03Z"),
+        "mailexp",
+    ]
+    assert follower.feed(LINES) == []
+    assert follower.feed(["2024-05-01T10:00:04Z " + LINES[1].split(" ", 1)[1]])
+
+
+def test_normalize_stamp_orders_fractions():
+    assert normalize_stamp("2024-05-01T10:00:00.1Z") > normalize_stamp(
+        "2024-05-01T10:00:00.09Z"
+    )
+
+
+def test_container_output(tmp_path):
+    """postlogd and Dovecot lines as `docker logs --timestamps` prints them."""
+    lines = [
+        "2024-05-01T10:00:00.5Z May  1 10:00:00 mail postfix/postfix-script[40]: "
+        "starting the Postfix mail system",
+        "2024-05-01T10:00:01.5Z May  1 10:00:01 mail postfix/qmgr[52]: 7D1E3: "
+        "from=<a@x.com>, size=1204, nrcpt=1 (queue active)",
+        "2024-05-01T10:00:01.7Z May  1 10:00:01 mail postfix/lmtp[63]: 7D1E3: "
+        "to=<me@mail.riamuapp.com>, orig_to=<me@riamuapp.com>, "
+        "relay=mail.riamuapp.com[private/dovecot-lmtp], delay=0.21, "
+        "delays=0.05/0.01/0.02/0.13, dsn=2.0.0, status=sent (250 2.0.0 "
+        "<me@mail.riamuapp.com> kJ3xB2r5MmYkAAAA Saved)",
+        "2024-05-01T10:00:02Z May 01 10:00:02 imap-login: Info: Login: user=<me>, "
+        "method=PLAIN, rip=10.0.0.2, lip=172.17.0.2, mpid=80, session=<a1b2>",
+        "2024-05-01T10:00:03Z May 01 10:00:03 imap-login: Info: Disconnected "
+        "(auth failed, 1 attempts in 2 secs): user=<me>, method=PLAIN, "
+        "rip=10.0.0.2, lip=172.17.0.2, session=<c3d4>",
+    ]
+    events = MailLogFollower("mailexp", tmp_path / "maillog.json").feed(lines)
+    assert [e["event"] for e in events] == ["accepted", "sent", "login", "login_failed"]
+    assert events[1]["delay"] == 0.21
@@ -0,0 +1,62 @@
+import urllib.request
+
+import pytest
+
+from riamumail.metrics import MetricsServer, Registry
+
+
+def test_render_uses_prometheus_text_format():
+    registry = Registry()
+    up = registry.gauge("up", "Running", ["instance"])
+    changes = registry.counter("changes_total", "Changes")
+    duration = registry.histogram("step_seconds", "Steps", ["step"], buckets=[1, 10])
+
+    up.set(1, instance='a"b')
+    changes.inc()
+    changes.inc(2)
+    duration.observe(0.5, step="build")
+    duration.observe(5, step="build")
+
+    text = registry.render()
+    assert '# TYPE up gauge\nup{instance="a\\"b"} 1\n' in text
+    assert "changes_total 3\n" in text
+    assert 'step_seconds_bucket{step="build",le="1"} 1\n' in text
+    assert 'step_seconds_bucket{step="build",le="10"} 2\n' in text
+    assert 'step_seconds_bucket{step="build",le="+Inf"} 2\n' in text
+    assert 'step_seconds_sum{step="build"} 5.5\n' in text
+    assert 'step_seconds_count{step="build"} 2\n' in text
+
+
+def test_labels_must_match():
+    gauge = Registry().gauge("up", "Running", ["instance"])
+    with pytest.raises(ValueError):
+        gauge.set(1)
+
+
+def test_timer_records_failures_too():
+    duration = Registry().histogram("step_seconds", "Steps", ["step"])
+    with pytest.raises(RuntimeError):
+        with duration.time(step="build"):
+            raise RuntimeError("docker build failed")
+    assert duration.count(step="build") == 1
+
+
+def test_server_serves_metrics():
+    registry = Registry()
+    registry.counter("changes_total", "Changes").inc()
+    server = MetricsServer(0, registry)
+    server.start()
+    try:
+        url = f"http://127.0.0.1:{server.port}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain")
+            assert "changes_total 1" in r.read().decode()
+    finally:
+        server.stop()
+
+
+def test_collectors_run_before_render():
+    registry = Registry()
+    queued = registry.gauge("queued", "Queued")
+    registry.collector(lambda: queued.set(3))
+    assert "queued 3\n" in registry.render()
@@ -0,0 +1,57 @@
+from riamumail import outbound
+
+PROFILE = {"destination_concurrency": 20}
+
+
+def test_direct_delivery_caches_connections():
+    settings = outbound.postfix_settings(outbound.relay_settings({}), PROFILE)
+    assert "relayhost" not in settings
+    assert settings["smtp_connection_cache_on_demand"] == "yes"
+    assert settings["smtp_destination_concurrency_limit"] == 20
+    assert outbound.sasl_passwd(None) is None
+
+
+def test_authenticated_relay():
+    relay = outbound.relay_settings(
+        {
+            "relay": {
+                "host": "smtp.example.com",
+                "username": "me",
+                "password": "secret",
+                "per_minute": 30,
+            }
+        }
+    )
+    settings = outbound.postfix_settings(relay, PROFILE)
+
+    assert settings["relayhost"] == "[smtp.example.com]:587"
+    assert settings["smtp_connection_cache_destinations"] == "[smtp.example.com]:587"
+    assert settings["smtp_destination_concurrency_limit"] == 5
+    assert settings["smtp_destination_rate_delay"] == "2s"
+    assert settings["smtp_sasl_auth_enable"] == "yes"
+    assert settings["smtp_tls_security_level"] == "encrypt"
+    assert outbound.sasl_passwd(relay) == "[smtp.example.com]:587 me:secret\n"
+    assert outbound.postconf_command(relay, PROFILE).startswith(
+        "postconf -e 'smtp_connection_cache_on_demand=yes'"
+    )
+
+
+def test_relay_without_credentials_skips_sasl():
+    relay = outbound.relay_settings({"relay": {"host": "relay.lan", "port": 25}})
+    settings = outbound.postfix_settings(relay, PROFILE)
+    assert settings["relayhost"] == "[relay.lan]:25"
+    assert "smtp_sasl_auth_enable" not in settings
+    assert settings["smtp_destination_rate_delay"] == "0s"
+
+
+def test_rate_delay_never_exceeds_the_limit():
+    assert outbound.rate_delay(40) == "2s"
+    assert outbound.rate_delay(25) == "3s"
+    assert outbound.rate_delay(600) == "1s"
+
+
+def test_unbound_config():
+    assert "forward-zone" not in outbound.unbound_config()
+    config = outbound.unbound_config(["1.1.1.1", "9.9.9.9"])
+    assert "  interface: 127.0.0.1\n" in config
+    assert "  forward-addr: 9.9.9.9\n" in config
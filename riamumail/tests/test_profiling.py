@@ -0,0 +1,58 @@
+import time
+import asyncio
+import threading
+
+from riamumail.profiling import LoopMonitor, Profiler, requested
+
+
+def test_requested_by_flag_or_environment():
+    assert requested(["app", "--profile"], {})
+    assert requested(["app"], {"RIAMUMAIL_PROFILE": "1"})
+    assert not requested(["app"], {"RIAMUMAIL_PROFILE": "0"})
+    assert not requested(["app"], {})
+
+
+def busy_install_step(stop):
+    while not stop.is_set():
+        sum(i * i for i in range(1000))
+
+
+def blocking_update_ui():
+    time.sleep(0.06)
+
+
+def test_profiler_writes_per_thread_profiles_and_summary(tmp_path):
+    profiler = Profiler(tmp_path, interval=0.002, slow=0.05)
+    profiler.start()
+    try:
+        stop = threading.Event()
+        worker = threading.Thread(
+            target=busy_install_step, args=(stop,), name="riamumail-install"
+        )
+        worker.start()
+
+        async def main():
+            asyncio.get_running_loop().call_soon(blocking_update_ui)
+            await asyncio.sleep(0.1)
+
+        asyncio.run(main())
+        stop.set()
+        worker.join()
+    finally:
+        out = profiler.stop()
+
+    folded = (out / "riamumail-install.folded").read_text()
+    assert "busy_install_step (test_profiling.py" in folded
+    summary = (out / "summary.txt").read_text()
+    assert "riamumail-install" in summary
+    assert "Slowest callbacks" in summary
+    assert "blocking_update_ui" in summary
+
+
+def test_loop_monitor_restores_asyncio():
+    original = asyncio.events.Handle._run
+    monitor = LoopMonitor()
+    monitor.install()
+    assert asyncio.events.Handle._run is not original
+    monitor.uninstall()
+    assert asyncio.events.Handle._run is original
@@ -0,0 +1,133 @@
+import socket
+import struct
+import asyncio
+
+from riamumail.propagation import (
+    PropagationTracker,
+    build_query,
+    format_duration,
+    parse_response,
+)
+
+
+def answer(query, ip):
+    """A reply to `query` with one compressed A record (or none)."""
+    qid = struct.unpack("!H", query[:2])[0]
+    header = struct.pack("!HHHHHH", qid, 0x8180, 1, 1 if ip else 0, 0, 0)
+    reply = header + query[12:]
+    if ip:
+        reply += struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4)
+        reply += socket.inet_aton(ip)
+    return reply
+
+
+class Resolver(asyncio.DatagramProtocol):
+    """Answers with `ip` once it has seen `stale` queries."""
+
+    def __init__(self, ip, stale=0):
+        self.ip = ip
+        self.stale = stale
+        self.queries = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.queries += 1
+        ip = self.ip if self.queries > self.stale else "10.0.0.1"
+        self.transport.sendto(answer(data, ip), addr)
+
+
+def test_parse_response_reads_a_records():
+    query = build_query("mail.example.com", 1234)
+    assert parse_response(answer(query, "1.2.3.4"), 1234) == ["1.2.3.4"]
+    assert parse_response(answer(query, None), 1234) == []
+    assert parse_response(answer(query, "1.2.3.4"), 999) is None
+
+
+def test_tracker_stops_once_every_resolver_agrees():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        servers = []
+        for stale in (0, 2):
+            transport, protocol = await loop.create_datagram_endpoint(
+                lambda stale=stale: Resolver("1.2.3.4", stale),
+                local_addr=("127.0.0.1", 0),
+            )
+            servers.append((transport, protocol))
+        # Never answers
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        # As read from the JSON config
+        resolvers = [list(t.get_extra_info("sockname")) for t, _ in servers]
+
+        updates = []
+        tracker = PropagationTracker(
+            "mail.example.com",
+            "1.2.3.4",
+            resolvers=resolvers,
+            on_update=lambda t: updates.append(t.fraction()),
+            base=0.01,
+            timeout=0.2,
+        )
+        elapsed = await tracker.start()
+
+        partial = PropagationTracker(
+            "mail.example.com",
+            "1.2.3.4",
+            resolvers=resolvers[:1] + [list(silent.getsockname())],
+            timeout=0.1,
+        )
+        await partial.check()
+
+        for transport, _ in servers:
+            transport.close()
+        silent.close()
+        return tracker, updates, elapsed, [p.queries for _, p in servers], partial
+
+    tracker, updates, elapsed, queries, partial = asyncio.run(scenario())
+
+    assert updates == [0.5, 0.5, 1.0]
+    assert tracker.complete() and tracker.rounds == 3
+    # The resolver that had the new IP was not asked again (the second
+    # query is from `partial`)
+    assert queries == [2, 3]
+    assert elapsed == tracker.time_to_propagate() > 0
+    assert "2/2 resolvers, propagated in" in tracker.describe()
+
+    assert partial.fraction() == 0.5
+    assert partial.describe().startswith("1/2 resolvers (50%)")
+
+
+def test_tracker_gives_up_as_incomplete():
+    """Unreachable or silent resolvers end the tracking after `limit`."""
+
+    async def scenario():
+        silent = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        silent.bind(("127.0.0.1", 0))
+        updates = []
+        tracker = PropagationTracker(
+            "mail.example.com",
+            "1.2.3.4",
+            # An address no socket can be connected to
+            resolvers=[list(silent.getsockname()), ["256.0.0.1", 53]],
+            on_update=lambda t: updates.append(t.incomplete),
+            base=0.01,
+            timeout=0.02,
+            limit=0.1,
+        )
+        result = await tracker.start()
+        silent.close()
+        return tracker, updates, result
+
+    tracker, updates, result = asyncio.run(scenario())
+    assert result is None
+    assert tracker.incomplete and updates[-1] is True
+    assert tracker.answers == {r: None for r in tracker.resolvers}
+    assert tracker.describe().startswith("0/2 resolvers, incomplete after")
+
+
+def test_format_duration():
+    assert format_duration(42) == "42s"
+    assert format_duration(252) == "4m12s"
+    assert format_duration(3 * 3600 + 300) == "3h05m"
@@ -0,0 +1,61 @@
+import time
+
+from riamumail.publicip import PublicIPResolver, parse_ip
+
+
+def slow(delay, answer):
+    def provider():
+        time.sleep(delay)
+        return answer
+
+    return provider
+
+
+def failing():
+    raise OSError("connection refused")
+
+
+def test_parse_ip_validates():
+    """Only global IPv4 addresses are accepted."""
+    assert parse_ip(" 8.8.8.8\n") == "8.8.8.8"
+    # Published as an A record, so an IPv6 answer is no use
+    assert parse_ip("2001:4860:4860::8888") is None
+    assert parse_ip("192.168.1.10") is None
+    assert parse_ip("<html>rate limited</html>") is None
+
+
+def test_hedged_request_takes_fastest_answer():
+    """A slow first provider is hedged by the second one."""
+    resolver = PublicIPResolver(
+        [slow(2, "1.1.1.1"), slow(0, "8.8.4.4")], hedge_delay=0.05
+    )
+    started = time.monotonic()
+    assert resolver.get() == "8.8.4.4"
+    assert time.monotonic() - started < 1
+
+
+def test_failures_and_invalid_answers_fall_through():
+    """Failed or invalid providers are replaced immediately."""
+    resolver = PublicIPResolver(
+        [failing, slow(0, "10.0.0.1"), slow(0, "9.9.9.9")], hedge_delay=5
+    )
+    started = time.monotonic()
+    assert resolver.get() == "9.9.9.9"
+    assert time.monotonic() - started < 1
+
+
+def test_cache_and_change_detection():
+    """Answers are cached for ttl and changes notify listeners."""
+    now = [0]
+    answers = iter(["8.8.8.8", "9.9.9.9"])
+    resolver = PublicIPResolver([lambda: next(answers)], ttl=60, clock=lambda: now[0])
+    changes = []
+    resolver.on_change(lambda old, new: changes.append((old, new)))
+
+    assert resolver.get() == "8.8.8.8"
+    now[0] = 30
+    assert resolver.get() == "8.8.8.8"
+    now[0] = 90
+    assert resolver.get() == "9.9.9.9"
+    assert changes == [(None, "8.8.8.8"), ("8.8.8.8", "9.9.9.9")]
+    assert resolver.changes == 1
@@ -0,0 +1,128 @@
+import os
+import gzip
+
+from riamumail.maildir import DoveadmMailbox, LocalMaildir
+from riamumail.search import SearchIndex, fts_query, parse_message
+
+
+def message(subject, sender, body, to="family@example.com"):
+    return (
+        f"From: {sender}\r\nTo: {to}\r\nSubject: {subject}\r\n"
+        f"Date: Wed, 01 May 2024 12:00:00 +0000\r\n\r\n{body}\r\n"
+    ).encode()
+
+
+class CountingMaildir(LocalMaildir):
+    def __init__(self, home):
+        super().__init__(home)
+        self.read = []
+
+    def read_files(self, paths):
+        self.read.extend(paths)
+        return super().read_files(paths)
+
+
+def write(home, path, data):
+    (home / path).parent.mkdir(parents=True, exist_ok=True)
+    (home / path).write_bytes(data)
+
+
+def test_fts_query_quotes_words_and_maps_fields():
+    assert fts_query("from:alice invoice") == 'sender:"alice" "invoice"'
+    assert fts_query('"school trip" AND x-y') == '"school trip" "AND" "x-y"'
+    assert fts_query("  ") == ""
+
+
+def test_parse_message_prefers_plain_text():
+    data = (
+        b"From: Alice <alice@example.com>\r\nSubject: =?utf-8?q?Caf=C3=A9?=\r\n"
+        b"MIME-Version: 1.0\r\nContent-Type: multipart/alternative; boundary=b\r\n\r\n"
+        b"--b\r\nContent-Type: text/plain\r\n\r\nplain words\r\n"
+        b"--b\r\nContent-Type: text/html\r\n\r\n<p>html words</p>\r\n--b--\r\n"
+    )
+    fields = parse_message(data)
+    assert fields["subject"] == "Café"
+    assert "plain words" in fields["body"] and "html" not in fields["body"]
+
+
+def test_incremental_index_and_search(tmp_path):
+    home = tmp_path / "home"
+    write(
+        home,
+        "Maildir/new/1.host",
+        message("Dentist appointment", "Clinic <clinic@example.com>", "Tuesday 9am"),
+    )
+    write(
+        home,
+        "Maildir/.Sent/cur/2.host:2,S",
+        message("Re: school trip", "family@example.com", "The permission slip"),
+    )
+    index = SearchIndex(tmp_path / "search.sqlite")
+    source = CountingMaildir(home)
+
+    stats = index.update(source)
+    assert stats["indexed"] == 2 and stats["messages"] == 2
+
+    results = index.search("permission slip")
+    assert [r["folder"] for r in results] == ["Sent"]
+    assert "[permission]" in results[0]["snippet"]
+    assert index.search("from:clinic")[0]["subject"] == "Dentist appointment"
+    assert index.search("from:tuesday") == []
+
+    # Read by a client, one new message, the sent one expunged
+    (home / "Maildir/cur").mkdir()
+    (home / "Maildir/new/1.host").rename(home / "Maildir/cur/1.host:2,S")
+    (home / "Maildir/.Sent/cur/2.host:2,S").unlink()
+    write(home, "Maildir/new/3.host", message("Invoice", "shop@example.com", "Paid"))
+    source.read = []
+
+    stats = index.update(source)
+    assert source.read == ["Maildir/new/3.host"]
+    assert (stats["indexed"], stats["moved"], stats["removed"]) == (1, 1, 1)
+    assert index.search("dentist")[0]["path"] == "Maildir/cur/1.host:2,S"
+    assert index.search("permission") == []
+    assert index.search("invoice")[0]["folder"] == "INBOX"
+
+
+def test_compressed_messages_are_indexed(tmp_path):
+    """Files Dovecot stored with zlib_save are decompressed before parsing."""
+    home = tmp_path / "home"
+    write(
+        home,
+        "Maildir/cur/1.host:2,S",
+        gzip.compress(message("Boarding pass", "airline@example.com", "Gate 12")),
+    )
+    index = SearchIndex(tmp_path / "search.sqlite")
+
+    stats = index.update(LocalMaildir(home))
+    assert (stats["indexed"], stats["failed"]) == (1, 0)
+    assert index.search("gate")[0]["subject"] == "Boarding pass"
+
+
+def test_dbox_is_read_through_doveadm(tmp_path):
+    """Only the messages not indexed yet are fetched, without an export."""
+    messages = tmp_path / "messages"
+    write(messages, "g1-1", message("Invoice", "shop@example.com", "Total 12"))
+    write(messages, "g2-4", message("Re: trip", "alice@example.com", "See you"))
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    # Stands in for `docker exec [-i] <container> riamumail-storage list|fetch`
+    docker = bin_dir / "docker"
+    docker.write_text(f"""#!/bin/sh
+eval action=\\${{$#}}
+case "$action" in
+    list) printf 'mailbox-guid\\tuid\\tmailbox\\ng1\\t1\\tINBOX\\ng2\\t4\\tTrips/2024\\n' ;;
+    fetch) cat >> {tmp_path}/fetched; cd {messages}; tar -cf - $(sed 's/ /-/' {tmp_path}/fetched) ;;
+esac
+""")
+    docker.chmod(0o755)
+    env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}")
+    index = SearchIndex(tmp_path / "search.sqlite")
+
+    stats = index.update(DoveadmMailbox("mailexp", "me", env))
+    assert (stats["indexed"], stats["failed"]) == (2, 0)
+    assert index.search("trip")[0]["folder"] == "Trips.2024"
+
+    (tmp_path / "fetched").unlink()
+    assert index.update(DoveadmMailbox("mailexp", "me", env))["indexed"] == 0
+    assert not (tmp_path / "fetched").exists()
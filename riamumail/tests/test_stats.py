@@ -0,0 +1,80 @@
+from riamumail.stats import (
+    Series,
+    StatsCollector,
+    cli_sample,
+    engine_sample,
+    sparkline,
+)
+
+ENGINE = {
+    "cpu_stats": {
+        "cpu_usage": {"total_usage": 2_000_000},
+        "system_cpu_usage": 20_000_000,
+        "online_cpus": 2,
+    },
+    "precpu_stats": {
+        "cpu_usage": {"total_usage": 1_000_000},
+        "system_cpu_usage": 10_000_000,
+    },
+    "memory_stats": {
+        "usage": 300 * 1024**2,
+        "limit": 1024**3,
+        "stats": {"inactive_file": 44 * 1024**2},
+    },
+    "networks": {"eth0": {"rx_bytes": 1000, "tx_bytes": 500}},
+    "blkio_stats": {
+        "io_service_bytes_recursive": [
+            {"op": "read", "value": 4096},
+            {"op": "write", "value": 8192},
+        ]
+    },
+}
+
+
+def test_engine_sample():
+    sample = engine_sample(ENGINE)
+    assert sample["cpu"] == 20.0
+    assert sample["memory"] == 256 * 1024**2
+    assert sample["memory_percent"] == 25.0
+    assert (sample["net_rx"], sample["disk_write"]) == (1000, 8192)
+
+
+def test_cli_sample_matches_engine_units():
+    sample = cli_sample(
+        {
+            "CPUPerc": "12.50%",
+            "MemUsage": "256MiB / 1GiB",
+            "MemPerc": "25.00%",
+            "NetIO": "1kB / 500B",
+            "BlockIO": "4.1kB / 0B",
+        }
+    )
+    assert sample["cpu"] == 12.5
+    assert sample["memory"] == 256 * 1024**2
+    assert (sample["net_rx"], sample["net_tx"]) == (1000, 500)
+
+
+def test_series_downsamples_into_fixed_ring():
+    """Memory use stays bounded however many samples arrive."""
+    series = Series(points=3, resolution=5)
+    for t in range(100):
+        series.add(t, t % 5)
+    assert series.values() == [2.0, 2.0, 2.0]
+    assert sparkline([0, 5, 10], top=10) == "▁▅█"
+
+
+def test_counters_become_rates_and_alerts_need_sustained_load():
+    collector = StatsCollector(
+        "mailexp", resolution=1, thresholds={"cpu": (90.0, 3)}, socket_path="x"
+    )
+    sample = engine_sample(ENGINE)
+    for t in range(5):
+        busy = dict(sample, cpu=95.0 if t >= 2 else 10.0, net_rx=1000 * (t + 1))
+        collector.record(busy, t)
+    assert collector.series["net_rx"].values() == [1000.0, 1000.0, 1000.0]
+    assert collector.alerts() == []
+
+    collector.record(dict(busy, net_rx=6000), 5)
+    collector.record(dict(busy, net_rx=7000), 6)
+    assert collector.alerts() == ["cpu above 90%"]
+    assert "CPU" in collector.summary()
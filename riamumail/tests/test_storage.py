@@ -0,0 +1,129 @@
+import io
+import os
+import grp
+import pwd
+import tarfile
+import subprocess
+
+import pytest
+
+from riamumail import storage
+
+
+def test_settings_fall_back_to_maildir():
+    assert storage.settings({}) == ("maildir", "none")
+    assert storage.settings({"mail_format": "mdbox", "mail_compression": "zstd"}) == (
+        "mdbox",
+        "zstd",
+    )
+    assert storage.settings({"mail_format": "mbox"}) == ("maildir", "none")
+
+
+def test_dovecot_config():
+    config = storage.dovecot_config("mdbox", "zstd")
+    assert "mail_location = mdbox:~/mdbox\n" in config
+    assert "mdbox_rotate_size" in config
+    assert "mail_plugins = $mail_plugins zlib\n" in config
+    assert "zlib_save = zstd\n" in config
+    assert "zlib_save = gz\n" in storage.dovecot_config("sdbox", "zlib")
+    assert "zlib" not in storage.dovecot_config("maildir", "none")
+
+
+@pytest.fixture
+def script(tmp_path):
+    """The storage script for the current user with doveadm stubbed out."""
+    user = pwd.getpwuid(os.getuid()).pw_name
+    if grp.getgrgid(os.getgid()).gr_name != user:
+        pytest.skip("chown user:user needs a group named after the user")
+    home = tmp_path / "home"
+    (home / "Maildir" / "cur").mkdir(parents=True)
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    doveadm = bin_dir / "doveadm"
+    doveadm.write_text(f"""#!/bin/sh
+echo "$@" >> {tmp_path}/doveadm.log
+case "$*" in
+    *"mailbox status"*) [ "$1" = -o ] && echo "messages=$OLD" || echo "messages=$NEW" ;;
+    *"fetch"*"text"*) printf 'text:\\nSubject: hi\\n\\nbody\\n\\f\\n' ;;
+esac
+""")
+    doveadm.chmod(0o755)
+    path = tmp_path / "riamumail-storage"
+    path.write_text(storage.storage_script(user, "mdbox", home=str(home)))
+    path.chmod(0o755)
+
+    def run(action, old="1", new="1", stdin=b""):
+        env = dict(os.environ, PATH=f"{bin_dir}:{os.environ['PATH']}", OLD=old, NEW=new)
+        result = subprocess.run(
+            [str(path), action], env=env, input=stdin, capture_output=True, check=True
+        )
+        run.output = result.stdout
+        log = tmp_path / "doveadm.log"
+        return log.read_text().splitlines() if log.exists() else []
+
+    return home, user, run
+
+
+def test_migrate_converts_maildir(script):
+    home, user, run = script
+    (home / "Maildir" / "cur" / "1.host:2,S").write_text("Subject: hi\n\n")
+
+    # Waits for Dovecot's auth service before syncing, then compares counts
+    assert run("migrate") == [
+        f"user {user}",
+        f"sync -u {user} maildir:{home}/Maildir",
+        f"-o mail_location=maildir:{home}/Maildir mailbox status -u {user} -t messages *",
+        f"mailbox status -u {user} -t messages *",
+    ]
+    assert not (home / "Maildir").exists()
+    assert not (home / "Maildir.migrated").exists()
+    assert (home / "mdbox").is_dir()
+
+    # Nothing left to convert
+    assert len(run("migrate")) == 4
+
+
+def test_migrate_keeps_unverified_copy(script):
+    home, user, run = script
+    (home / "Maildir" / "cur" / "1.host:2,S").write_text("Subject: hi\n\n")
+
+    run("migrate", old="2", new="1")
+    assert (home / "Maildir.migrated" / "cur" / "1.host:2,S").exists()
+
+
+def test_fetch_exports_only_requested_messages(script):
+    home, user, run = script
+    log = run("fetch", stdin=b"abc 7\n")
+    assert log == [f"-f pager fetch -u {user} text mailbox-guid abc uid 7"]
+    with tarfile.open(fileobj=io.BytesIO(run.output)) as tar:
+        names = [m.name for m in tar if m.isfile()]
+        assert names == ["./abc-7"]
+        assert tar.extractfile("./abc-7").read() == b"Subject: hi\n\nbody\n"
+
+
+def test_export_is_kept_and_never_imported_back(script):
+    home, user, run = script
+    assert run("export") == [f"backup -u {user} maildir:{home}/Maildir"]
+    (home / "Maildir" / "cur" / "1.host:2,S").write_text("Subject: hi\n\n")
+
+    # The mirror stays in place for the next (incremental) export
+    assert len(run("migrate")) == 1
+    assert (home / "Maildir" / "cur" / "1.host:2,S").exists()
+    assert not (home / "Maildir.migrated").exists()
+
+    run("prepare")
+    assert not (home / "Maildir").exists()
+
+
+def test_export_converts_unmigrated_mail_first(script):
+    home, user, run = script
+    (home / "Maildir" / "cur" / "1.host:2,S").write_text("Subject: hi\n\n")
+
+    assert run("export") == [
+        f"user {user}",
+        f"sync -u {user} maildir:{home}/Maildir",
+        f"-o mail_location=maildir:{home}/Maildir mailbox status -u {user} -t messages *",
+        f"mailbox status -u {user} -t messages *",
+        f"backup -u {user} maildir:{home}/Maildir",
+    ]
+    assert not (home / "Maildir.migrated").exists()
@@ -0,0 +1,136 @@
+import sys
+import time
+import threading
+import subprocess
+
+import pytest
+
+from riamumail import tasks
+from riamumail.tasks import TaskCancelled, TaskExecutor
+
+
+def test_kind_limit_serializes_tasks():
+    """Only one docker task runs at a time; others wait without a worker."""
+    executor = TaskExecutor(max_workers=4, limits={"docker": 1})
+    release = threading.Event()
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        release.wait(5)
+        with lock:
+            active[0] -= 1
+
+    submitted = [executor.submit(f"docker-{i}", work, kind="docker") for i in range(3)]
+    other = executor.submit("other", lambda: threading.current_thread().name)
+    assert other.future.result(5) == "riamumail-other"
+
+    time.sleep(0.05)
+    counts = executor.counts()
+    assert counts["by_kind"]["docker"] == {"running": 1, "waiting": 2}
+    assert counts["queued"] == 2
+
+    release.set()
+    for task in submitted:
+        task.future.result(5)
+    assert peak[0] == 1
+    assert executor.counts() == {"running": 0, "queued": 0, "by_kind": {}}
+    executor.shutdown()
+
+
+def test_cancel_is_cooperative():
+    executor = TaskExecutor(max_workers=2)
+    started = threading.Event()
+
+    def work():
+        started.set()
+        while True:
+            tasks.check_cancelled()
+            time.sleep(0.01)
+
+    task = executor.submit("loop", work)
+    started.wait(5)
+    executor.cancel("loop")
+    with pytest.raises(TaskCancelled):
+        task.future.result(5)
+    executor.shutdown()
+
+
+def test_cancelled_reports_the_running_task():
+    """Work can skip its follow-up (e.g. refreshing the UI) once cancelled."""
+    executor = TaskExecutor(max_workers=2)
+    started, resume = threading.Event(), threading.Event()
+    seen = []
+
+    def work():
+        seen.append(tasks.cancelled())
+        started.set()
+        resume.wait(5)
+        seen.append(tasks.cancelled())
+
+    task = executor.submit("save", work)
+    started.wait(5)
+    executor.cancel("save")
+    resume.set()
+    task.future.result(5)
+    executor.shutdown()
+    assert seen == [False, True]
+    assert not tasks.cancelled()
+
+
+def test_shutdown_terminates_tracked_subprocesses():
+    """Quitting doesn't leave commands started by tasks running."""
+    executor = TaskExecutor(max_workers=2)
+    running = threading.Event()
+    processes = []
+
+    def work():
+        process = subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(60)"]
+        )
+        tasks.current().track(process)
+        processes.append(process)
+        running.set()
+        process.wait()
+
+    executor.submit("sleeper", work)
+    running.wait(5)
+
+    started = time.monotonic()
+    executor.shutdown(timeout=5)
+    assert time.monotonic() - started < 5
+    assert processes[0].poll() is not None
+
+    with pytest.raises(RuntimeError):
+        executor.submit("late", work)
+
+
+def test_replace_keeps_only_the_latest_waiting_task():
+    """Resubmitted checks coalesce: only the newest waits for the slot."""
+    executor = TaskExecutor(max_workers=4, limits={"checks": 1})
+    release = threading.Event()
+    ran = []
+
+    def work(n):
+        ran.append(n)
+        release.wait(5)
+
+    first = executor.submit("checks", work, 1, kind="checks", replace=True)
+    time.sleep(0.05)
+    second = executor.submit("checks", work, 2, kind="checks", replace=True)
+    third = executor.submit("checks", work, 3, kind="checks", replace=True)
+    assert executor.counts()["by_kind"]["checks"] == {"running": 1, "waiting": 1}
+    assert tasks.format_counts(executor.counts()) == (
+        "Tasks: 1 running, 1 queued (checks 1+1)"
+    )
+
+    release.set()
+    first.future.result(5)
+    third.future.result(5)
+    assert second.future.cancelled()
+    assert ran == [1, 3]
+    assert executor.counts()["queued"] == 0
+    executor.shutdown()
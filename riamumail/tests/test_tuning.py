@@ -0,0 +1,54 @@
+import os
+
+from riamumail import tuning
+
+LAPTOP = {"cores": 2, "memory_mb": 4096, "disk": "ssd"}
+SERVER = {"cores": 32, "memory_mb": 128 * 1024, "disk": "hdd"}
+
+
+def test_auto_preset_follows_hardware():
+    """Small machines get the desktop preset, big ones high-volume."""
+    assert tuning.build_profile(host=LAPTOP)["preset"] == "desktop"
+    assert tuning.build_profile(host=SERVER)["preset"] == "high-volume"
+    assert tuning.build_profile("small-team", LAPTOP)["preset"] == "small-team"
+
+
+def test_limits_scale_with_cores_and_memory():
+    """Process limits grow with cores but never exceed the RAM budget."""
+    laptop = tuning.build_profile("high-volume", LAPTOP)
+    server = tuning.build_profile("high-volume", SERVER)
+    assert laptop["smtpd_processes"] < server["smtpd_processes"]
+    assert laptop["smtpd_processes"] * tuning.SMTPD_MB <= 4096 * tuning.MEMORY_SHARE
+    assert server["active_limit"] == tuning.PRESETS["high-volume"]["active_limit"] // 2
+
+
+def test_rendered_config():
+    """Profiles render to postconf commands and a Dovecot include."""
+    profile = tuning.build_profile("small-team", SERVER)
+    main, master = tuning.postconf_commands(profile)
+    assert main.startswith("postconf -e ")
+    assert f"'smtp/inet/maxproc={profile['smtpd_processes']}'" in master
+    conf = tuning.dovecot_config(profile)
+    assert f"process_limit = {profile['imap_processes']}" in conf
+    assert "service_count = 0" in conf
+    assert tuning.describe(profile) == "small-team · 32 cores · 128 GB RAM · HDD"
+
+
+def test_docker_limits_replace_host_resources(tmp_path):
+    """Docker Desktop's VM, not the whole machine, bounds the limits."""
+    docker = tmp_path / "docker"
+    docker.write_text("#!/bin/sh\necho 2 4294967296\n")
+    docker.chmod(0o755)
+    env = dict(os.environ, PATH=f"{tmp_path}:{os.environ['PATH']}")
+
+    resources = tuning.docker_resources(env)
+    assert resources == {"cores": 2, "memory_mb": 4096}
+    host = tuning.detect_host(resources)
+    assert (host["cores"], host["memory_mb"]) == (2, 4096)
+    profile = tuning.build_profile(host=host)
+    assert profile["preset"] == "desktop"
+    assert "4 GB RAM (Docker)" in tuning.describe(profile)
+
+    docker.write_text("#!/bin/sh\nexit 1\n")
+    assert tuning.docker_resources(env) is None
+    assert "source" not in tuning.detect_host(None)